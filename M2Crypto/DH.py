@@ -7,7 +7,7 @@ Copyright (c) 1999-2003 Ng Pheng Siong. All rights reserved."""
 from M2Crypto import BIO, m2, util
 from M2Crypto.util import genparam_callback
 if util.py27plus:
-    from typing import AnyStr, Callable  # noqa
+    from typing import AnyStr, Callable, Optional  # noqa
 
 
 class DHError(Exception):
@@ -43,10 +43,17 @@ class DH:
 
     def __getattr__(self, name):
         # type: (str) -> bytes
-        if name in ('p', 'g', 'pub', 'priv'):
-            method = getattr(m2, 'dh_get_%s' % (name,))
+        if name in ('p', 'g', 'pub'):
+            # Public values are cached until gen_key().
+            cache = self.__dict__.setdefault('_mpi_cache', {})
+            if name not in cache:
+                method = getattr(m2, 'dh_get_%s' % (name,))
+                assert m2.dh_type_check(self.dh), "'dh' type error"
+                cache[name] = method(self.dh)
+            return cache[name]
+        elif name == 'priv':
             assert m2.dh_type_check(self.dh), "'dh' type error"
-            return method(self.dh)
+            return m2.dh_get_priv(self.dh)
         else:
             raise AttributeError
 
@@ -70,8 +77,31 @@ class DH:
     def gen_key(self):
         # type: () -> None
         assert m2.dh_type_check(self.dh), "'dh' type error"
+        self.__dict__.pop('_mpi_cache', None)
         m2.dh_generate_key(self.dh)
 
+    def get_int(self, name):
+        # type: (str) -> int
+        """
+        Return a DH parameter or key value as a Python int.
+
+        :param name: one of 'p', 'g', 'pub', 'priv'.
+        """
+        if name not in ('p', 'g', 'pub', 'priv'):
+            raise ValueError('unknown DH value %r' % (name,))
+        return util.mpi_to_int(getattr(self, name))
+
+    def get_bytes(self, name):
+        # type: (str) -> bytes
+        """
+        Return a DH parameter or key value as unsigned big-endian bytes.
+
+        :param name: one of 'p', 'g', 'pub', 'priv'.
+        """
+        if name not in ('p', 'g', 'pub', 'priv'):
+            raise ValueError('unknown DH value %r' % (name,))
+        return util.mpi_to_bytes(getattr(self, name))
+
     def compute_key(self, pubkey):
         # type: (bytes) -> bytes
         assert m2.dh_type_check(self.dh), "'dh' type error"
@@ -82,6 +112,16 @@ class DH:
         assert m2.dh_type_check(self.dh), "'dh' type error"
         return m2.dhparams_print(bio._ptr(), self.dh)
 
+    def save_params(self, file):
+        # type: (AnyStr) -> int
+        with BIO.openfile(file, 'wb') as bio:
+            return self.save_params_bio(bio)
+
+    def save_params_bio(self, bio):
+        # type: (BIO.BIO) -> int
+        assert m2.dh_type_check(self.dh), "'dh' type error"
+        return m2.dh_write_parameters(self.dh, bio._ptr())
+
 
 def gen_params(plen, g, callback=genparam_callback):
     # type: (int, int, Optional[Callable]) -> DH
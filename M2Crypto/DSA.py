@@ -11,7 +11,7 @@ from __future__ import absolute_import, print_function
 
 from M2Crypto import BIO, m2, util
 if util.py27plus:
-    from typing import AnyStr, Callable, Tuple  # noqa
+    from typing import AnyStr, Callable, Optional, Tuple  # noqa
 
 
 class DSAError(Exception):
@@ -81,10 +81,17 @@ class DSA:
                      one of 'p', 'q', 'g', 'pub', 'priv'.
         :return:     value of specified variable (a "byte string")
         """
-        if name in ['p', 'q', 'g', 'pub', 'priv']:
-            method = getattr(m2, 'dsa_get_%s' % (name,))
+        if name in ['p', 'q', 'g', 'pub']:
+            # Public values are cached until set_params() or gen_key().
+            cache = self.__dict__.setdefault('_mpi_cache', {})
+            if name not in cache:
+                method = getattr(m2, 'dsa_get_%s' % (name,))
+                assert m2.dsa_type_check(self.dsa), "'dsa' type error"
+                cache[name] = method(self.dsa)
+            return cache[name]
+        elif name == 'priv':
             assert m2.dsa_type_check(self.dsa), "'dsa' type error"
-            return method(self.dsa)
+            return m2.dsa_get_priv(self.dsa)
         else:
             raise AttributeError
 
@@ -115,16 +122,51 @@ class DSA:
                   unsafe to use this method. It is better to use
                   gen_params function to create a new DSA object.
         """
+        self.__dict__.pop('_mpi_cache', None)
         m2.dsa_set_pqg(self.dsa, p, q, g)
 
+    def check_params(self):
+        # type: () -> int
+        """
+        Check the domain parameters p, q and g.
+
+        :return: 1 if they are valid, 0 if not, -1 if OpenSSL (before
+                 3.0) cannot check DSA parameters.
+        """
+        assert m2.dsa_type_check(self.dsa), "'dsa' type error"
+        return m2.dsa_check_params(self.dsa)
+
     def gen_key(self):
         # type: () -> None
         """
         Generate a key pair.
         """
         assert m2.dsa_type_check(self.dsa), "'dsa' type error"
+        self.__dict__.pop('_mpi_cache', None)
         m2.dsa_gen_key(self.dsa)
 
+    def get_int(self, name):
+        # type: (str) -> int
+        """
+        Return a DSA parameter or key value as a Python int.
+
+        :param name: one of 'p', 'q', 'g', 'pub', 'priv'.
+        """
+        if name not in ('p', 'q', 'g', 'pub', 'priv'):
+            raise ValueError('unknown DSA value %r' % (name,))
+        return util.mpi_to_int(getattr(self, name))
+
+    def get_bytes(self, name):
+        # type: (str) -> bytes
+        """
+        Return a DSA parameter or key value as unsigned big-endian bytes.
+
+        :param name: one of 'p', 'q', 'g', 'pub', 'priv'.
+        """
+        if name not in ('p', 'q', 'g', 'pub', 'priv'):
+            raise ValueError('unknown DSA value %r' % (name,))
+        return util.mpi_to_bytes(getattr(self, name))
+
     def save_params(self, filename):
         # type: (AnyStr) -> int
         """
@@ -288,7 +330,7 @@ class DSA_pub(DSA):  # noqa
 
 
 def gen_params(bits, callback=util.genparam_callback):
-    # type: (int, Callable) -> DSA
+    # type: (int, Optional[Callable]) -> DSA
     """
     Factory function that generates DSA parameters and
     instantiates a DSA object from the output.
@@ -297,7 +339,8 @@ def gen_params(bits, callback=util.genparam_callback):
                  'bits' < 512, it is set to 512.
     :param callback: A Python callback object that will be
                  invoked during parameter generation; it usual
-                 purpose is to provide visual feedback.
+                 purpose is to provide visual feedback. With None
+                 other threads keep running during generation.
     :return:  instance of DSA.
     """
     dsa = m2.dsa_generate_parameters(bits, callback)
@@ -10,9 +10,9 @@ Copyright (c) 1999-2003 Ng Pheng Siong. All rights reserved.
 Portions copyright (c) 2005-2006 Vrije Universiteit Amsterdam.
 All rights reserved."""
 
-from M2Crypto import BIO, m2, util
+from M2Crypto import BIO, EVP, m2, util
 if util.py27plus:
-    from typing import AnyStr, Callable, Dict, Optional, Tuple, Union  # noqa
+    from typing import AnyStr, Callable, Dict, Iterable, List, Optional, Tuple, Union  # noqa
 
 EC_Key = bytes
 
@@ -208,6 +208,41 @@ class EC:
         assert self.check_key(), 'key is not initialised'
         return m2.ecdh_compute_key(self.ec, pub_key.ec)
 
+    def compute_dh_keys(self, pub_keys, kdf=None, length=None,
+                        shared_info=b'', packed=False):
+        # type: (Iterable[EC], Optional[str], Optional[int], bytes, bool) -> Union[List[bytes], bytes]
+        """
+        Compute the ECDH shared keys of this key pair and each of the
+        given public key objects in a single call, which runs with the
+        GIL released. They must all use the same curve.
+
+        :param pub_keys:    Iterable of EC public key objects.
+        :param kdf:         Name of a hash algorithm like 'sha256'. If
+                            given, each shared key is passed through the
+                            ANSI X9.63 KDF using it; otherwise the raw
+                            shared keys are returned. Unknown names
+                            raise EVP.EVPError.
+        :param length:      Output length of the KDF in bytes; defaults
+                            to the digest size of kdf.
+        :param shared_info: SharedInfo input of the KDF.
+        :param packed:      If true, return all keys concatenated in one
+                            byte string instead of a list.
+        :return:            List of shared keys in the order of pub_keys,
+                            or a byte string if packed.
+        """
+        assert self.check_key(), 'key is not initialised'
+        md = None if kdf is None else EVP._get_digest(kdf)
+        # Hold on to the key objects: dropping them would free the
+        # EC_KEYs before the C code is done with them.
+        pub_keys = list(pub_keys)
+        keys = [k.ec for k in pub_keys]
+        blob = m2.ecdh_compute_keys(self.ec, keys, md, length or 0,
+                                    shared_info)
+        if packed:
+            return blob
+        size = len(blob) // len(keys) if keys else 0
+        return [blob[i:i + size] for i in range(0, len(blob), size or 1)]
+
     def save_key_bio(self, bio, cipher='aes_128_cbc',
                      callback=util.passphrase_callback):
         # type: (BIO.BIO, Optional[str], Callable) -> int
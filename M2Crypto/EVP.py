@@ -8,10 +8,15 @@ Portions Copyright (c) 2004-2007 Open Source Applications Foundation.
 Author: Heikki Toivonen
 """
 
+import copy
 import logging
+import os
+
+from multiprocessing.pool import ThreadPool
+
 from M2Crypto import BIO, Err, RSA, m2, util
 if util.py27plus:
-    from typing import AnyStr, Optional, Callable  # noqa
+    from typing import AnyStr, Callable, Dict, Iterable, List, Optional, Tuple, Union  # noqa
 
 log = logging.getLogger('EVP')
 
@@ -35,6 +40,232 @@ def pbkdf2(password, salt, iter, keylen):
     return m2.pkcs5_pbkdf2_hmac_sha1(password, salt, iter, keylen)
 
 
+def pbkdf2_hmac(algo, password, salt, iter, keylen):
+    # type: (str, bytes, bytes, int, int) -> bytes
+    """
+    Derive a key from password using PBKDF2 with HMAC over the given
+    digest. The derivation runs with the GIL released.
+
+    :param algo:     Name of the digest algorithm, as for MessageDigest.
+    :param password: Derive the key from this password.
+    :param salt:     Salt.
+    :param iter:     Number of iterations to perform.
+    :param keylen:   Length of key to produce.
+    :return:         Key.
+    """
+    return m2.pkcs5_pbkdf2_hmac(password, salt, iter, keylen,
+                                _get_digest(algo))
+
+
+def pbkdf2_hmac_many(algo, credentials, iter, keylen, threads=None):
+    # type: (str, Iterable[Tuple[bytes, bytes]], int, int, Optional[int]) -> List[bytes]
+    """
+    Derive keys for many (password, salt) pairs in parallel on a pool
+    of threads.
+
+    :param credentials: Iterable of (password, salt) tuples.
+    :param threads:     Number of worker threads, defaults to the number
+                        of CPUs.
+    :return:            List of keys in the order of credentials.
+
+    See pbkdf2_hmac() for the other parameters.
+    """
+    md = _get_digest(algo)
+
+    def derive(credential):
+        password, salt = credential
+        return m2.pkcs5_pbkdf2_hmac(password, salt, iter, keylen, md)
+
+    pool = ThreadPool(threads)
+    try:
+        return pool.map(derive, credentials)
+    finally:
+        pool.close()
+        pool.join()
+
+
+# Resolved EVP_MD and EVP_CIPHER objects by name. Unknown names are not
+# kept, so that the caches cannot grow without bound.
+_digests = {}  # type: Dict[str, EVP_MD]
+_ciphers = {}  # type: Dict[str, EVP_CIPHER]
+
+
+def _get_digest(algo):
+    # type: (str) -> EVP_MD
+    """
+    Return the EVP_MD called algo, resolving it only on first use.
+
+    :raises EVPError: if there is no such digest.
+    """
+    try:
+        return _digests[algo]
+    except KeyError:
+        pass
+    mda = getattr(m2, algo, None)  # type: Optional[Callable]
+    if mda is not None:
+        md = mda()
+    else:
+        # if the digest algorithm isn't found as an attribute of the m2
+        # module, try to look up the digest using get_digestbyname()
+        try:
+            md = m2.get_digestbyname(algo)
+        except EVPError:
+            md = None
+    if md is None:
+        raise EVPError('unknown message digest', algo)
+    _digests[algo] = md
+    return md
+
+
+def _get_cipher(algo):
+    # type: (str) -> EVP_CIPHER
+    """
+    Return the EVP_CIPHER called algo, resolving it only on first use.
+
+    :raises EVPError: if there is no such cipher.
+    """
+    try:
+        return _ciphers[algo]
+    except KeyError:
+        pass
+    ciph = getattr(m2, algo, None)  # type: Optional[Callable]
+    if ciph is None:
+        raise EVPError('unknown cipher', algo)
+    cipher = _ciphers[algo] = ciph()
+    return cipher
+
+
+def digest_many(algo, data, out=None):
+    # type: (str, Iterable[bytes], Optional[bytearray]) -> Union[List[bytes], int]
+    """
+    Compute the digest of each message in data in a single call, reusing
+    one digest context for all of them.
+
+    :param algo: Name of the digest algorithm, as for MessageDigest.
+    :param data: Iterable of bytes-like objects.
+    :param out:  Optional writable buffer; if given, the digests are
+                 written into it back to back instead of being returned
+                 as a list.
+    :return:     List of digests, or the number of digests written to out.
+    """
+    md = _get_digest(algo)
+    if out is None:
+        return m2.digest_many(md, data)
+    return m2.digest_many_into(md, data, out)
+
+
+def digest_file(file, algo, chunk_size=1 << 20):
+    # type: (Union[AnyStr, int], str, int) -> bytes
+    """
+    Compute the digest of a whole file.
+
+    Reading and hashing are both done inside the extension with the GIL
+    released, so several files can be hashed in parallel from threads.
+
+    :param file:       Name of the file, or an open file descriptor, which
+                       is read from its current position to the end and
+                       not closed.
+    :param algo:       Name of the digest algorithm, as for MessageDigest.
+    :param chunk_size: Size of the blocks read from the file.
+    :return:           The digest.
+    """
+    md = _get_digest(algo)
+    if isinstance(file, int):
+        return m2.digest_fd(md, file, chunk_size, -1)
+    fd = os.open(file, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        return m2.digest_fd(md, fd, chunk_size, -1)
+    finally:
+        os.close(fd)
+
+
+def _digest_file_range(args):
+    # type: (Tuple[AnyStr, str, int, int]) -> bytes
+    file, algo, offset, length = args
+    fd = os.open(file, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return m2.digest_fd(_get_digest(algo), fd, 1 << 20, length)
+    finally:
+        os.close(fd)
+
+
+def _digest_buffer(args):
+    # type: (Tuple[memoryview, str]) -> bytes
+    data, algo = args
+    md = MessageDigest(algo)
+    md.update(data)
+    return md.final()
+
+
+def _merkle_root(digests, algo):
+    # type: (List[bytes], str) -> bytes
+    # Leaves and inner nodes are hashed with distinct prefixes, as in
+    # RFC 6962, so that no chunk digest can pass for an inner node.
+    level = digest_many(algo, [b'\x00' + d for d in digests])
+    while len(level) > 1:
+        pairs = [b'\x01' + level[i] + level[i + 1]
+                 for i in range(0, len(level) - 1, 2)]
+        parents = digest_many(algo, pairs)
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0]
+
+
+def _tree_hash(func, jobs, algo, threads):
+    # type: (Callable, List[tuple], str, Optional[int]) -> Tuple[List[bytes], bytes]
+    pool = ThreadPool(threads)
+    try:
+        digests = pool.map(func, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return digests, _merkle_root(digests, algo)
+
+
+def tree_hash(data, algo, chunk_size=1 << 22, threads=None):
+    # type: (bytes, str, int, Optional[int]) -> Tuple[List[bytes], bytes]
+    """
+    Split data into chunk_size long chunks, digest them in parallel and
+    combine the chunk digests into a Merkle tree.
+
+    Each leaf of the tree is the digest of a zero byte followed by a
+    chunk digest, and each inner node the digest of a one byte followed
+    by its two children; an unpaired last node is carried up to the
+    next level unchanged. Empty data is treated as a single empty chunk.
+
+    :param data:       Bytes-like object to digest.
+    :param algo:       Name of the digest algorithm, as for MessageDigest.
+    :param chunk_size: Size of the chunks.
+    :param threads:    Number of worker threads, defaults to the number
+                       of CPUs.
+    :return:           Tuple of the list of chunk digests and the root
+                       digest.
+    """
+    if chunk_size <= 0:
+        raise ValueError('chunk_size must be positive')
+    view = memoryview(data)
+    jobs = [(view[i:i + chunk_size], algo)
+            for i in range(0, len(view), chunk_size)] or [(view, algo)]
+    return _tree_hash(_digest_buffer, jobs, algo, threads)
+
+
+def tree_hash_file(file, algo, chunk_size=1 << 22, threads=None):
+    # type: (AnyStr, str, int, Optional[int]) -> Tuple[List[bytes], bytes]
+    """
+    Like tree_hash(), but for the contents of the named file. Every worker
+    thread reads its chunks through its own file descriptor with the
+    GIL released.
+    """
+    if chunk_size <= 0:
+        raise ValueError('chunk_size must be positive')
+    size = os.stat(file).st_size
+    jobs = [(file, algo, offset, min(chunk_size, size - offset))
+            for offset in range(0, size, chunk_size)] or [(file, algo, 0, 0)]
+    return _tree_hash(_digest_file_range, jobs, algo, threads)
+
+
 class MessageDigest:
     """
     Message Digest
@@ -43,13 +274,7 @@ class MessageDigest:
 
     def __init__(self, algo):
         # type: (str) -> None
-        md = getattr(m2, algo, None)  # type: Optional[Callable]
-        if md is None:
-            # if the digest algorithm isn't found as an attribute of the m2
-            # module, try to look up the digest using get_digestbyname()
-            self.md = m2.get_digestbyname(algo)
-        else:
-            self.md = md()
+        self.md = _get_digest(algo)
         self.ctx = m2.md_ctx_new()
         m2.digest_init(self.ctx, self.md)
 
@@ -63,6 +288,9 @@ class MessageDigest:
         """
         Add data to be digested.
 
+        Large buffers are hashed with the GIL released, so an instance
+        must not be updated from several threads at once.
+
         :return: -1 for Python error, 1 for success, 0 for OpenSSL failure.
         """
         return m2.digest_update(self.ctx, data)
@@ -70,6 +298,35 @@ class MessageDigest:
     def final(self):
         return m2.digest_final(self.ctx)
 
+    def final_into(self, out):
+        # type: (bytearray) -> int
+        """
+        Write the digest into the writable buffer out instead of
+        returning a new bytes object.
+
+        :param out: bytearray, memoryview or any other writable buffer
+                    at least as long as the digest.
+        :return: Number of bytes written.
+        """
+        return m2.digest_final_into(self.ctx, out)
+
+    def copy(self):
+        # type: () -> MessageDigest
+        """
+        Return a copy of this object, including the state of the data
+        digested so far, so that a common prefix needs to be hashed
+        only once.
+        """
+        ctx = m2.md_ctx_new()
+        try:
+            m2.md_ctx_copy(ctx, self.ctx)
+        except EVPError:
+            self.m2_md_ctx_free(ctx)
+            raise
+        other = copy.copy(self)
+        other.ctx = ctx
+        return other
+
     # Deprecated.
     digest = final
 
@@ -80,10 +337,7 @@ class HMAC:
 
     def __init__(self, key, algo='sha1'):
         # type: (bytes, str) -> None
-        md = getattr(m2, algo, None)
-        if md is None:
-            raise ValueError('unknown algorithm', algo)
-        self.md = md()
+        self.md = _get_digest(algo)
         self.ctx = m2.hmac_ctx_new()
         m2.hmac_init(self.ctx, key, self.md)
 
@@ -104,15 +358,38 @@ class HMAC:
         # type: () -> bytes
         return m2.hmac_final(self.ctx)
 
+    def final_into(self, out):
+        # type: (bytearray) -> int
+        """
+        Write the MAC into the writable buffer out instead of
+        returning a new bytes object.
+
+        :return: Number of bytes written.
+        """
+        return m2.hmac_final_into(self.ctx, out)
+
+    def copy(self):
+        # type: () -> HMAC
+        """
+        Return a copy of this object, including the key and the state of
+        the data authenticated so far, without redoing the key setup.
+        """
+        ctx = m2.hmac_ctx_new()
+        try:
+            m2.hmac_ctx_copy(ctx, self.ctx)
+        except EVPError:
+            self.m2_hmac_ctx_free(ctx)
+            raise
+        other = copy.copy(self)
+        other.ctx = ctx
+        return other
+
     digest = final
 
 
 def hmac(key, data, algo='sha1'):
     # type: (bytes, bytes, str) -> bytes
-    md = getattr(m2, algo, None)
-    if md is None:
-        raise ValueError('unknown algorithm', algo)
-    return m2.hmac(key, data, md())
+    return m2.hmac(key, data, _get_digest(algo))
 
 
 class Cipher:
@@ -122,15 +399,10 @@ class Cipher:
     def __init__(self, alg, key, iv, op, key_as_bytes=0, d='md5',
                  salt='12345678', i=1, padding=1):
         # type: (str, bytes, bytes, object, int, str, bytes, int, int) -> None
-        cipher = getattr(m2, alg, None)
-        if cipher is None:
-            raise ValueError('unknown cipher', alg)
-        self.cipher = cipher()
+        self.cipher = _get_cipher(alg)
         if key_as_bytes:
-            kmd = getattr(m2, d, None)
-            if kmd is None:
-                raise ValueError('unknown message digest', d)
-            key = m2.bytes_to_key(self.cipher, kmd(), key, salt, iv, i)
+            key = m2.bytes_to_key(self.cipher, _get_digest(d), key, salt,
+                                  iv, i)
         self.ctx = m2.cipher_ctx_new()
         m2.cipher_init(self.ctx, self.cipher, key, iv, op)
         self.set_padding(padding)
@@ -149,6 +421,29 @@ class Cipher:
         # type: () -> bytes
         return m2.cipher_final(self.ctx)
 
+    def update_into(self, data, out):
+        # type: (bytes, bytearray) -> int
+        """
+        Like update(), but write the output into the writable buffer out,
+        so that one preallocated buffer can be reused for a whole stream.
+
+        :param data: Data to be encrypted or decrypted.
+        :param out:  Writable buffer of at least len(data) + block size
+                     bytes.
+        :return:     Number of bytes written to out.
+        """
+        return m2.cipher_update_into(self.ctx, data, out)
+
+    def final_into(self, out):
+        # type: (bytearray) -> int
+        """
+        Like final(), but write the output into the writable buffer out,
+        which has to be at least one block long.
+
+        :return: Number of bytes written to out.
+        """
+        return m2.cipher_final_into(self.ctx, out)
+
     def set_padding(self, padding=1):
         # type: (int) -> int
         """
@@ -156,6 +451,81 @@ class Cipher:
         """
         return m2.cipher_set_padding(self.ctx, padding)
 
+    def reinit(self, iv=None, key=None):
+        # type: (Optional[bytes], Optional[bytes]) -> None
+        """
+        Restart the cipher on the same context with a new IV and/or key,
+        e.g. to encrypt the next message. The direction and padding are
+        kept, and so is the expanded key unless a new key is given.
+
+        An AEAD cipher like 'aes_128_gcm' or 'chacha20_poly1305' loses
+        both confidentiality and authenticity when a nonce is used twice
+        with the same key, so encrypting with one always needs a new iv
+        here: ValueError is raised if it is None.
+
+        :param iv:  New IV, or None to reuse the current one (not
+                    allowed for AEAD encryption).
+        :param key: New key, or None to reuse the current one.
+        """
+        m2.cipher_reinit(self.ctx, key, iv)
+
+    def update_aad(self, data):
+        # type: (bytes) -> None
+        """
+        Feed additional authenticated data to an AEAD cipher (e.g.
+        'aes_128_gcm' or 'chacha20_poly1305'). Must be called before
+        any update().
+        """
+        m2.cipher_update_aad(self.ctx, data)
+
+    def get_tag(self, length=16):
+        # type: (int) -> bytes
+        """
+        Return the authentication tag of an AEAD encryption; only valid
+        after final().
+        """
+        return m2.cipher_get_tag(self.ctx, length)
+
+    def set_tag(self, tag):
+        # type: (bytes) -> None
+        """
+        Set the expected authentication tag of an AEAD decryption before
+        calling final(), which raises EVPError if the tag does not match.
+        """
+        m2.cipher_set_tag(self.ctx, tag)
+
+
+def aead_encrypt(alg, key, nonce, aad, data, tag_length=16):
+    # type: (str, bytes, bytes, bytes, bytes, int) -> bytes
+    """
+    Encrypt and authenticate data with an AEAD cipher in a single call,
+    which runs with the GIL released.
+
+    :param alg:        Name of the cipher, e.g. 'aes_256_gcm' or
+                       'chacha20_poly1305'.
+    :param key:        Key of the length the cipher requires.
+    :param nonce:      Nonce; never reuse one with the same key.
+    :param aad:        Additional data which is authenticated, but not
+                       encrypted.
+    :param data:       Plaintext.
+    :param tag_length: Length of the authentication tag.
+    :return:           Ciphertext followed by the tag.
+    """
+    return m2.aead_crypt(_get_cipher(alg), key, nonce, aad, data,
+                         tag_length, 1)
+
+
+def aead_decrypt(alg, key, nonce, aad, data, tag_length=16):
+    # type: (str, bytes, bytes, bytes, bytes, int) -> bytes
+    """
+    Verify and decrypt the output of aead_encrypt().
+
+    :raises EVPError: if the data or aad were tampered with.
+    :return:          Plaintext.
+    """
+    return m2.aead_crypt(_get_cipher(alg), key, nonce, aad, data,
+                         tag_length, 0)
+
 
 class PKey:
     """
@@ -187,11 +557,11 @@ class PKey:
 
     def _set_context(self, md):
         # type: (str) -> None
-        mda = getattr(m2, md, None)  # type: Optional[Callable]
-        if mda is None:
-            raise ValueError('unknown message digest', md)
-        self.md = mda()
-        self.ctx = m2.md_ctx_new()  # type: Context
+        self.md = _get_digest(md)
+        # sign_init() and verify_init() reinitialise the context, so an
+        # existing one can be reused.
+        if not getattr(self, 'ctx', None):
+            self.ctx = m2.md_ctx_new()  # type: Context
 
     def reset_context(self, md='sha1'):
         # type: (str) -> None
@@ -259,6 +629,67 @@ class PKey:
         """
         return m2.verify_final(self.ctx, sign, self.pkey)
 
+    def sign(self, data, md=None):
+        # type: (bytes, Optional[str]) -> bytes
+        """
+        Hash and sign data in a single call, which runs with the GIL
+        released.
+
+        :param data: Data to be signed.
+        :param md:   Name of the message digest algorithm; defaults to
+                     the one given to the constructor or reset_context(),
+                     and to none for Ed25519 keys.
+        :return:     The signature.
+        """
+        return m2.pkey_sign(self.pkey, self._sign_md(md), data)
+
+    def verify(self, data, sign, md=None):
+        # type: (bytes, bytes, Optional[str]) -> int
+        """
+        Hash data and verify the signature sign in a single call, which
+        runs with the GIL released.
+
+        :param data: Data which was signed.
+        :param sign: Signature to check.
+        :param md:   Name of the message digest algorithm; defaults to
+                     the one given to the constructor or reset_context(),
+                     and to none for Ed25519 keys.
+        :return:     1 if the signature is good, 0 otherwise.
+        """
+        return m2.pkey_verify(self.pkey, self._sign_md(md), data, sign)
+
+    def verify_many(self, pairs, md=None, threads=None):
+        # type: (Iterable[Tuple[bytes, bytes]], Optional[str], Optional[int]) -> List[int]
+        """
+        Verify a batch of signatures made with this key. Each slice of the
+        batch is checked in a single call which runs with the GIL
+        released, so several threads verify in parallel.
+
+        :param pairs:   Iterable of (data, signature) tuples.
+        :param md:      Name of the message digest algorithm; defaults to
+                        the one given to the constructor or reset_context(),
+                        and to none for Ed25519 keys.
+        :param threads: If given, split the batch over a pool of this many
+                        threads; otherwise verify it on the calling thread.
+        :return:        List with 1 for every good and 0 for every bad
+                        signature, in the order of pairs.
+        """
+        mda = self._sign_md(md)
+        pairs = [tuple(pair) for pair in pairs]
+        if not threads or threads < 2 or len(pairs) < 2:
+            return m2.pkey_verify_many(self.pkey, mda, pairs)
+        size = -(-len(pairs) // threads)
+        chunks = [pairs[i:i + size] for i in range(0, len(pairs), size)]
+        pool = ThreadPool(len(chunks))
+        try:
+            results = pool.map(
+                lambda chunk: m2.pkey_verify_many(self.pkey, mda, chunk),
+                chunks)
+        finally:
+            pool.close()
+            pool.join()
+        return [ok for chunk in results for ok in chunk]
+
     def assign_rsa(self, rsa, capture=1):
         # type: (RSA.RSA, int) -> int
         """
@@ -331,10 +762,8 @@ class PKey:
         if cipher is None:
             return m2.pkey_write_pem_no_cipher(self.pkey, bio._ptr(), callback)
         else:
-            proto = getattr(m2, cipher, None)
-            if proto is None:
-                raise ValueError('no such cipher %s' % cipher)
-            return m2.pkey_write_pem(self.pkey, bio._ptr(), proto(), callback)
+            return m2.pkey_write_pem(self.pkey, bio._ptr(),
+                                     _get_cipher(cipher), callback)
 
     def as_pem(self, cipher='aes_128_cbc', callback=util.passphrase_callback):
         # type: (Optional[str], Callable) -> bytes
@@ -370,6 +799,42 @@ class PKey:
         """
         return m2.pkey_size(self.pkey)
 
+    def _sign_md(self, md):
+        # type: (Optional[str]) -> Optional[bytes]
+        if md is not None:
+            return _get_digest(md)
+        if m2.pkey_base_id(self.pkey) in _DIGESTLESS_KEYS:
+            return None
+        return self.md
+
+    def derive(self, peer):
+        # type: (PKey) -> bytes
+        """
+        Derive the shared secret of this key pair and the public key
+        peer of the same type (X25519, EC or DH). The computation runs
+        with the GIL released.
+
+        :param peer: M2Crypto.EVP.PKey object with the peer's public key.
+        :return:     The raw shared secret.
+        """
+        return m2.pkey_derive(self.pkey, peer.pkey)
+
+    def get_raw_public_key(self):
+        # type: () -> bytes
+        """
+        Return the public key in the raw encoding of key types like
+        Ed25519 and X25519.
+        """
+        return m2.pkey_get_raw_public_key(self.pkey)
+
+    def get_raw_private_key(self):
+        # type: () -> bytes
+        """
+        Return the private key in the raw encoding of key types like
+        Ed25519 and X25519.
+        """
+        return m2.pkey_get_raw_private_key(self.pkey)
+
     def get_modulus(self):
         # type: () -> Optional[bytes]
         """
@@ -378,6 +843,59 @@ class PKey:
         return m2.pkey_get_modulus(self.pkey)
 
 
+def _pkey_type(algo):
+    # type: (str) -> int
+    pkey_type = getattr(m2, 'EVP_PKEY_' + algo.upper(), None)
+    if pkey_type is None:
+        raise EVPError('unknown key type %s' % algo)
+    return pkey_type
+
+
+# Key types whose signature schemes take the whole message, not a digest.
+_DIGESTLESS_KEYS = tuple(getattr(m2, name) for name in ('EVP_PKEY_ED25519',)
+                         if hasattr(m2, name))
+
+
+def gen_key(algo):
+    # type: (str) -> PKey
+    """
+    Generate a key pair of a type that takes no parameters.
+
+    :param algo: Key type, 'ed25519' or 'x25519'.
+
+    :return: M2Crypto.EVP.PKey object.
+    """
+    return PKey(m2.pkey_keygen(_pkey_type(algo)), 1)
+
+
+def load_raw_private_key(algo, key):
+    # type: (str, bytes) -> PKey
+    """
+    Load a private key from its raw encoding.
+
+    :param algo: Key type, 'ed25519' or 'x25519'.
+
+    :param key:  The 32 byte private key.
+
+    :return: M2Crypto.EVP.PKey object.
+    """
+    return PKey(m2.pkey_new_raw_private_key(_pkey_type(algo), key), 1)
+
+
+def load_raw_public_key(algo, key):
+    # type: (str, bytes) -> PKey
+    """
+    Load a public key from its raw encoding.
+
+    :param algo: Key type, 'ed25519' or 'x25519'.
+
+    :param key:  The 32 byte public key.
+
+    :return: M2Crypto.EVP.PKey object.
+    """
+    return PKey(m2.pkey_new_raw_public_key(_pkey_type(algo), key), 1)
+
+
 def load_key(file, callback=util.passphrase_callback):
     # type: (AnyStr, Callable) -> PKey
     """
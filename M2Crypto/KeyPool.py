@@ -0,0 +1,170 @@
+from __future__ import absolute_import
+
+"""
+Pool of pre-generated key pairs.
+
+Generating an RSA key pair takes from milliseconds to seconds, depending
+on the modulus size. A KeyPool keeps a number of spare keys ready,
+generated by background threads, so that handing out a fresh key pair
+costs no more than taking it off a queue::
+
+    pool = KeyPool.rsa(2048, spares=8)
+    key = pool.get()
+    ...
+    pool.close()
+
+Key generation releases the GIL, so the worker threads do not hold up
+the rest of the program."""
+
+import collections
+import logging
+import threading
+
+from M2Crypto import RSA, m2, util
+if util.py27plus:
+    from typing import Any, Callable, Deque, List, Optional  # noqa
+
+log = logging.getLogger(__name__)
+
+
+class KeyPool(object):
+    """
+    Keep up to spares key pairs made by factory ready for get().
+
+    Spares are generated by workers background threads and refilled as
+    soon as one is taken. If the pool is empty get() generates a key on
+    the calling thread instead of waiting. A worker whose factory call
+    fails logs the error and tries again after a delay that doubles with
+    every further failure, up to max_backoff seconds.
+    """
+
+    min_backoff = 0.1  # type: float
+    max_backoff = 30.0  # type: float
+
+    def __init__(self, factory, spares=4, workers=1):
+        # type: (Callable[[], Any], int, int) -> None
+        """
+        :param factory: Callable without arguments that returns a new key
+                        pair; it should release the GIL while it works.
+        :param spares:  Number of keys to keep ready.
+        :param workers: Number of background threads generating keys.
+        """
+        if spares < 1 or workers < 1:
+            raise ValueError('spares and workers must be positive')
+        self._factory = factory
+        self._spares = spares
+        self._keys = collections.deque()  # type: Deque[Any]
+        self._busy = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._workers = []  # type: List[threading.Thread]
+        for _ in range(workers):
+            t = threading.Thread(target=self._refill,
+                                 name='M2Crypto.KeyPool')
+            t.daemon = True
+            t.start()
+            self._workers.append(t)
+
+    def __enter__(self):
+        # type: () -> KeyPool
+        return self
+
+    def __exit__(self, *args):
+        # type: (*Any) -> None
+        self.close()
+
+    def __len__(self):
+        # type: () -> int
+        """Number of keys ready to be handed out."""
+        return len(self._keys)
+
+    @classmethod
+    def rsa(cls, bits, e=65537, **kwargs):
+        # type: (int, int, **Any) -> KeyPool
+        """
+        Pool of RSA key pairs.
+
+        :param bits: Key length, in bits.
+        :param e:    The RSA public exponent.
+
+        Other keyword arguments are passed on to the constructor.
+        """
+        return cls(lambda: RSA.gen_key(bits, e, callback=None), **kwargs)
+
+    @classmethod
+    def ec(cls, curve, **kwargs):
+        # type: (int, **Any) -> KeyPool
+        """
+        Pool of EC key pairs.
+
+        :param curve: OpenSSL nid of the curve to use.
+
+        Other keyword arguments are passed on to the constructor.
+        """
+        if m2.OPENSSL_NO_EC:
+            raise ValueError('EC is not available on this system')
+        from M2Crypto import EC
+
+        def gen():
+            key = EC.gen_params(curve)
+            key.gen_key()
+            return key
+        return cls(gen, **kwargs)
+
+    def get(self):
+        # type: () -> Any
+        """
+        Return a fresh key pair; each key is handed out only once.
+        """
+        with self._cond:
+            if self._closed:
+                raise ValueError('KeyPool is closed')
+            if self._keys:
+                key = self._keys.popleft()
+                self._cond.notify()
+                return key
+        return self._factory()
+
+    def close(self):
+        # type: () -> None
+        """
+        Stop the workers and drop the spare keys.
+        """
+        with self._cond:
+            self._closed = True
+            self._keys.clear()
+            self._cond.notify_all()
+        for t in self._workers:
+            if t is not threading.current_thread():
+                t.join()
+        self._workers = []
+
+    def _refill(self):
+        # type: () -> None
+        backoff = 0.0
+        while True:
+            with self._cond:
+                while (not self._closed and
+                       len(self._keys) + self._busy >= self._spares):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                self._busy += 1
+            try:
+                key = self._factory()
+            except Exception:
+                log.exception('KeyPool worker failed to generate a key')
+                backoff = min(max(backoff * 2, self.min_backoff),
+                              self.max_backoff)
+                with self._cond:
+                    self._busy -= 1
+                    if not self._closed:
+                        # close() cuts the wait short.
+                        self._cond.wait(backoff)
+                continue
+            backoff = 0.0
+            with self._cond:
+                self._busy -= 1
+                if not self._closed:
+                    self._keys.append(key)
+                    self._cond.notify_all()
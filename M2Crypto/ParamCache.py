@@ -0,0 +1,181 @@
+from __future__ import absolute_import
+
+"""
+On-disk cache of generated DH and DSA parameters.
+
+Generating DH or DSA parameters of 2048 bits or more takes minutes. A
+ParamCache keeps them as PEM files in a local directory, so they are
+generated once per machine instead of once per process::
+
+    cache = ParamCache('/var/cache/myapp')
+    ctx = SSL.Context()
+    ctx.set_tmp_dh(cache.dh(2048))
+
+Parameters are checked when loaded and regenerated if missing or
+invalid; prefetch() starts the generation in the background. Threads
+asking for the same parameters wait for a single generation."""
+
+import logging
+import os
+import tempfile
+import threading
+
+from M2Crypto import DH, DSA, m2, util
+if util.py27plus:
+    from typing import Dict, Optional, Tuple, Union  # noqa
+
+log = logging.getLogger(__name__)
+
+_KINDS = ('dh', 'dsa')
+
+
+class ParamCache(object):
+    """
+    Cache of DH and DSA parameters keyed by (kind, bits, generator).
+    """
+
+    def __init__(self, directory):
+        # type: (str) -> None
+        """
+        :param directory: Directory holding the PEM files; it is created
+                          if it does not exist.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._pending = {}  # type: Dict[Tuple[str, int, int], threading.Thread]
+        # One lock per parameter set, held while it is being generated.
+        self._gen_locks = {}  # type: Dict[Tuple[str, int, int], threading.Lock]
+
+    def path(self, kind, bits, generator=0):
+        # type: (str, int, int) -> str
+        """
+        Name of the file caching the given parameters.
+        """
+        if kind not in _KINDS:
+            raise ValueError('unknown parameter kind %r' % (kind,))
+        return os.path.join(self.directory,
+                            '%s-%d-%d.pem' % (kind, bits, generator))
+
+    def dh(self, bits, generator=DH.DH_GENERATOR_2, wait=True):
+        # type: (int, int, bool) -> Optional[DH.DH]
+        """
+        DH parameters with a prime of bits bits; see get().
+        """
+        return self.get('dh', bits, generator, wait)
+
+    def dsa(self, bits, wait=True):
+        # type: (int, bool) -> Optional[DSA.DSA]
+        """
+        DSA parameters with a prime of bits bits; see get().
+        """
+        return self.get('dsa', bits, 0, wait)
+
+    def get(self, kind, bits, generator=0, wait=True):
+        # type: (str, int, int, bool) -> Optional[Union[DH.DH, DSA.DSA]]
+        """
+        Return cached parameters, generating them if needed.
+
+        :param kind:      'dh' or 'dsa'.
+        :param bits:      Length of the prime, in bits.
+        :param generator: DH generator; must be 0 for DSA.
+        :param wait:      If false and the parameters are not cached yet,
+                          start generating them in the background and
+                          return None instead of blocking.
+        :return:          DH.DH or DSA.DSA instance.
+        """
+        params = self._load(kind, bits, generator)
+        if params is not None:
+            return params
+        if not wait:
+            self.prefetch(kind, bits, generator)
+            return None
+        # Generate on the calling thread so errors reach the caller.
+        return self._load_or_generate(kind, bits, generator)
+
+    def prefetch(self, kind, bits, generator=0):
+        # type: (str, int, int) -> threading.Thread
+        """
+        Generate parameters in a background thread unless they are
+        cached or already being generated.
+
+        :return: The thread doing the work.
+        """
+        key = (kind, bits, generator)
+        path = self.path(kind, bits, generator)
+        with self._lock:
+            thread = self._pending.get(key)
+            if thread is None:
+                thread = threading.Thread(target=self._prefetch,
+                                          args=key + (path,),
+                                          name='M2Crypto.ParamCache')
+                thread.daemon = True
+                self._pending[key] = thread
+                thread.start()
+        return thread
+
+    def _prefetch(self, kind, bits, generator, path):
+        # type: (str, int, int, str) -> None
+        try:
+            self._load_or_generate(kind, bits, generator)
+        except Exception:
+            log.exception('Failed to generate %s', path)
+        finally:
+            with self._lock:
+                del self._pending[(kind, bits, generator)]
+
+    def _load_or_generate(self, kind, bits, generator):
+        # type: (str, int, int) -> Union[DH.DH, DSA.DSA]
+        key = (kind, bits, generator)
+        with self._lock:
+            gen_lock = self._gen_locks.setdefault(key, threading.Lock())
+        with gen_lock:
+            # Another thread may have made them while this one waited.
+            params = self._load(kind, bits, generator)
+            if params is None:
+                params = self._generate(kind, bits, generator)
+            return params
+
+    def _load(self, kind, bits, generator):
+        # type: (str, int, int) -> Optional[Union[DH.DH, DSA.DSA]]
+        path = self.path(kind, bits, generator)
+        if not os.path.exists(path):
+            return None
+        try:
+            if kind == 'dh':
+                params = DH.load_params(path)
+                ok = (params.check_params() == m2.dh_check_ok and
+                      len(params) == (bits + 7) // 8)
+            else:
+                params = DSA.load_params(path)
+                # check_params() is -1 where OpenSSL cannot check them.
+                ok = params.check_params() != 0 and len(params) == bits
+        except Exception:
+            ok = False
+        if not ok:
+            log.warning('Ignoring invalid parameters in %s', path)
+            return None
+        return params
+
+    def _generate(self, kind, bits, generator):
+        # type: (str, int, int) -> Union[DH.DH, DSA.DSA]
+        path = self.path(kind, bits, generator)
+        if kind == 'dh':
+            params = DH.gen_params(bits, generator, callback=None)
+        else:
+            if generator:
+                raise ValueError('DSA parameters take no generator')
+            params = DSA.gen_params(bits, callback=None)
+
+        # Write to a temporary file first so that readers never see a
+        # partially written file.
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            params.save_params(tmp)
+            getattr(os, 'replace', os.rename)(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        return params
@@ -49,17 +49,43 @@ class RSA:
 
     def __getattr__(self, name):
         # type: (str) -> bytes
-        if name == 'e':
-            return m2.rsa_get_e(self.rsa)
-        elif name == 'n':
-            return m2.rsa_get_n(self.rsa)
+        if name in ('e', 'n'):
+            # (e, n) cannot change once the object exists, so read each
+            # of them from OpenSSL only once.
+            cache = self.__dict__.setdefault('_mpi_cache', {})
+            if name not in cache:
+                cache[name] = getattr(m2, 'rsa_get_%s' % (name,))(self.rsa)
+            return cache[name]
         else:
             raise AttributeError
 
     def pub(self):
         # type: () -> Tuple[bytes, bytes]
         assert self.check_key(), 'key is not initialised'
-        return m2.rsa_get_e(self.rsa), m2.rsa_get_n(self.rsa)
+        return self.e, self.n
+
+    def get_int(self, name):
+        # type: (str) -> int
+        """
+        Return a public key component as a Python int.
+
+        :param name: 'e' or 'n'.
+        """
+        if name not in ('e', 'n'):
+            raise ValueError('unknown RSA value %r' % (name,))
+        return util.mpi_to_int(getattr(self, name))
+
+    def get_bytes(self, name):
+        # type: (str) -> bytes
+        """
+        Return a public key component as unsigned big-endian bytes, as
+        used by e.g. JSON Web Keys.
+
+        :param name: 'e' or 'n'.
+        """
+        if name not in ('e', 'n'):
+            raise ValueError('unknown RSA value %r' % (name,))
+        return util.mpi_to_bytes(getattr(self, name))
 
     def public_encrypt(self, data, padding):
         # type: (bytes, int) -> bytes
@@ -341,7 +367,7 @@ def keygen_callback(p, n, out=sys.stdout):
 
 
 def gen_key(bits, e, callback=keygen_callback):
-    # type: (int, int, Callable) -> RSA
+    # type: (int, int, Optional[Callable]) -> RSA
     """
     Generate an RSA key pair.
 
@@ -352,7 +378,9 @@ def gen_key(bits, e, callback=keygen_callback):
     :param callback: A Python callable object that is invoked
                      during key generation; its usual purpose is to
                      provide visual feedback. The default callback is
-                     keygen_callback.
+                     keygen_callback. With None no feedback is given
+                     and other threads keep running while the key is
+                     generated.
 
     :return: M2Crypto.RSA.RSA object.
     """
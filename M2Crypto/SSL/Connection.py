@@ -13,13 +13,13 @@ Copyright 2008 Heikki Toivonen. All rights reserved.
 import logging
 import socket
 
-from M2Crypto import BIO, X509, m2, util  # noqa
+from M2Crypto import BIO, X509, m2, six, util  # noqa
 from M2Crypto.SSL import Checker, Context, timeout  # noqa
 from M2Crypto.SSL import SSLError
 from M2Crypto.SSL.Cipher import Cipher, Cipher_Stack
 from M2Crypto.SSL.Session import Session
 if util.py27plus:
-    from typing import Any, AnyStr, Callable, Dict, List, Optional, Tuple, Union  # noqa
+    from typing import Any, AnyStr, Callable, Dict, IO, Iterable, List, Optional, Tuple, Union  # noqa
 
 __all__ = ['Connection',
            'timeout',  # XXX Not really, but for documentation purposes
@@ -349,6 +349,61 @@ class Connection:
         return self._write_nbio(data)
     sendall = send = write
 
+    def write_many(self, buffers):
+        # type: (Iterable[bytes]) -> int
+        """
+        Write several buffers as if they were concatenated.
+
+        The data are packed into TLS records of the maximum size without
+        joining the buffers in Python, so e.g. HTTP headers and body go
+        out in as few records (and TCP segments) as possible.
+
+        While it runs, the connection accepts a write retried from a
+        different buffer (SSL_MODE_ACCEPT_MOVING_WRITE_BUFFER); the
+        mode is restored before it returns.
+
+        :param buffers: Sequence of bytes-like objects.
+        :return: Number of bytes written. In non-blocking mode this may be
+                 less than the total; call write_many() again with the
+                 remaining data, not write(), as OpenSSL may hold part of
+                 it. -1 if nothing could be written.
+        """
+        return m2.ssl_write_many(self.ssl, buffers, self._timeout)
+    sendmsg = write_many
+
+    def sendfile(self, file, offset=0, count=None):
+        # type: (Union[int, IO[bytes]], int, Optional[int]) -> int
+        """
+        Send the contents of a file without copying it through Python.
+
+        The file is read and encrypted in C with the GIL released. If
+        the connection uses kernel TLS offload, the kernel sends the data
+        directly (SSL_sendfile()).
+
+        :param file: Regular file opened in binary mode, or its file
+                     descriptor.
+        :param offset: Position in the file to start reading from.
+        :param count: Maximum number of bytes to send; None (the default)
+                      sends everything up to the end of the file.
+        :return: Number of bytes sent. In non-blocking mode this may be
+                 less than requested; call sendfile() again for the
+                 rest, not write(). -1 if nothing could be sent. The
+                 position of a file object is moved past the data sent.
+        """
+        if isinstance(file, six.integer_types):
+            fd = file
+        else:
+            fd = file.fileno()
+        if count is not None and count <= 0:
+            raise ValueError('count must be a positive integer (got %r)'
+                             % (count,))
+        sent = m2.ssl_sendfile(self.ssl, fd, offset,
+                               -1 if count is None else count,
+                               self._timeout)
+        if sent > 0 and fd is not file:
+            file.seek(offset + sent)
+        return sent
+
     def read(self, size=1024):
         # type: (int) -> bytes
         if self._timeout != 0.0:
@@ -356,6 +411,22 @@ class Connection:
         return self._read_nbio(size)
     recv = read
 
+    def recv_into(self, buff, nbytes=0):
+        # type: (bytearray, int) -> Optional[int]
+        """
+        Read data into a writable buffer instead of a new bytes object,
+        so that the same buffer can be reused for every read.
+
+        :param buff: Object supporting the writable buffer protocol,
+                     e.g. a bytearray or a memoryview.
+        :param nbytes: Maximum number of bytes to read; 0 (the default)
+                       means the size of buff.
+        :return: Number of bytes read, 0 at end of stream, or None if
+                 the connection is non-blocking and no data is available.
+        """
+        return m2.ssl_read_into(self.ssl, buff, nbytes, self._timeout)
+    readinto = recv_into
+
     def setblocking(self, mode):
         # type: (int) -> None
         """Set this connection's underlying socket to _mode_.
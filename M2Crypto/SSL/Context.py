@@ -4,7 +4,7 @@ from __future__ import absolute_import
 
 Copyright (c) 1999-2004 Ng Pheng Siong. All rights reserved."""
 
-from M2Crypto import BIO, Err, RSA, X509, m2, util  # noqa
+from M2Crypto import BIO, DH, Err, RSA, X509, m2, util  # noqa
 from M2Crypto.SSL import cb  # noqa
 from M2Crypto.SSL.Session import Session  # noqa
 from weakref import WeakValueDictionary
@@ -254,12 +254,15 @@ class Context:
         return m2.ssl_ctx_get_verify_depth(self.ctx)
 
     def set_tmp_dh(self, dhpfile):
-        # type: (AnyStr) -> int
+        # type: (Union[AnyStr, DH.DH]) -> int
         """Load ephemeral DH parameters into the context.
 
         :param dhpfile: Filename of the file containing the PEM-encoded
-                        DH parameters.
+                        DH parameters, or a DH.DH instance such as one
+                        returned by ParamCache.dh().
         """
+        if isinstance(dhpfile, DH.DH):
+            return m2.ssl_ctx_set_tmp_dh(self.ctx, dhpfile.dh)
         f = BIO.openfile(dhpfile)
         dhp = m2.dh_read_parameters(f.bio_ptr())
         return m2.ssl_ctx_set_tmp_dh(self.ctx, dhp)
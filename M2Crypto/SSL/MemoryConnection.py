@@ -0,0 +1,194 @@
+from __future__ import absolute_import
+
+"""TLS connection over memory buffers.
+
+A MemoryConnection runs the TLS protocol without doing any I/O of its
+own: ciphertext received from the peer is fed in, and plaintext and
+ciphertext for the peer come out. That lets any event loop drive many
+TLS sessions without a thread per connection::
+
+    conn = SSL.MemoryConnection(ctx, server_hostname='example.org')
+    sock.sendall(conn.data_to_send())  # ClientHello
+    while not conn.is_handshake_done():
+        plain, out = conn.process(sock.recv(16384))
+        sock.sendall(out)
+
+The data is moved between the BIOs and the SSL object in C, and the
+cryptography runs with the GIL released."""
+
+from M2Crypto import X509, m2, util
+from M2Crypto.SSL.Cipher import Cipher
+from M2Crypto.SSL.Session import Session
+if util.py27plus:
+    from typing import Optional, Tuple  # noqa
+    from M2Crypto.SSL import Context  # noqa
+
+__all__ = ['MemoryConnection']
+
+
+class MemoryConnection(object):
+
+    """A TLS connection whose network side is a pair of memory buffers."""
+
+    m2_ssl_free = m2.ssl_free
+
+    def __init__(self, ctx, server_side=False, server_hostname=None):
+        # type: (Context, bool, Optional[str]) -> None
+        """
+        :param ctx: SSL.Context
+        :param server_side: True for the server end of the connection.
+        :param server_hostname: Host name sent to the server in the SNI
+                                extension (client side only).
+        """
+        self.ctx = ctx
+        self.ssl = m2.ssl_new(self.ctx.ctx)
+        m2.ssl_set_mem_bios(self.ssl)
+        self.server_side = server_side
+        if server_side:
+            m2.ssl_set_accept_state(self.ssl)
+        else:
+            if server_hostname is not None:
+                m2.ssl_set_tlsext_host_name(self.ssl, server_hostname)
+            m2.ssl_set_connect_state(self.ssl)
+            # Start the handshake so that the ClientHello is ready to send.
+            m2.ssl_mem_handshake(self.ssl)
+
+    def __del__(self):
+        # type: () -> None
+        if getattr(self, 'ssl', None):
+            self.m2_ssl_free(self.ssl)
+
+    def feed(self, data):
+        # type: (bytes) -> int
+        """
+        Pass ciphertext received from the peer to the connection.
+
+        :return: Number of bytes fed, always len(data).
+        """
+        return m2.ssl_mem_feed(self.ssl, data)
+
+    def data_to_send(self, size=-1):
+        # type: (int) -> bytes
+        """
+        Return ciphertext that must be sent to the peer, up to size
+        bytes (all of it if size is negative), or b'' if there is none.
+
+        Call this after every other method, including ones that raised
+        SSLError: a failed handshake leaves an alert for the peer here.
+        """
+        return m2.ssl_mem_drain(self.ssl, size)
+
+    def pending(self):
+        # type: () -> int
+        """Return the number of ciphertext bytes waiting to be sent."""
+        return m2.ssl_mem_pending(self.ssl)
+
+    def do_handshake(self):
+        # type: () -> int
+        """
+        Advance the handshake with the data fed so far.
+
+        :return: 0 once the handshake is complete, otherwise
+                 m2.ssl_error_want_read (feed more data from the peer).
+        """
+        return m2.ssl_mem_handshake(self.ssl)
+
+    def is_handshake_done(self):
+        # type: () -> bool
+        return bool(m2.ssl_is_init_finished(self.ssl))
+
+    def read(self, size=-1):
+        # type: (int) -> Optional[bytes]
+        """
+        Return the plaintext available from the data fed so far,
+        completing the handshake first if needed.
+
+        :param size: Maximum number of bytes to return; all of them if
+                     negative.
+        :return: Plaintext, None if more data must be fed first, or b''
+                 once the peer has closed the connection. If close_notify
+                 arrives together with the last data, that data is
+                 returned first and b'' on the next call; get_shutdown()
+                 tells at once.
+        """
+        if size == 0:
+            raise ValueError('size == 0')
+        return m2.ssl_mem_read(self.ssl, size)
+    recv = read
+
+    def write(self, data):
+        # type: (bytes) -> int
+        """
+        Encrypt data; the ciphertext is then returned by data_to_send().
+
+        :return: len(data), or -1 if the handshake has to make progress
+                 before data can be sent.
+        """
+        return m2.ssl_write(self.ssl, data, 0)
+    send = write
+
+    def process(self, data=b''):
+        # type: (bytes) -> Tuple[Optional[bytes], bytes]
+        """
+        Feed data, decrypt the plaintext it completes and collect the
+        ciphertext to send back, in a single call.
+
+        :return: Tuple (plaintext, ciphertext); plaintext is as returned
+                 by read().
+        """
+        return m2.ssl_mem_process(self.ssl, data)
+
+    def shutdown(self):
+        # type: () -> int
+        """
+        Send close_notify to the peer (see data_to_send()).
+
+        :return: 1 if the peer's close_notify has been received too,
+                 0 otherwise.
+        """
+        return m2.ssl_shutdown(self.ssl)
+
+    def get_shutdown(self):
+        # type: () -> int
+        """Get the current shutdown mode of the connection."""
+        return m2.ssl_get_shutdown(self.ssl)
+
+    def verify_ok(self):
+        # type: () -> bool
+        return (m2.ssl_get_verify_result(self.ssl) == m2.X509_V_OK)
+
+    def get_verify_result(self):
+        # type: () -> int
+        """Return the peer certificate verification result."""
+        return m2.ssl_get_verify_result(self.ssl)
+
+    def get_peer_cert(self):
+        # type: () -> Optional[X509.X509]
+        """Return the peer certificate, or None if there is none."""
+        c = m2.ssl_get_peer_cert(self.ssl)
+        if c is None:
+            return None
+        # Need to free the pointer coz OpenSSL doesn't.
+        return X509.X509(c, 1)
+
+    def get_cipher(self):
+        # type: () -> Optional[Cipher]
+        """Return the negotiated cipher, or None before the handshake."""
+        c = m2.ssl_get_current_cipher(self.ssl)
+        if c is None:
+            return None
+        return Cipher(c)
+
+    def get_version(self):
+        # type: () -> str
+        """Return the TLS/SSL protocol version for this connection."""
+        return m2.ssl_get_version(self.ssl)
+
+    def get_session(self):
+        # type: () -> Session
+        sess = m2.ssl_get_session(self.ssl)
+        return Session(sess)
+
+    def set_session(self, session):
+        # type: (Session) -> None
+        m2.ssl_set_session(self.ssl, session._ptr())
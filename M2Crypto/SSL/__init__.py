@@ -23,6 +23,7 @@ m2.ssl_init(SSLError, SSLTimeoutError)
 from M2Crypto.SSL.Cipher import Cipher, Cipher_Stack
 from M2Crypto.SSL.Connection import Connection
 from M2Crypto.SSL.Context import Context
+from M2Crypto.SSL.MemoryConnection import MemoryConnection
 from M2Crypto.SSL.SSLServer import (ForkingSSLServer, SSLServer,
                                     ThreadingSSLServer)
 from M2Crypto.SSL.ssl_dispatcher import ssl_dispatcher
@@ -0,0 +1,539 @@
+from __future__ import absolute_import
+
+"""asyncio support for M2Crypto TLS connections.
+
+The TLS protocol runs on an SSL.MemoryConnection between the socket
+transport of the event loop and the application protocol, so a single
+event loop thread can serve any number of connections::
+
+    reader, writer = await SSL.asyncio.open_connection(
+        'example.org', 443, ctx=SSL.Context())
+
+    server = await SSL.asyncio.start_server(handle_client, port=8443,
+                                            ctx=server_ctx)
+
+create_connection() and create_server() work with any asyncio.Protocol,
+like the loop methods of the same names with an ssl argument.
+
+Requires Python 3.5.2 or later."""
+
+import asyncio
+import logging
+
+from M2Crypto import m2, util
+from M2Crypto.SSL import Checker, SSLError
+from M2Crypto.SSL.Connection import Connection
+from M2Crypto.SSL.MemoryConnection import MemoryConnection
+if util.py27plus:
+    from typing import Any, Callable, List, Optional  # noqa
+    from M2Crypto.SSL import Context  # noqa
+
+__all__ = ['TLSProtocol', 'TLSTransport', 'create_connection',
+           'create_server', 'open_connection', 'start_server']
+
+log = logging.getLogger(__name__)
+
+# Same default as the standard library.
+HANDSHAKE_TIMEOUT = 60.0
+
+
+class TLSTransport(asyncio.Transport):
+
+    """Transport given to the application protocol; data written to it
+    is encrypted and passed on to the socket transport."""
+
+    def __init__(self, tls):
+        # type: (TLSProtocol) -> None
+        super(TLSTransport, self).__init__()
+        self._tls = tls
+
+    def get_extra_info(self, name, default=None):
+        # type: (str, Any) -> Any
+        """
+        Besides the information of the socket transport, provides
+        'ssl_object' (the SSL.MemoryConnection), 'peercert' (X509.X509
+        or None) and 'cipher' (SSL.Cipher).
+
+        'sslcontext' is deliberately not provided: asyncio streams close
+        a stdlib SSL transport as soon as the peer sends close_notify,
+        while this transport supports half-closed connections.
+        """
+        tls = self._tls
+        if name == 'ssl_object':
+            return tls.conn
+        elif name == 'peercert':
+            return tls.conn.get_peer_cert()
+        elif name == 'cipher':
+            return tls.conn.get_cipher()
+        return tls.transport.get_extra_info(name, default)
+
+    def set_protocol(self, protocol):
+        # type: (asyncio.Protocol) -> None
+        self._tls.app_protocol = protocol
+
+    def get_protocol(self):
+        # type: () -> asyncio.Protocol
+        return self._tls.app_protocol
+
+    def is_closing(self):
+        # type: () -> bool
+        return self._tls.closing
+
+    def close(self):
+        # type: () -> None
+        """Send close_notify to the peer and close the connection once
+        the buffered data has been sent."""
+        self._tls.close()
+
+    def abort(self):
+        # type: () -> None
+        """Close the connection at once, discarding buffered data."""
+        self._tls.closing = True
+        if self._tls.transport is not None:
+            self._tls.transport.abort()
+
+    def is_reading(self):
+        # type: () -> bool
+        return self._tls.transport.is_reading()
+
+    def pause_reading(self):
+        # type: () -> None
+        self._tls.transport.pause_reading()
+
+    def resume_reading(self):
+        # type: () -> None
+        self._tls.transport.resume_reading()
+
+    # The ciphertext is handed to the socket transport straight away,
+    # so its buffer is the one that fills up.
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        # type: (Optional[int], Optional[int]) -> None
+        self._tls.transport.set_write_buffer_limits(high, low)
+
+    def get_write_buffer_size(self):
+        # type: () -> int
+        return self._tls.transport.get_write_buffer_size()
+
+    def write(self, data):
+        # type: (bytes) -> None
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError('data must be a bytes-like object, not %s'
+                            % type(data).__name__)
+        if data:
+            self._tls.write(data)
+
+    def can_write_eof(self):
+        # type: () -> bool
+        return True
+
+    def write_eof(self):
+        # type: () -> None
+        """Send close_notify, but keep receiving data from the peer."""
+        self._tls.write_eof()
+
+
+class TLSProtocol(asyncio.Protocol):
+
+    """Protocol for the socket transport that runs TLS and drives the
+    application protocol through a TLSTransport.
+
+    The application protocol sees connection_made() only once the
+    handshake and the post connection check have succeeded. Failures
+    before that are reported through waiter, if given."""
+
+    def __init__(self, ctx, app_protocol, server_side=False,
+                 server_hostname=None, waiter=None,
+                 handshake_timeout=HANDSHAKE_TIMEOUT, loop=None):
+        # type: (Context, asyncio.Protocol, bool, Optional[str], Optional[asyncio.Future], Optional[float], Optional[asyncio.AbstractEventLoop]) -> None
+        """
+        :param ctx: SSL.Context
+        :param app_protocol: Protocol receiving the plaintext.
+        :param server_side: True for the server end of the connection.
+        :param server_hostname: Host name for SNI and the post connection
+                                check (client side only).
+        :param waiter: Future set to (transport, app_protocol) once the
+                       handshake is complete, or to the exception that
+                       stopped it.
+        :param handshake_timeout: Seconds to wait for the handshake;
+                                  None to wait forever.
+        :param loop: Event loop of the socket transport; the running loop
+                     if None.
+        """
+        self.ctx = ctx
+        self.app_protocol = app_protocol
+        self.server_side = server_side
+        self.server_hostname = server_hostname
+        self.conn = None  # type: Optional[MemoryConnection]
+        self.transport = None  # type: Optional[asyncio.Transport]
+        self.app_transport = TLSTransport(self)
+        self.closing = False
+        self._waiter = waiter
+        self._handshake_timeout = handshake_timeout
+        self._loop = loop
+        self._timer = None  # type: Optional[asyncio.Handle]
+        self._connected = False
+        self._eof_sent = False
+        self._eof_received = False
+        self._close_pending = False
+        self._error = None  # type: Optional[Exception]
+        # Writes held up by a renegotiation; the first one must be
+        # retried with the very same buffer.
+        self._write_backlog = []  # type: List[bytes]
+
+    def connection_made(self, transport):
+        # type: (asyncio.Transport) -> None
+        self.transport = transport
+        try:
+            self.conn = MemoryConnection(self.ctx, self.server_side,
+                                         self.server_hostname)
+        except SSLError as exc:
+            self._fatal_error(exc)
+            return
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        if self._handshake_timeout is not None:
+            self._timer = self._loop.call_later(self._handshake_timeout,
+                                          self._on_handshake_timeout)
+        self._flush()
+
+    def connection_lost(self, exc):
+        # type: (Optional[Exception]) -> None
+        self.closing = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._connected:
+            self._connected = False
+            self.app_protocol.connection_lost(exc or self._error)
+        else:
+            self._set_waiter(exc or ConnectionResetError(
+                'connection lost during the TLS handshake'))
+        self.transport = None
+
+    def pause_writing(self):
+        # type: () -> None
+        if self._connected:
+            self.app_protocol.pause_writing()
+
+    def resume_writing(self):
+        # type: () -> None
+        if self._connected:
+            self.app_protocol.resume_writing()
+
+    def data_received(self, data):
+        # type: (bytes) -> None
+        if self.conn is None:
+            return
+        try:
+            plain, out = self.conn.process(data)
+        except SSLError as exc:
+            self._flush()
+            self._fatal_error(exc)
+            return
+        if out:
+            self.transport.write(out)
+        if not self._connected:
+            if not self.conn.is_handshake_done():
+                return
+            if not self._on_handshake_complete():
+                return
+        if self._write_backlog:
+            self._write_pending()
+        if plain:
+            self.app_protocol.data_received(plain)
+        # close_notify may arrive right behind the last data.
+        if plain == b'' or \
+                self.conn.get_shutdown() & m2.SSL_RECEIVED_SHUTDOWN:
+            self._on_eof()
+
+    def eof_received(self):
+        # type: () -> bool
+        if not self._connected:
+            self._set_waiter(ConnectionResetError(
+                'connection closed during the TLS handshake'))
+        else:
+            # The peer closed the TCP connection without close_notify;
+            # pass the end of stream on anyway.
+            self._on_eof()
+        return False
+
+    def write(self, data):
+        # type: (bytes) -> None
+        if self.closing or self._eof_sent:
+            log.warning('TLS transport is closed, dropping %d bytes',
+                        len(data))
+            return
+        # A copy, so that the buffer of a held up write cannot change.
+        data = bytes(data)
+        if self._write_backlog:
+            # Keep the plaintext in order behind the held up writes.
+            self._write_backlog.append(data)
+            return
+        try:
+            if self.conn.write(data) == -1:
+                # The connection is renegotiating; try again once the
+                # peer's reply has been processed.
+                self._write_backlog.append(data)
+        except SSLError as exc:
+            self._fatal_error(exc)
+            return
+        self._flush()
+
+    def _write_pending(self):
+        # type: () -> None
+        backlog = self._write_backlog
+        while backlog:
+            try:
+                if self.conn.write(backlog[0]) == -1:
+                    break
+            except SSLError as exc:
+                self._fatal_error(exc)
+                return
+            del backlog[0]
+        self._flush()
+        if not backlog:
+            if self._eof_sent:
+                self._shutdown()
+            if self._close_pending and self.transport is not None:
+                self.transport.close()
+
+    def write_eof(self):
+        # type: () -> None
+        if self._eof_sent or self.closing:
+            return
+        self._eof_sent = True
+        if not self._write_backlog:
+            self._shutdown()
+
+    def close(self):
+        # type: () -> None
+        if self.closing:
+            return
+        self.closing = True
+        if self._connected and not self._eof_sent:
+            self._eof_sent = True
+            if not self._write_backlog:
+                self._shutdown()
+        if self._write_backlog:
+            # Closed by _write_pending() once the backlog is sent.
+            self._close_pending = True
+        elif self.transport is not None:
+            self.transport.close()
+
+    def _shutdown(self):
+        # type: () -> None
+        try:
+            self.conn.shutdown()
+        except SSLError:
+            pass
+        self._flush()
+
+    def _flush(self):
+        # type: () -> None
+        out = self.conn.data_to_send()
+        if out and self.transport is not None:
+            self.transport.write(out)
+
+    def _on_handshake_complete(self):
+        # type: () -> bool
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.server_side:
+            check = getattr(self.ctx, 'post_connection_check', None)
+            if check is None:
+                check = Connection.serverPostConnectionCheck
+            host = (self.transport.get_extra_info('peername') or [None])[0]
+        else:
+            check = getattr(self.ctx, 'post_connection_check', None)
+            if check is None:
+                check = Connection.clientPostConnectionCheck
+            host = self.server_hostname
+        try:
+            if check is not None and host is not None and \
+                    not check(self.conn.get_peer_cert(), host):
+                raise Checker.SSLVerificationError(
+                    'post connection check failed')
+        except Exception as exc:
+            self._fatal_error(exc)
+            return False
+        if self._waiter is not None and self._waiter.cancelled():
+            self.transport.abort()
+            return False
+        self._connected = True
+        self.app_protocol.connection_made(self.app_transport)
+        self._set_waiter(None)
+        return True
+
+    def _on_handshake_timeout(self):
+        # type: () -> None
+        self._timer = None
+        self._fatal_error(ConnectionAbortedError(
+            'TLS handshake timed out after %s seconds'
+            % (self._handshake_timeout,)))
+
+    def _on_eof(self):
+        # type: () -> None
+        if self._eof_received:
+            return
+        self._eof_received = True
+        keep_open = self.app_protocol.eof_received()
+        if not keep_open:
+            self.close()
+
+    def _set_waiter(self, exc):
+        # type: (Optional[BaseException]) -> None
+        waiter, self._waiter = self._waiter, None
+        if waiter is None or waiter.done():
+            return
+        if exc is None:
+            waiter.set_result((self.app_transport, self.app_protocol))
+        else:
+            waiter.set_exception(exc)
+
+    def _fatal_error(self, exc):
+        # type: (Exception) -> None
+        if self._connected:
+            log.debug('Fatal error on TLS connection', exc_info=exc)
+        elif self._waiter is None:
+            log.debug('TLS handshake failed', exc_info=exc)
+        self._set_waiter(exc)
+        self._error = exc
+        self._write_backlog = []
+        self.closing = True
+        if self.transport is not None:
+            # close() rather than abort() so that an alert queued by
+            # _flush() still reaches the peer.
+            self.transport.close()
+
+
+def create_connection(protocol_factory, host=None, port=None, ctx=None,
+                      server_hostname=None, loop=None,
+                      handshake_timeout=HANDSHAKE_TIMEOUT, **kwargs):
+    # type: (Callable[[], asyncio.Protocol], Optional[str], Optional[int], Optional[Context], Optional[str], Optional[asyncio.AbstractEventLoop], Optional[float], **Any) -> asyncio.Future
+    """
+    Open a TLS connection, like loop.create_connection() with ssl.
+
+    :param ctx: SSL.Context; a default one if None.
+    :param server_hostname: Name for SNI and the post connection check;
+                            host if None.
+    :return: Future set to (transport, protocol) once the handshake is
+             complete. Other keyword arguments are passed on to
+             loop.create_connection().
+    """
+    from M2Crypto.SSL import Context
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    if ctx is None:
+        ctx = Context()
+    if server_hostname is None:
+        server_hostname = host
+    waiter = loop.create_future()
+
+    def factory():
+        return TLSProtocol(ctx, protocol_factory(), False, server_hostname,
+                           waiter, handshake_timeout, loop)
+
+    connecting = asyncio.ensure_future(
+        loop.create_connection(factory, host, port, **kwargs), loop=loop)
+
+    def connected(fut):
+        if waiter.done():
+            return
+        if fut.cancelled():
+            waiter.cancel()
+        elif fut.exception() is not None:
+            waiter.set_exception(fut.exception())
+
+    def finished(fut):
+        if fut.cancelled():
+            connecting.cancel()
+
+    connecting.add_done_callback(connected)
+    waiter.add_done_callback(finished)
+    return waiter
+
+
+def create_server(protocol_factory, host=None, port=None, ctx=None,
+                  loop=None, handshake_timeout=HANDSHAKE_TIMEOUT, **kwargs):
+    # type: (Callable[[], asyncio.Protocol], Optional[str], Optional[int], Context, Optional[asyncio.AbstractEventLoop], Optional[float], **Any) -> Any
+    """
+    Serve TLS connections, like loop.create_server() with ssl.
+
+    :param ctx: SSL.Context with the server certificate and key.
+    :return: Coroutine returning an asyncio.Server. Other keyword
+             arguments are passed on to loop.create_server().
+    """
+    if ctx is None:
+        raise ValueError('a server needs an SSL.Context')
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    def factory():
+        return TLSProtocol(ctx, protocol_factory(), True,
+                           handshake_timeout=handshake_timeout, loop=loop)
+
+    return loop.create_server(factory, host, port, **kwargs)
+
+
+def open_connection(host=None, port=None, ctx=None, loop=None,
+                    limit=2 ** 16, **kwargs):
+    # type: (Optional[str], Optional[int], Optional[Context], Optional[asyncio.AbstractEventLoop], int, **Any) -> asyncio.Future
+    """
+    Open a TLS connection, like asyncio.open_connection().
+
+    :return: Future set to a (StreamReader, StreamWriter) pair once the
+             handshake is complete. Other keyword arguments are passed
+             on to create_connection().
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+    reader = asyncio.StreamReader(limit=limit, loop=loop)
+    protocol = asyncio.StreamReaderProtocol(reader, loop=loop)
+    connecting = create_connection(lambda: protocol, host, port, ctx=ctx,
+                                   loop=loop, **kwargs)
+    result = loop.create_future()
+
+    def connected(fut):
+        if result.done():
+            return
+        if fut.cancelled():
+            result.cancel()
+        elif fut.exception() is not None:
+            result.set_exception(fut.exception())
+        else:
+            transport = fut.result()[0]
+            writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+            result.set_result((reader, writer))
+
+    def finished(fut):
+        if fut.cancelled():
+            connecting.cancel()
+
+    connecting.add_done_callback(connected)
+    result.add_done_callback(finished)
+    return result
+
+
+def start_server(client_connected_cb, host=None, port=None, ctx=None,
+                 loop=None, limit=2 ** 16, **kwargs):
+    # type: (Callable, Optional[str], Optional[int], Context, Optional[asyncio.AbstractEventLoop], int, **Any) -> Any
+    """
+    Serve TLS connections, like asyncio.start_server().
+
+    client_connected_cb(reader, writer) is called for every connection
+    once its handshake is complete; it may be a coroutine function.
+
+    :return: Coroutine returning an asyncio.Server. Other keyword
+             arguments are passed on to create_server().
+    """
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    def factory():
+        reader = asyncio.StreamReader(limit=limit, loop=loop)
+        return asyncio.StreamReaderProtocol(reader, client_connected_cb,
+                                            loop=loop)
+
+    return create_server(factory, host, port, ctx=ctx, loop=loop, **kwargs)
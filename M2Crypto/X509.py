@@ -721,18 +721,21 @@ class X509:
         return m2.x509_get_ext_count(self.x509)
 
     def sign(self, pkey, md):
-        # type: (EVP.PKey, str) -> int
+        # type: (EVP.PKey, Optional[str]) -> int
         """
         Sign the certificate.
 
         :param pkey: Public key
 
         :param md:   Message digest algorithm to use for signing,
-                     for example 'sha1'.
+                     for example 'sha1'; None for key types like
+                     Ed25519 which take no digest.
 
         :return int
         """
         assert m2.x509_type_check(self.x509), "'x509' type error"
+        if md is None:
+            return m2.x509_sign(self.x509, pkey.pkey, None)
         mda = getattr(m2, md, None)
         if mda is None:
             raise ValueError('unknown message digest', md)
@@ -24,9 +24,9 @@ version = __version__  # type: str
 version_info = StrictVersion(__version__).version
 
 from M2Crypto import (ASN1, AuthCookie, BIO, BN, DH, DSA, EVP, Engine, Err,
-                      RSA, Rand, SMIME, SSL, X509, m2crypto, ftpslib,
-                      httpslib, m2, m2urllib, m2xmlrpclib, threading,
-                      util)
+                      KeyPool, ParamCache, RSA, Rand, SMIME, SSL, X509,
+                      m2crypto, ftpslib, httpslib, m2, m2urllib,
+                      m2xmlrpclib, threading, util)
 
 if m2.OPENSSL_VERSION_NUMBER >= 0x90800F and m2.OPENSSL_NO_EC == 0:
     from M2Crypto import EC
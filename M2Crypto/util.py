@@ -94,6 +94,36 @@ def octx_to_num(x):
     return int(binascii.hexlify(x), 16)
 
 
+def mpi_to_bytes(mpi):
+    # type: (bytes) -> bytes
+    """
+    Convert a non-negative number in OpenSSL MPI format (as returned by
+    e.g. RSA.n or DSA.pub) to unsigned big-endian bytes with no leading
+    zeros.
+    """
+    body = mpi[4:]
+    if body and bytearray(body[:1])[0] & 0x80:
+        raise ValueError('negative MPI')
+    return body.lstrip(b'\0')
+
+
+def mpi_to_int(mpi):
+    # type: (bytes) -> int
+    """
+    Convert a number in OpenSSL MPI format to a Python int.
+    """
+    body = bytearray(mpi[4:])
+    if not body:
+        return 0
+    negative = body[0] & 0x80
+    body[0] &= 0x7f
+    if six.PY3:
+        num = int.from_bytes(body, 'big')
+    else:
+        num = octx_to_num(bytes(body))
+    return -num if negative else num
+
+
 def genparam_callback(p, n, out=sys.stdout):
     # type: (int, Any, file) -> None
     ch = ['.', '+', '*', '\n']
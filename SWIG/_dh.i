@@ -53,12 +53,26 @@ int dh_type_check(DH *dh) {
 DH *dh_read_parameters(BIO *bio) {
     return PEM_read_bio_DHparams(bio, NULL, NULL, NULL);
 }
+%}
 
-DH *dh_generate_parameters(int plen, int g, PyObject *pyfunc) {
+%threadallow dh_write_parameters;
+%inline %{
+int dh_write_parameters(DH *dh, BIO *bio) {
+    return PEM_write_bio_DHparams(bio, dh);
+}
+
+/* With callback None no progress is reported and the GIL is released
+ * while the parameters are generated. */
+DH *dh_generate_parameters(int plen, int g, PyObject *callback) {
     DH *dh;
     BN_GENCB *gencb;
     int ret;
 
+    if (callback != Py_None && !PyCallable_Check(callback)) {
+        PyErr_SetString(PyExc_TypeError, "expected PyCallable");
+        return NULL;
+    }
+
     if ((gencb=BN_GENCB_new()) == NULL) {
         m2_PyErr_Msg(_dh_err);
         return NULL;
@@ -70,11 +84,16 @@ DH *dh_generate_parameters(int plen, int g, PyObject *pyfunc) {
         return NULL;
     }
 
-    BN_GENCB_set(gencb, bn_gencb_callback, (void *)pyfunc);
-
-    Py_INCREF(pyfunc);
-    ret = DH_generate_parameters_ex(dh, plen, g, gencb);
-    Py_DECREF(pyfunc);
+    if (callback == Py_None) {
+        Py_BEGIN_ALLOW_THREADS
+        ret = DH_generate_parameters_ex(dh, plen, g, NULL);
+        Py_END_ALLOW_THREADS
+    } else {
+        BN_GENCB_set(gencb, bn_gencb_callback, (void *)callback);
+        Py_INCREF(callback);
+        ret = DH_generate_parameters_ex(dh, plen, g, gencb);
+        Py_DECREF(callback);
+    }
     BN_GENCB_free(gencb);
 
     if (ret)
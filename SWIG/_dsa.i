@@ -6,6 +6,11 @@
 #include <openssl/err.h>
 #include <openssl/pem.h>
 #include <openssl/dsa.h>
+#include <openssl/evp.h>
+#if OPENSSL_VERSION_NUMBER >= 0x30000000L
+#include <openssl/core_names.h>
+#include <openssl/param_build.h>
+#endif
 
 PyObject *dsa_sig_get_r(DSA_SIG *dsa_sig) {
     const BIGNUM* pr;
@@ -51,11 +56,18 @@ void dsa_init(PyObject *dsa_err) {
     }
 }
 %inline %{
-DSA *dsa_generate_parameters(int bits, PyObject *pyfunc) {
+/* With callback None no progress is reported and the GIL is released
+ * while the parameters are generated. */
+DSA *dsa_generate_parameters(int bits, PyObject *callback) {
     DSA *dsa;
     BN_GENCB *gencb;
     int ret;
 
+    if (callback != Py_None && !PyCallable_Check(callback)) {
+        PyErr_SetString(PyExc_TypeError, "expected PyCallable");
+        return NULL;
+    }
+
     if ((gencb=BN_GENCB_new()) == NULL) {
         m2_PyErr_Msg(_dh_err);
         return NULL;
@@ -67,12 +79,18 @@ DSA *dsa_generate_parameters(int bits, PyObject *pyfunc) {
         return NULL;
     }
 
-    BN_GENCB_set(gencb, bn_gencb_callback, (void *) pyfunc);
-
-    Py_INCREF(pyfunc);
-    ret = DSA_generate_parameters_ex(dsa, bits, NULL, 0, NULL, NULL,
-                                     gencb);
-    Py_DECREF(pyfunc);
+    if (callback == Py_None) {
+        Py_BEGIN_ALLOW_THREADS
+        ret = DSA_generate_parameters_ex(dsa, bits, NULL, 0, NULL, NULL,
+                                         NULL);
+        Py_END_ALLOW_THREADS
+    } else {
+        BN_GENCB_set(gencb, bn_gencb_callback, (void *) callback);
+        Py_INCREF(callback);
+        ret = DSA_generate_parameters_ex(dsa, bits, NULL, 0, NULL, NULL,
+                                         gencb);
+        Py_DECREF(callback);
+    }
     BN_GENCB_free(gencb);
 
     if (ret)
@@ -269,15 +287,19 @@ int dsa_write_pub_key_bio(DSA* dsa, BIO* f) {
 
 %inline %{
 PyObject *dsa_sign(DSA *dsa, PyObject *value) {
-    const void *vbuf;
-    int vlen;
+    Py_buffer vbuf;
     PyObject *tuple;
     DSA_SIG *sig;
 
-    if (m2_PyObject_AsReadBufferInt(value, &vbuf, &vlen) == -1)
+    if (m2_PyObject_GetBufferInt(value, &vbuf, PyBUF_SIMPLE) == -1)
         return NULL;
 
-    if (!(sig = DSA_do_sign(vbuf, vlen, dsa))) {
+    Py_BEGIN_ALLOW_THREADS
+    sig = DSA_do_sign(vbuf.buf, (int)vbuf.len, dsa);
+    Py_END_ALLOW_THREADS
+    m2_PyBuffer_Release(value, &vbuf);
+
+    if (!sig) {
         m2_PyErr_Msg(_dsa_err);
         return NULL;
     }
@@ -293,14 +315,14 @@ PyObject *dsa_sign(DSA *dsa, PyObject *value) {
 }
 
 int dsa_verify(DSA *dsa, PyObject *value, PyObject *r, PyObject *s) {
-    const void *vbuf, *rbuf, *sbuf;
-    int vlen, rlen, slen;
+    Py_buffer vbuf;
+    const void *rbuf, *sbuf;
+    int rlen, slen;
     DSA_SIG *sig;
     BIGNUM* pr, *ps;
     int ret;
 
-    if ((m2_PyObject_AsReadBufferInt(value, &vbuf, &vlen) == -1)
-        || (m2_PyObject_AsReadBufferInt(r, &rbuf, &rlen) == -1)
+    if ((m2_PyObject_AsReadBufferInt(r, &rbuf, &rlen) == -1)
         || (m2_PyObject_AsReadBufferInt(s, &sbuf, &slen) == -1))
         return -1;
 
@@ -326,8 +348,16 @@ int dsa_verify(DSA *dsa, PyObject *value, PyObject *r, PyObject *s) {
         BN_free(ps);
         return -1;
     }
+    if (m2_PyObject_GetBufferInt(value, &vbuf, PyBUF_SIMPLE) == -1) {
+        DSA_SIG_free(sig);
+        return -1;
+    }
 
-    ret = DSA_do_verify(vbuf, vlen, sig, dsa);
+    Py_BEGIN_ALLOW_THREADS
+    ret = DSA_do_verify(vbuf.buf, (int)vbuf.len, sig, dsa);
+    Py_END_ALLOW_THREADS
+
+    m2_PyBuffer_Release(value, &vbuf);
     DSA_SIG_free(sig);
     if (ret == -1)
         m2_PyErr_Msg(_dsa_err);
@@ -335,20 +365,28 @@ int dsa_verify(DSA *dsa, PyObject *value, PyObject *r, PyObject *s) {
 }
 
 PyObject *dsa_sign_asn1(DSA *dsa, PyObject *value) {
-    const void *vbuf;
-    int vlen;
+    Py_buffer vbuf;
     void *sigbuf;
     unsigned int siglen;
     PyObject *ret;
+    int ok;
 
-    if (m2_PyObject_AsReadBufferInt(value, &vbuf, &vlen) == -1)
+    if (m2_PyObject_GetBufferInt(value, &vbuf, PyBUF_SIMPLE) == -1)
         return NULL;
 
     if (!(sigbuf = PyMem_Malloc(DSA_size(dsa)))) {
+        m2_PyBuffer_Release(value, &vbuf);
         PyErr_SetString(PyExc_MemoryError, "dsa_sign_asn1");
         return NULL;
     }
-    if (!DSA_sign(0, vbuf, vlen, (unsigned char *)sigbuf, &siglen, dsa)) {
+
+    Py_BEGIN_ALLOW_THREADS
+    ok = DSA_sign(0, vbuf.buf, (int)vbuf.len, (unsigned char *)sigbuf,
+                  &siglen, dsa);
+    Py_END_ALLOW_THREADS
+    m2_PyBuffer_Release(value, &vbuf);
+
+    if (!ok) {
         m2_PyErr_Msg(_dsa_err);
         PyMem_Free(sigbuf);
         return NULL;
@@ -365,16 +403,24 @@ PyObject *dsa_sign_asn1(DSA *dsa, PyObject *value) {
 }
 
 int dsa_verify_asn1(DSA *dsa, PyObject *value, PyObject *sig) {
-    const void *vbuf;
-    void *sbuf;
-    int vlen, slen, ret;
+    Py_buffer vbuf, sbuf;
+    int ret;
 
-    if ((m2_PyObject_AsReadBufferInt(value, &vbuf, &vlen) == -1)
-        || (m2_PyObject_AsReadBufferInt(sig, (const void **)&sbuf, &slen)
-        == -1))
+    if (m2_PyObject_GetBufferInt(value, &vbuf, PyBUF_SIMPLE) == -1)
         return -1;
+    if (m2_PyObject_GetBufferInt(sig, &sbuf, PyBUF_SIMPLE) == -1) {
+        m2_PyBuffer_Release(value, &vbuf);
+        return -1;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    ret = DSA_verify(0, vbuf.buf, (int)vbuf.len, sbuf.buf, (int)sbuf.len,
+                     dsa);
+    Py_END_ALLOW_THREADS
 
-    if ((ret = DSA_verify(0, vbuf, vlen, sbuf, slen, dsa)) == -1)
+    m2_PyBuffer_Release(sig, &sbuf);
+    m2_PyBuffer_Release(value, &vbuf);
+    if (ret == -1)
         m2_PyErr_Msg(_dsa_err);
     return ret;
 }
@@ -391,6 +437,56 @@ int dsa_check_pub_key(DSA *dsa) {
     return pub_key ? 1 : 0;
 }
 
+/* Check the domain parameters of dsa: 1 if they are valid, 0 if not,
+ * -1 if this OpenSSL cannot check DSA parameters. The check runs on a
+ * provider copy of p, q and g, because a DSA made while an ENGINE is
+ * the default cannot be checked by the providers. */
+int dsa_check_params(DSA *dsa) {
+#if OPENSSL_VERSION_NUMBER >= 0x30000000L
+    const BIGNUM *p, *q, *g;
+    OSSL_PARAM_BLD *bld;
+    OSSL_PARAM *params = NULL;
+    EVP_PKEY_CTX *ctx = NULL;
+    EVP_PKEY *pkey = NULL;
+    int ret = -1;
+
+    DSA_get0_pqg(dsa, &p, &q, &g);
+    if (!p || !q || !g)
+        return 0;
+    if (!(bld = OSSL_PARAM_BLD_new())
+        || !OSSL_PARAM_BLD_push_BN(bld, OSSL_PKEY_PARAM_FFC_P, p)
+        || !OSSL_PARAM_BLD_push_BN(bld, OSSL_PKEY_PARAM_FFC_Q, q)
+        || !OSSL_PARAM_BLD_push_BN(bld, OSSL_PKEY_PARAM_FFC_G, g)
+        || !(params = OSSL_PARAM_BLD_to_param(bld))
+        || !(ctx = EVP_PKEY_CTX_new_from_name(NULL, "DSA", NULL))
+        || EVP_PKEY_fromdata_init(ctx) <= 0
+        || EVP_PKEY_fromdata(ctx, &pkey, EVP_PKEY_KEY_PARAMETERS,
+                             params) <= 0) {
+        m2_PyErr_Msg(_dsa_err);
+        goto out;
+    }
+    EVP_PKEY_CTX_free(ctx);
+    if (!(ctx = EVP_PKEY_CTX_new_from_pkey(NULL, pkey, NULL))) {
+        m2_PyErr_Msg(_dsa_err);
+        goto out;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    ret = EVP_PKEY_param_check(ctx) == 1;
+    Py_END_ALLOW_THREADS
+    if (!ret)
+        ERR_clear_error();
+
+ out:
+    EVP_PKEY_CTX_free(ctx);
+    EVP_PKEY_free(pkey);
+    OSSL_PARAM_free(params);
+    OSSL_PARAM_BLD_free(bld);
+    return ret;
+#else
+    return -1;
+#endif
+}
+
 int dsa_keylen(DSA *dsa) {
     const BIGNUM* p;
     DSA_get0_pqg(dsa, &p, NULL, NULL);
@@ -22,6 +22,8 @@
 %}
 
 %apply Pointer NONNULL { EC_KEY * };
+/* ecdh_compute_keys() takes None for "no KDF". */
+%typemap(check) const EVP_MD *kdf_md "";
 
 %rename(ec_key_new) EC_KEY_new;
 extern EC_KEY *EC_KEY_new(void);
@@ -30,6 +32,7 @@ extern void EC_KEY_free(EC_KEY *);
 %rename(ec_key_size) ECDSA_size;
 extern int ECDSA_size(const EC_KEY *);
 %rename(ec_key_gen_key) EC_KEY_generate_key;
+%threadallow EC_KEY_generate_key;
 extern int EC_KEY_generate_key(EC_KEY *);
 %rename(ec_key_check_key) EC_KEY_check_key;
 extern int EC_KEY_check_key(const EC_KEY *);
@@ -360,15 +363,19 @@ PyObject *ecdsa_sig_get_s(ECDSA_SIG *ecdsa_sig) {
 }
 
 PyObject *ecdsa_sign(EC_KEY *key, PyObject *value) {
-    const void *vbuf;
-    int vlen;
+    Py_buffer vbuf;
     PyObject *tuple;
     ECDSA_SIG *sig;
 
-    if (m2_PyObject_AsReadBufferInt(value, &vbuf, &vlen) == -1)
+    if (m2_PyObject_GetBufferInt(value, &vbuf, PyBUF_SIMPLE) == -1)
         return NULL;
 
-    if (!(sig = ECDSA_do_sign(vbuf, vlen, key))) {
+    Py_BEGIN_ALLOW_THREADS
+    sig = ECDSA_do_sign(vbuf.buf, (int)vbuf.len, key);
+    Py_END_ALLOW_THREADS
+    m2_PyBuffer_Release(value, &vbuf);
+
+    if (!sig) {
         m2_PyErr_Msg(_ec_err);
         return NULL;
     }
@@ -384,14 +391,14 @@ PyObject *ecdsa_sign(EC_KEY *key, PyObject *value) {
 }
 
 int ecdsa_verify(EC_KEY *key, PyObject *value, PyObject *r, PyObject *s) {
-    const void *vbuf, *rbuf, *sbuf;
-    int vlen, rlen, slen;
+    Py_buffer vbuf;
+    const void *rbuf, *sbuf;
+    int rlen, slen;
     ECDSA_SIG *sig;
     int ret;
     BIGNUM* pr, *ps;
 
-    if ((m2_PyObject_AsReadBufferInt(value, &vbuf, &vlen) == -1)
-        || (m2_PyObject_AsReadBufferInt(r, &rbuf, &rlen) == -1)
+    if ((m2_PyObject_AsReadBufferInt(r, &rbuf, &rlen) == -1)
         || (m2_PyObject_AsReadBufferInt(s, &sbuf, &slen) == -1))
         return -1;
 
@@ -418,7 +425,16 @@ int ecdsa_verify(EC_KEY *key, PyObject *value, PyObject *r, PyObject *s) {
         BN_free(ps);
         return -1;
     }
-    ret = ECDSA_do_verify(vbuf, vlen, sig, key);
+    if (m2_PyObject_GetBufferInt(value, &vbuf, PyBUF_SIMPLE) == -1) {
+        ECDSA_SIG_free(sig);
+        return -1;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    ret = ECDSA_do_verify(vbuf.buf, (int)vbuf.len, sig, key);
+    Py_END_ALLOW_THREADS
+
+    m2_PyBuffer_Release(value, &vbuf);
     ECDSA_SIG_free(sig);
     if (ret == -1)
         m2_PyErr_Msg(_ec_err);
@@ -427,20 +443,28 @@ int ecdsa_verify(EC_KEY *key, PyObject *value, PyObject *r, PyObject *s) {
 
 
 PyObject *ecdsa_sign_asn1(EC_KEY *key, PyObject *value) {
-    const void *vbuf;
-    int vlen;
+    Py_buffer vbuf;
     void *sigbuf;
     unsigned int siglen;
     PyObject *ret;
+    int ok;
 
-    if (m2_PyObject_AsReadBufferInt(value, &vbuf, &vlen) == -1)
+    if (m2_PyObject_GetBufferInt(value, &vbuf, PyBUF_SIMPLE) == -1)
         return NULL;
 
     if (!(sigbuf = PyMem_Malloc(ECDSA_size(key)))) {
+        m2_PyBuffer_Release(value, &vbuf);
         PyErr_SetString(PyExc_MemoryError, "ecdsa_sign_asn1");
         return NULL;
     }
-    if (!ECDSA_sign(0, vbuf, vlen, (unsigned char *)sigbuf, &siglen, key)) {
+
+    Py_BEGIN_ALLOW_THREADS
+    ok = ECDSA_sign(0, vbuf.buf, (int)vbuf.len, (unsigned char *)sigbuf,
+                    &siglen, key);
+    Py_END_ALLOW_THREADS
+    m2_PyBuffer_Release(value, &vbuf);
+
+    if (!ok) {
         m2_PyErr_Msg(_ec_err);
         PyMem_Free(sigbuf);
         return NULL;
@@ -457,16 +481,24 @@ PyObject *ecdsa_sign_asn1(EC_KEY *key, PyObject *value) {
 
 
 int ecdsa_verify_asn1(EC_KEY *key, PyObject *value, PyObject *sig) {
-    const void *vbuf;
-    void *sbuf;
-    int vlen, slen, ret;
+    Py_buffer vbuf, sbuf;
+    int ret;
 
-    if ((m2_PyObject_AsReadBufferInt(value, &vbuf, &vlen) == -1)
-        || (m2_PyObject_AsReadBufferInt(sig, (const void **)&sbuf, &slen)
-        == -1))
+    if (m2_PyObject_GetBufferInt(value, &vbuf, PyBUF_SIMPLE) == -1)
+        return -1;
+    if (m2_PyObject_GetBufferInt(sig, &sbuf, PyBUF_SIMPLE) == -1) {
+        m2_PyBuffer_Release(value, &vbuf);
         return -1;
+    }
 
-    if ((ret = ECDSA_verify(0, vbuf, vlen, sbuf, slen, key)) == -1)
+    Py_BEGIN_ALLOW_THREADS
+    ret = ECDSA_verify(0, vbuf.buf, (int)vbuf.len, sbuf.buf, (int)sbuf.len,
+                       key);
+    Py_END_ALLOW_THREADS
+
+    m2_PyBuffer_Release(sig, &sbuf);
+    m2_PyBuffer_Release(value, &vbuf);
+    if (ret == -1)
         m2_PyErr_Msg(_ec_err);
     return ret;
 }
@@ -508,6 +540,107 @@ PyObject *ecdh_compute_key(EC_KEY *keypairA, EC_KEY *pubkeyB) {
     return ret;
 }
 
+/* Derive the ECDH shared secrets of keypairA with every EC_KEY in the
+ * sequence pubkeys, with the GIL released. If kdf_md is given each secret
+ * is passed through the ANSI X9.63 KDF to kdflen bytes (the digest size
+ * if 0), with sinfo as SharedInfo. Returns the secrets concatenated in
+ * one bytes object. */
+PyObject *ecdh_compute_keys(EC_KEY *keypairA, PyObject *pubkeys,
+                            const EVP_MD *kdf_md, int kdflen,
+                            PyObject *sinfo) {
+    PyObject *seq, *ret = NULL;
+    const EC_POINT **points = NULL;
+    EC_KEY *pubkey;
+    unsigned char *secret = NULL, *out;
+    Py_buffer ibuf;
+    Py_ssize_t n, i, failed = -1;
+    int secretlen, outlen;
+
+    if (m2_PyObject_GetBufferInt(sinfo, &ibuf, PyBUF_SIMPLE) == -1)
+        return NULL;
+    if (!(seq = PySequence_Fast(pubkeys, "expected a sequence of EC keys"))) {
+        m2_PyBuffer_Release(sinfo, &ibuf);
+        return NULL;
+    }
+    n = PySequence_Fast_GET_SIZE(seq);
+
+    secretlen = (EC_GROUP_get_degree(EC_KEY_get0_group(keypairA)) + 7) / 8;
+    if (kdf_md == NULL) {
+        outlen = secretlen;
+    } else {
+#if OPENSSL_VERSION_NUMBER < 0x10002000L
+        PyErr_SetString(_ec_err, "KDF needs OpenSSL 1.0.2 or newer");
+        goto out;
+#endif
+        if (kdflen < 0) {
+            PyErr_SetString(PyExc_ValueError, "KDF length must be positive");
+            goto out;
+        }
+        outlen = kdflen ? kdflen : EVP_MD_size(kdf_md);
+    }
+
+    if (!(points = PyMem_Malloc((n + 1) * sizeof(*points)))
+        || !(secret = PyMem_Malloc(secretlen))) {
+        PyErr_SetString(PyExc_MemoryError, "ecdh_compute_keys");
+        goto out;
+    }
+    for (i = 0; i < n; i++) {
+        if (!SWIG_IsOK(SWIG_ConvertPtr(PySequence_Fast_GET_ITEM(seq, i),
+                                       (void **)&pubkey, SWIGTYPE_p_EC_KEY,
+                                       0))) {
+            PyErr_SetString(PyExc_TypeError, "expected a sequence of EC keys");
+            goto out;
+        }
+        if (!pubkey || !(points[i] = EC_KEY_get0_public_key(pubkey))) {
+            PyErr_SetString(_ec_err,
+                            "Cannot get the public key of EC_KEY object.");
+            goto out;
+        }
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    ret = PyBytes_FromStringAndSize(NULL, n * outlen);
+#else
+    ret = PyString_FromStringAndSize(NULL, n * outlen);
+#endif // PY_MAJOR_VERSION >= 3
+    if (!ret)
+        goto out;
+    out = (unsigned char *)PyBytes_AS_STRING(ret);
+
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < n; i++) {
+        if (ECDH_compute_key(secret, secretlen, points[i], keypairA,
+                             NULL) != secretlen) {
+            failed = i;
+            break;
+        }
+        if (kdf_md == NULL) {
+            memcpy(out + i * outlen, secret, secretlen);
+        }
+#if OPENSSL_VERSION_NUMBER >= 0x10002000L
+        else if (!ECDH_KDF_X9_62(out + i * outlen, outlen, secret, secretlen,
+                                 ibuf.buf, ibuf.len, kdf_md)) {
+            failed = i;
+            break;
+        }
+#endif
+    }
+    OPENSSL_cleanse(secret, secretlen);
+    Py_END_ALLOW_THREADS
+
+    if (failed != -1) {
+        m2_PyErr_Msg(_ec_err);
+        Py_CLEAR(ret);
+    }
+
+out:
+    PyMem_Free(secret);
+    PyMem_Free(points);
+    Py_DECREF(seq);
+    m2_PyBuffer_Release(sinfo, &ibuf);
+    return ret;
+}
+
 
 EC_KEY* ec_key_from_pubkey_der(PyObject *pubkey) {
     const void *keypairbuf;
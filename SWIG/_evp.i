@@ -13,6 +13,12 @@ Copyright (c) 2009-2010 Heikki Toivonen. All rights reserved.
 
 %{
 #include <assert.h>
+#include <errno.h>
+#ifdef _MSC_VER
+#include <io.h>
+#else
+#include <unistd.h>
+#endif
 #include <openssl/err.h>
 #include <openssl/evp.h>
 #include <openssl/hmac.h>
@@ -34,6 +40,13 @@ HMAC_CTX *HMAC_CTX_new(void) {
     } while(0)
 
 #define EVP_CIPHER_CTX_reset(ctx) EVP_CIPHER_CTX_init(ctx)
+#define EVP_CIPHER_CTX_encrypting(ctx) ((ctx)->encrypt)
+#endif
+
+#ifndef EVP_CTRL_AEAD_SET_IVLEN
+#define EVP_CTRL_AEAD_SET_IVLEN EVP_CTRL_GCM_SET_IVLEN
+#define EVP_CTRL_AEAD_GET_TAG EVP_CTRL_GCM_GET_TAG
+#define EVP_CTRL_AEAD_SET_TAG EVP_CTRL_GCM_SET_TAG
 #endif
 %}
 
@@ -163,6 +176,18 @@ extern const EVP_CIPHER *EVP_aes_256_cfb(void);
 extern const EVP_CIPHER *EVP_aes_256_ofb(void);
 %rename(aes_256_ctr) EVP_aes_256_ctr;
 extern EVP_CIPHER const *EVP_aes_256_ctr(void);
+#if OPENSSL_VERSION_NUMBER >= 0x10001000L
+%rename(aes_128_gcm) EVP_aes_128_gcm;
+extern const EVP_CIPHER *EVP_aes_128_gcm(void);
+%rename(aes_192_gcm) EVP_aes_192_gcm;
+extern const EVP_CIPHER *EVP_aes_192_gcm(void);
+%rename(aes_256_gcm) EVP_aes_256_gcm;
+extern const EVP_CIPHER *EVP_aes_256_gcm(void);
+#endif
+#if OPENSSL_VERSION_NUMBER >= 0x10100000L && !defined(OPENSSL_NO_CHACHA) && !defined(OPENSSL_NO_POLY1305)
+%rename(chacha20_poly1305) EVP_chacha20_poly1305;
+extern const EVP_CIPHER *EVP_chacha20_poly1305(void);
+#endif
 
 %rename(cipher_set_padding) EVP_CIPHER_CTX_set_padding;
 extern int EVP_CIPHER_CTX_set_padding(EVP_CIPHER_CTX *, int);
@@ -191,6 +216,11 @@ extern int EVP_PKEY_size(EVP_PKEY *);
 %inline %{
 #define PKCS5_SALT_LEN  8
 
+/* Buffers at least this long are processed with the GIL released;
+ * for shorter ones releasing and re-acquiring it costs more than
+ * the hashing or encryption itself. */
+#define M2_EVP_NOGIL_THRESHOLD 2048
+
 static PyObject *_evp_err;
 
 void evp_init(PyObject *evp_err) {
@@ -257,6 +287,53 @@ PyObject *pkcs5_pbkdf2_hmac_sha1(PyObject *pass,
     return ret;
 }
 
+/* PBKDF2 with any digest; the iterations run with the GIL released. */
+PyObject *pkcs5_pbkdf2_hmac(PyObject *pass, PyObject *salt, int iter,
+                            int keylen, const EVP_MD *md) {
+    unsigned char *key;
+    Py_buffer passbuf, saltbuf;
+    PyObject *ret = NULL;
+    int ok;
+
+    if (keylen <= 0 || iter <= 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "iterations and key length must be positive");
+        return NULL;
+    }
+    if (m2_PyObject_GetBufferInt(pass, &passbuf, PyBUF_SIMPLE) == -1)
+        return NULL;
+    if (m2_PyObject_GetBufferInt(salt, &saltbuf, PyBUF_SIMPLE) == -1) {
+        m2_PyBuffer_Release(pass, &passbuf);
+        return NULL;
+    }
+
+    key = PyMem_Malloc(keylen);
+    if (key == NULL) {
+        PyErr_NoMemory();
+        goto release;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    ok = PKCS5_PBKDF2_HMAC(passbuf.buf, (int)passbuf.len, saltbuf.buf,
+                           (int)saltbuf.len, iter, md, keylen, key);
+    Py_END_ALLOW_THREADS
+    if (ok) {
+#if PY_MAJOR_VERSION >= 3
+        ret = PyBytes_FromStringAndSize((char*)key, keylen);
+#else
+        ret = PyString_FromStringAndSize((char*)key, keylen);
+#endif
+    } else {
+        m2_PyErr_Msg(_evp_err);
+    }
+    OPENSSL_cleanse(key, keylen);
+    PyMem_Free(key);
+
+release:
+    m2_PyBuffer_Release(salt, &saltbuf);
+    m2_PyBuffer_Release(pass, &passbuf);
+    return ret;
+}
+
 EVP_MD_CTX *md_ctx_new(void) {
     EVP_MD_CTX *ctx;
 
@@ -271,14 +348,31 @@ void md_ctx_free(EVP_MD_CTX *ctx) {
     EVP_MD_CTX_destroy(ctx);
 }
 
+int md_ctx_copy(EVP_MD_CTX *out, EVP_MD_CTX *in) {
+    if (!EVP_MD_CTX_copy_ex(out, in)) {
+        m2_PyErr_Msg(_evp_err);
+        return -1;
+    }
+    return 1;
+}
+
 int digest_update(EVP_MD_CTX *ctx, PyObject *blob) {
-    const void *buf;
-    Py_ssize_t len;
+    Py_buffer buf;
+    int ret;
 
-    if (PyObject_AsReadBuffer(blob, &buf, &len) == -1)
+    if (m2_PyObject_GetBuffer(blob, &buf, PyBUF_SIMPLE) == -1)
         return -1;
 
-    return EVP_DigestUpdate(ctx, buf, len);
+    if (buf.len >= M2_EVP_NOGIL_THRESHOLD) {
+        Py_BEGIN_ALLOW_THREADS
+        ret = EVP_DigestUpdate(ctx, buf.buf, buf.len);
+        Py_END_ALLOW_THREADS
+    } else {
+        ret = EVP_DigestUpdate(ctx, buf.buf, buf.len);
+    }
+
+    m2_PyBuffer_Release(blob, &buf);
+    return ret;
 }
 
 PyObject *digest_final(EVP_MD_CTX *ctx) {
@@ -306,6 +400,27 @@ PyObject *digest_final(EVP_MD_CTX *ctx) {
     return ret;
 }
 
+int digest_final_into(EVP_MD_CTX *ctx, PyObject *out) {
+    Py_buffer obuf;
+    unsigned int blen;
+
+    if (PyObject_GetBuffer(out, &obuf, PyBUF_WRITABLE) == -1)
+        return -1;
+    if (obuf.len < EVP_MD_CTX_size(ctx)) {
+        PyBuffer_Release(&obuf);
+        PyErr_SetString(PyExc_ValueError, "output buffer too small");
+        return -1;
+    }
+    if (!EVP_DigestFinal(ctx, obuf.buf, &blen)) {
+        PyBuffer_Release(&obuf);
+        m2_PyErr_Msg(_evp_err);
+        return -1;
+    }
+
+    PyBuffer_Release(&obuf);
+    return (int)blen;
+}
+
 HMAC_CTX *hmac_ctx_new(void) {
     HMAC_CTX *ctx;
 
@@ -320,6 +435,14 @@ void hmac_ctx_free(HMAC_CTX *ctx) {
     HMAC_CTX_free(ctx);
 }
 
+int hmac_ctx_copy(HMAC_CTX *out, HMAC_CTX *in) {
+    if (!HMAC_CTX_copy(out, in)) {
+        PyErr_SetString(_evp_err, "HMAC_CTX_copy failed");
+        return -1;
+    }
+    return 1;
+}
+
 PyObject *hmac_init(HMAC_CTX *ctx, PyObject *key, const EVP_MD *md) {
     const void *kbuf;
     int klen;
@@ -335,13 +458,22 @@ PyObject *hmac_init(HMAC_CTX *ctx, PyObject *key, const EVP_MD *md) {
 }
 
 PyObject *hmac_update(HMAC_CTX *ctx, PyObject *blob) {
-    const void *buf;
-    Py_ssize_t len;
+    Py_buffer buf;
+    int ret;
 
-    if (PyObject_AsReadBuffer(blob, &buf, &len) == -1)
+    if (m2_PyObject_GetBuffer(blob, &buf, PyBUF_SIMPLE) == -1)
         return NULL;
 
-    if (!HMAC_Update(ctx, buf, len)) {
+    if (buf.len >= M2_EVP_NOGIL_THRESHOLD) {
+        Py_BEGIN_ALLOW_THREADS
+        ret = HMAC_Update(ctx, buf.buf, buf.len);
+        Py_END_ALLOW_THREADS
+    } else {
+        ret = HMAC_Update(ctx, buf.buf, buf.len);
+    }
+
+    m2_PyBuffer_Release(blob, &buf);
+    if (!ret) {
         PyErr_SetString(_evp_err, "HMAC_Update failed");
         return NULL;
     }
@@ -373,6 +505,27 @@ PyObject *hmac_final(HMAC_CTX *ctx) {
     return ret;
 }
 
+int hmac_final_into(HMAC_CTX *ctx, PyObject *out) {
+    Py_buffer obuf;
+    unsigned int blen;
+
+    if (PyObject_GetBuffer(out, &obuf, PyBUF_WRITABLE) == -1)
+        return -1;
+    if (obuf.len < (Py_ssize_t)HMAC_size(ctx)) {
+        PyBuffer_Release(&obuf);
+        PyErr_SetString(PyExc_ValueError, "output buffer too small");
+        return -1;
+    }
+    if (!HMAC_Final(ctx, obuf.buf, &blen)) {
+        PyBuffer_Release(&obuf);
+        PyErr_SetString(_evp_err, "HMAC_Final failed");
+        return -1;
+    }
+
+    PyBuffer_Release(&obuf);
+    return (int)blen;
+}
+
 PyObject *hmac(PyObject *key, PyObject *data, const EVP_MD *md) {
     const void *kbuf, *dbuf;
     void *blob;
@@ -454,6 +607,18 @@ PyObject *cipher_init(EVP_CIPHER_CTX *ctx, const EVP_CIPHER *cipher,
         || (PyObject_AsReadBuffer(iv, &ibuf, &ilen) == -1))
         return NULL;
 
+    if ((EVP_CIPHER_flags(cipher) & EVP_CIPH_FLAG_AEAD_CIPHER)
+        && ilen != EVP_CIPHER_iv_length(cipher)) {
+        /* AEAD nonces may have any length, but it has to be set before
+         * the nonce itself. */
+        if (!EVP_CipherInit(ctx, cipher, NULL, NULL, mode)
+            || !EVP_CIPHER_CTX_ctrl(ctx, EVP_CTRL_AEAD_SET_IVLEN,
+                                    (int)ilen, NULL)) {
+            m2_PyErr_Msg(_evp_err);
+            return NULL;
+        }
+        cipher = NULL;
+    }
     if (!EVP_CipherInit(ctx, cipher, (unsigned char *)kbuf,
                         (unsigned char *)ibuf, mode)) {
         m2_PyErr_Msg(_evp_err);
@@ -462,20 +627,225 @@ PyObject *cipher_init(EVP_CIPHER_CTX *ctx, const EVP_CIPHER *cipher,
     Py_RETURN_NONE;
 }
 
+/* Restart an initialised context with a new IV and/or key; None keeps
+ * the current one. The key schedule is only redone if key is given.
+ * AEAD encryption needs a fresh nonce every time. */
+PyObject *cipher_reinit(EVP_CIPHER_CTX *ctx, PyObject *key, PyObject *iv) {
+    const void *kbuf = NULL, *ibuf = NULL;
+    Py_ssize_t klen, ilen;
+
+    if (iv == Py_None
+        && (EVP_CIPHER_CTX_flags(ctx) & EVP_CIPH_FLAG_AEAD_CIPHER)
+        && EVP_CIPHER_CTX_encrypting(ctx)) {
+        PyErr_SetString(PyExc_ValueError,
+                        "AEAD encryption must not reuse the nonce");
+        return NULL;
+    }
+
+    if (key != Py_None) {
+        if (PyObject_AsReadBuffer(key, &kbuf, &klen) == -1)
+            return NULL;
+        if (klen != EVP_CIPHER_CTX_key_length(ctx)) {
+            PyErr_SetString(PyExc_ValueError, "invalid key length");
+            return NULL;
+        }
+    }
+    if (iv != Py_None) {
+        if (PyObject_AsReadBuffer(iv, &ibuf, &ilen) == -1)
+            return NULL;
+        if (ilen != EVP_CIPHER_CTX_iv_length(ctx)) {
+            if (!(EVP_CIPHER_CTX_flags(ctx) & EVP_CIPH_FLAG_AEAD_CIPHER)) {
+                PyErr_SetString(PyExc_ValueError, "invalid IV length");
+                return NULL;
+            }
+            if (!EVP_CIPHER_CTX_ctrl(ctx, EVP_CTRL_AEAD_SET_IVLEN,
+                                     (int)ilen, NULL)) {
+                m2_PyErr_Msg(_evp_err);
+                return NULL;
+            }
+        }
+    }
+
+    if (!EVP_CipherInit_ex(ctx, NULL, NULL, (unsigned char *)kbuf,
+                           (unsigned char *)ibuf, -1)) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+PyObject *cipher_update_aad(EVP_CIPHER_CTX *ctx, PyObject *blob) {
+    Py_buffer buf;
+    int olen, ok;
+
+    if (m2_PyObject_GetBufferInt(blob, &buf, PyBUF_SIMPLE) == -1)
+        return NULL;
+
+    ok = EVP_CipherUpdate(ctx, NULL, &olen, buf.buf, (int)buf.len);
+    m2_PyBuffer_Release(blob, &buf);
+    if (!ok) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+PyObject *cipher_get_tag(EVP_CIPHER_CTX *ctx, int taglen) {
+    unsigned char tag[EVP_MAX_BLOCK_LENGTH];
+
+    if (taglen <= 0 || taglen > EVP_MAX_BLOCK_LENGTH) {
+        PyErr_SetString(PyExc_ValueError, "invalid tag length");
+        return NULL;
+    }
+    if (!EVP_CIPHER_CTX_ctrl(ctx, EVP_CTRL_AEAD_GET_TAG, taglen, tag)) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    return PyBytes_FromStringAndSize((char *)tag, taglen);
+#else
+    return PyString_FromStringAndSize((char *)tag, taglen);
+#endif
+}
+
+PyObject *cipher_set_tag(EVP_CIPHER_CTX *ctx, PyObject *tag) {
+    const void *tbuf;
+    int tlen;
+
+    if (m2_PyObject_AsReadBufferInt(tag, &tbuf, &tlen) == -1)
+        return NULL;
+
+    if (tlen <= 0 || tlen > EVP_MAX_BLOCK_LENGTH) {
+        PyErr_SetString(PyExc_ValueError, "invalid tag length");
+        return NULL;
+    }
+    if (!EVP_CIPHER_CTX_ctrl(ctx, EVP_CTRL_AEAD_SET_TAG, tlen, (void *)tbuf)) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+/* One-shot AEAD encryption (mode 1) or decryption (mode 0). The tag is
+ * appended to the ciphertext on encryption and expected at its end on
+ * decryption. All of the OpenSSL work is done with the GIL released. */
+PyObject *aead_crypt(const EVP_CIPHER *cipher, PyObject *key,
+                     PyObject *nonce, PyObject *aad, PyObject *data,
+                     int taglen, int mode) {
+    EVP_CIPHER_CTX *ctx;
+    Py_buffer kbuf, nbuf, abuf, dbuf;
+    unsigned char *in, *out;
+    int inlen, olen, flen, ok;
+    PyObject *ret = NULL;
+
+    if (taglen <= 0 || taglen > EVP_MAX_BLOCK_LENGTH) {
+        PyErr_SetString(PyExc_ValueError, "invalid tag length");
+        return NULL;
+    }
+    if (m2_PyObject_GetBufferInt(key, &kbuf, PyBUF_SIMPLE) == -1)
+        return NULL;
+    if (m2_PyObject_GetBufferInt(nonce, &nbuf, PyBUF_SIMPLE) == -1)
+        goto release_key;
+    if (m2_PyObject_GetBufferInt(aad, &abuf, PyBUF_SIMPLE) == -1)
+        goto release_nonce;
+    if (m2_PyObject_GetBufferInt(data, &dbuf, PyBUF_SIMPLE) == -1)
+        goto release_aad;
+
+    if (kbuf.len != EVP_CIPHER_key_length(cipher)) {
+        PyErr_SetString(PyExc_ValueError, "invalid key length");
+        goto release_data;
+    }
+    in = dbuf.buf;
+    inlen = (int)dbuf.len;
+    if (mode) {
+        olen = inlen + taglen;
+    } else {
+        if (inlen < taglen) {
+            PyErr_SetString(_evp_err, "ciphertext too short");
+            goto release_data;
+        }
+        inlen -= taglen;
+        olen = inlen;
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    ret = PyBytes_FromStringAndSize(NULL, olen);
+#else
+    ret = PyString_FromStringAndSize(NULL, olen);
+#endif
+    if (ret == NULL)
+        goto release_data;
+#if PY_MAJOR_VERSION >= 3
+    out = (unsigned char *)PyBytes_AS_STRING(ret);
+#else
+    out = (unsigned char *)PyString_AS_STRING(ret);
+#endif
+
+    if (!(ctx = EVP_CIPHER_CTX_new())) {
+        Py_CLEAR(ret);
+        PyErr_SetString(PyExc_MemoryError, "aead_crypt");
+        goto release_data;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    ok = EVP_CipherInit_ex(ctx, cipher, NULL, NULL, NULL, mode)
+        && EVP_CIPHER_CTX_ctrl(ctx, EVP_CTRL_AEAD_SET_IVLEN,
+                               (int)nbuf.len, NULL)
+        && EVP_CipherInit_ex(ctx, NULL, NULL, kbuf.buf, nbuf.buf, mode)
+        && (mode || EVP_CIPHER_CTX_ctrl(ctx, EVP_CTRL_AEAD_SET_TAG, taglen,
+                                        in + inlen))
+        && (abuf.len == 0 || EVP_CipherUpdate(ctx, NULL, &flen, abuf.buf,
+                                              (int)abuf.len))
+        && EVP_CipherUpdate(ctx, out, &flen, in, inlen)
+        && EVP_CipherFinal_ex(ctx, out + flen, &flen)
+        && (!mode || EVP_CIPHER_CTX_ctrl(ctx, EVP_CTRL_AEAD_GET_TAG, taglen,
+                                         out + inlen));
+    Py_END_ALLOW_THREADS
+
+    EVP_CIPHER_CTX_free(ctx);
+    if (!ok) {
+        Py_CLEAR(ret);
+        if (mode || ERR_peek_error())
+            m2_PyErr_Msg(_evp_err);
+        else
+            PyErr_SetString(_evp_err, "authentication failed");
+    }
+
+release_data:
+    m2_PyBuffer_Release(data, &dbuf);
+release_aad:
+    m2_PyBuffer_Release(aad, &abuf);
+release_nonce:
+    m2_PyBuffer_Release(nonce, &nbuf);
+release_key:
+    m2_PyBuffer_Release(key, &kbuf);
+    return ret;
+}
+
 PyObject *cipher_update(EVP_CIPHER_CTX *ctx, PyObject *blob) {
-    const void *buf;
-    int len, olen;
+    Py_buffer buf;
+    int olen, ok;
     void *obuf;
     PyObject *ret;
 
-    if (m2_PyObject_AsReadBufferInt(blob, &buf, &len) == -1)
+    if (m2_PyObject_GetBufferInt(blob, &buf, PyBUF_SIMPLE) == -1)
         return NULL;
 
-    if (!(obuf = PyMem_Malloc(len + EVP_CIPHER_CTX_block_size(ctx) - 1))) {
+    if (!(obuf = PyMem_Malloc(buf.len + EVP_CIPHER_CTX_block_size(ctx) - 1))) {
+        m2_PyBuffer_Release(blob, &buf);
         PyErr_SetString(PyExc_MemoryError, "cipher_update");
         return NULL;
     }
-    if (!EVP_CipherUpdate(ctx, obuf, &olen, (unsigned char *)buf, len)) {
+    if (buf.len >= M2_EVP_NOGIL_THRESHOLD) {
+        Py_BEGIN_ALLOW_THREADS
+        ok = EVP_CipherUpdate(ctx, obuf, &olen, buf.buf, (int)buf.len);
+        Py_END_ALLOW_THREADS
+    } else {
+        ok = EVP_CipherUpdate(ctx, obuf, &olen, buf.buf, (int)buf.len);
+    }
+    m2_PyBuffer_Release(blob, &buf);
+    if (!ok) {
         PyMem_Free(obuf);
         m2_PyErr_Msg(_evp_err);
         return NULL;
@@ -516,6 +886,61 @@ PyObject *cipher_final(EVP_CIPHER_CTX *ctx) {
     return ret;
 }
 
+int cipher_update_into(EVP_CIPHER_CTX *ctx, PyObject *blob, PyObject *out) {
+    Py_buffer buf, obuf;
+    int olen, ok;
+
+    if (m2_PyObject_GetBufferInt(blob, &buf, PyBUF_SIMPLE) == -1)
+        return -1;
+    if (PyObject_GetBuffer(out, &obuf, PyBUF_WRITABLE) == -1) {
+        m2_PyBuffer_Release(blob, &buf);
+        return -1;
+    }
+    /* EVP_DecryptUpdate() may write a held back block on top of the
+     * input, so it needs a whole block more. */
+    if (obuf.len < buf.len + EVP_CIPHER_CTX_block_size(ctx)) {
+        PyBuffer_Release(&obuf);
+        m2_PyBuffer_Release(blob, &buf);
+        PyErr_SetString(PyExc_ValueError, "output buffer too small");
+        return -1;
+    }
+    if (buf.len >= M2_EVP_NOGIL_THRESHOLD) {
+        Py_BEGIN_ALLOW_THREADS
+        ok = EVP_CipherUpdate(ctx, obuf.buf, &olen, buf.buf, (int)buf.len);
+        Py_END_ALLOW_THREADS
+    } else {
+        ok = EVP_CipherUpdate(ctx, obuf.buf, &olen, buf.buf, (int)buf.len);
+    }
+    PyBuffer_Release(&obuf);
+    m2_PyBuffer_Release(blob, &buf);
+    if (!ok) {
+        m2_PyErr_Msg(_evp_err);
+        return -1;
+    }
+    return olen;
+}
+
+int cipher_final_into(EVP_CIPHER_CTX *ctx, PyObject *out) {
+    Py_buffer obuf;
+    int olen;
+
+    if (PyObject_GetBuffer(out, &obuf, PyBUF_WRITABLE) == -1)
+        return -1;
+    if (obuf.len < EVP_CIPHER_CTX_block_size(ctx)) {
+        PyBuffer_Release(&obuf);
+        PyErr_SetString(PyExc_ValueError, "output buffer too small");
+        return -1;
+    }
+    if (!EVP_CipherFinal(ctx, obuf.buf, &olen)) {
+        PyBuffer_Release(&obuf);
+        m2_PyErr_Msg(_evp_err);
+        return -1;
+    }
+
+    PyBuffer_Release(&obuf);
+    return olen;
+}
+
 PyObject *sign_update(EVP_MD_CTX *ctx, PyObject *blob) {
     const void *buf;
     Py_ssize_t len;
@@ -581,6 +1006,392 @@ int verify_final(EVP_MD_CTX *ctx, PyObject *blob, EVP_PKEY *pkey) {
 }
 %}
 
+/* The one-shot sign and verify functions take None as digest for key
+ * types like Ed25519 that hash the message themselves. */
+%typemap(check) const EVP_MD *sign_md "";
+
+%{
+/* Verify one signature; may be called without the GIL. Returns 1 for a
+ * good signature, 0 for a bad or malformed one and -1 if out of memory. */
+static int m2_pkey_verify_buf(EVP_PKEY *pkey, const EVP_MD *md,
+                              Py_buffer *data, Py_buffer *sig) {
+    EVP_MD_CTX *ctx;
+    int ret;
+
+    if (!(ctx = EVP_MD_CTX_create()))
+        return -1;
+
+    ret = EVP_DigestVerifyInit(ctx, NULL, md, NULL, pkey);
+#if OPENSSL_VERSION_NUMBER >= 0x10101000L
+    if (ret == 1)
+        ret = EVP_DigestVerify(ctx, sig->buf, sig->len, data->buf, data->len);
+#else
+    if (ret == 1)
+        ret = EVP_DigestVerifyUpdate(ctx, data->buf, data->len);
+    if (ret == 1)
+        ret = EVP_DigestVerifyFinal(ctx, sig->buf, sig->len);
+#endif
+
+    EVP_MD_CTX_destroy(ctx);
+    if (ret != 1) {
+        ERR_clear_error();
+        ret = 0;
+    }
+    return ret;
+}
+%}
+
+%inline %{
+/* One-shot hash-and-sign of data, done with the GIL released. */
+PyObject *pkey_sign(EVP_PKEY *pkey, const EVP_MD *sign_md, PyObject *data) {
+    EVP_MD_CTX *ctx;
+    Py_buffer dbuf;
+    unsigned char *sigbuf;
+    size_t siglen = EVP_PKEY_size(pkey);
+    PyObject *ret = NULL;
+    int ok;
+
+    if (m2_PyObject_GetBuffer(data, &dbuf, PyBUF_SIMPLE) == -1)
+        return NULL;
+    if (!(sigbuf = (unsigned char *)OPENSSL_malloc(siglen))) {
+        m2_PyBuffer_Release(data, &dbuf);
+        PyErr_SetString(PyExc_MemoryError, "pkey_sign");
+        return NULL;
+    }
+    if (!(ctx = EVP_MD_CTX_create())) {
+        OPENSSL_free(sigbuf);
+        m2_PyBuffer_Release(data, &dbuf);
+        PyErr_SetString(PyExc_MemoryError, "pkey_sign");
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+#if OPENSSL_VERSION_NUMBER >= 0x10101000L
+    ok = EVP_DigestSignInit(ctx, NULL, sign_md, NULL, pkey)
+        && EVP_DigestSign(ctx, sigbuf, &siglen, dbuf.buf, dbuf.len);
+#else
+    ok = EVP_DigestSignInit(ctx, NULL, sign_md, NULL, pkey)
+        && EVP_DigestSignUpdate(ctx, dbuf.buf, dbuf.len)
+        && EVP_DigestSignFinal(ctx, sigbuf, &siglen);
+#endif
+    Py_END_ALLOW_THREADS
+
+    EVP_MD_CTX_destroy(ctx);
+    m2_PyBuffer_Release(data, &dbuf);
+    if (ok) {
+#if PY_MAJOR_VERSION >= 3
+        ret = PyBytes_FromStringAndSize((char *)sigbuf, siglen);
+#else
+        ret = PyString_FromStringAndSize((char *)sigbuf, siglen);
+#endif
+    } else {
+        m2_PyErr_Msg(_evp_err);
+    }
+    OPENSSL_cleanse(sigbuf, siglen);
+    OPENSSL_free(sigbuf);
+    return ret;
+}
+
+/* One-shot hash-and-verify, done with the GIL released. Returns 1 for a
+ * good signature and 0 for a bad or malformed one. */
+int pkey_verify(EVP_PKEY *pkey, const EVP_MD *sign_md, PyObject *data,
+                PyObject *sig) {
+    Py_buffer dbuf, sbuf;
+    int ret;
+
+    if (m2_PyObject_GetBuffer(data, &dbuf, PyBUF_SIMPLE) == -1)
+        return -1;
+    if (m2_PyObject_GetBuffer(sig, &sbuf, PyBUF_SIMPLE) == -1) {
+        m2_PyBuffer_Release(data, &dbuf);
+        return -1;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    ret = m2_pkey_verify_buf(pkey, sign_md, &dbuf, &sbuf);
+    Py_END_ALLOW_THREADS
+
+    m2_PyBuffer_Release(sig, &sbuf);
+    m2_PyBuffer_Release(data, &dbuf);
+    if (ret == -1)
+        PyErr_SetString(PyExc_MemoryError, "pkey_verify");
+    return ret;
+}
+
+/* Verify a sequence of (data, signature) tuples against one key with the
+ * GIL released for the whole batch. Returns a list holding 1 for every
+ * good and 0 for every bad signature. */
+PyObject *pkey_verify_many(EVP_PKEY *pkey, const EVP_MD *sign_md,
+                           PyObject *pairs) {
+    PyObject *seq, *item, *ret = NULL;
+    Py_buffer *bufs = NULL;
+    int *results = NULL;
+    Py_ssize_t n, i, pinned = 0;
+    int failed = 0;
+
+    seq = PySequence_Fast(pairs, "expected a sequence of (data, signature)");
+    if (seq == NULL)
+        return NULL;
+    n = PySequence_Fast_GET_SIZE(seq);
+
+    bufs = PyMem_Malloc((2 * n + 1) * sizeof(Py_buffer));
+    results = PyMem_Malloc((n + 1) * sizeof(int));
+    if (bufs == NULL || results == NULL) {
+        PyErr_SetString(PyExc_MemoryError, "pkey_verify_many");
+        goto out;
+    }
+
+    /* The tuples are immutable and kept alive by seq, so their items
+     * stay valid until the buffers are released below. */
+    for (i = 0; i < n; i++) {
+        item = PySequence_Fast_GET_ITEM(seq, i);
+        if (!PyTuple_Check(item) || PyTuple_GET_SIZE(item) != 2) {
+            PyErr_SetString(PyExc_TypeError,
+                            "expected a sequence of (data, signature)");
+            goto out;
+        }
+        if (m2_PyObject_GetBuffer(PyTuple_GET_ITEM(item, 0), &bufs[pinned],
+                                  PyBUF_SIMPLE) == -1)
+            goto out;
+        pinned++;
+        if (m2_PyObject_GetBuffer(PyTuple_GET_ITEM(item, 1), &bufs[pinned],
+                                  PyBUF_SIMPLE) == -1)
+            goto out;
+        pinned++;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    for (i = 0; i < n && !failed; i++) {
+        results[i] = m2_pkey_verify_buf(pkey, sign_md, &bufs[2 * i],
+                                        &bufs[2 * i + 1]);
+        failed = results[i] == -1;
+    }
+    Py_END_ALLOW_THREADS
+
+    if (failed) {
+        PyErr_SetString(PyExc_MemoryError, "pkey_verify_many");
+        goto out;
+    }
+    if (!(ret = PyList_New(n)))
+        goto out;
+    for (i = 0; i < n; i++)
+        PyList_SET_ITEM(ret, i, PyInt_FromLong(results[i]));
+
+out:
+    for (i = 0; i < pinned; i++)
+        m2_PyBuffer_Release(
+            PyTuple_GET_ITEM(PySequence_Fast_GET_ITEM(seq, i / 2), i % 2),
+            &bufs[i]);
+    PyMem_Free(results);
+    PyMem_Free(bufs);
+    Py_DECREF(seq);
+    return ret;
+}
+%}
+
+%{
+/* Digest one message on an already allocated context, so that the batch
+ * functions below do not allocate a context per message. Returns -1 with
+ * a Python exception set on failure. */
+static int m2_digest_blob(EVP_MD_CTX *ctx, const EVP_MD *md, PyObject *blob,
+                          unsigned char *out, unsigned int *outlen) {
+    Py_buffer buf;
+    int ok;
+
+    if (m2_PyObject_GetBuffer(blob, &buf, PyBUF_SIMPLE) == -1)
+        return -1;
+
+    ok = EVP_DigestInit_ex(ctx, md, NULL)
+        && EVP_DigestUpdate(ctx, buf.buf, buf.len)
+        && EVP_DigestFinal_ex(ctx, out, outlen);
+
+    m2_PyBuffer_Release(blob, &buf);
+    if (!ok) {
+        m2_PyErr_Msg(_evp_err);
+        return -1;
+    }
+    return 0;
+}
+%}
+
+
+%inline %{
+PyObject *digest_many(const EVP_MD *md, PyObject *blobs) {
+    EVP_MD_CTX *ctx;
+    PyObject *iter, *item, *digest, *ret;
+    unsigned char blob[EVP_MAX_MD_SIZE];
+    unsigned int blen;
+
+    if (!(iter = PyObject_GetIter(blobs)))
+        return NULL;
+    if (!(ret = PyList_New(0))) {
+        Py_DECREF(iter);
+        return NULL;
+    }
+    if (!(ctx = EVP_MD_CTX_create())) {
+        Py_DECREF(ret);
+        Py_DECREF(iter);
+        PyErr_SetString(PyExc_MemoryError, "digest_many");
+        return NULL;
+    }
+
+    while ((item = PyIter_Next(iter)) != NULL) {
+        if (m2_digest_blob(ctx, md, item, blob, &blen) == -1) {
+            Py_DECREF(item);
+            goto fail;
+        }
+        Py_DECREF(item);
+
+#if PY_MAJOR_VERSION >= 3
+        digest = PyBytes_FromStringAndSize((char *)blob, blen);
+#else
+        digest = PyString_FromStringAndSize((char *)blob, blen);
+#endif
+        if (digest == NULL)
+            goto fail;
+        if (PyList_Append(ret, digest) == -1) {
+            Py_DECREF(digest);
+            goto fail;
+        }
+        Py_DECREF(digest);
+    }
+    if (PyErr_Occurred())
+        goto fail;
+
+    EVP_MD_CTX_destroy(ctx);
+    Py_DECREF(iter);
+    return ret;
+
+fail:
+    EVP_MD_CTX_destroy(ctx);
+    Py_DECREF(ret);
+    Py_DECREF(iter);
+    return NULL;
+}
+
+int digest_many_into(const EVP_MD *md, PyObject *blobs, PyObject *out) {
+    EVP_MD_CTX *ctx;
+    PyObject *iter, *item;
+    Py_buffer obuf;
+    unsigned char *dst;
+    unsigned int blen;
+    int mdlen, count = 0;
+
+    if (PyObject_GetBuffer(out, &obuf, PyBUF_WRITABLE) == -1)
+        return -1;
+    if (!(iter = PyObject_GetIter(blobs))) {
+        PyBuffer_Release(&obuf);
+        return -1;
+    }
+    if (!(ctx = EVP_MD_CTX_create())) {
+        Py_DECREF(iter);
+        PyBuffer_Release(&obuf);
+        PyErr_SetString(PyExc_MemoryError, "digest_many_into");
+        return -1;
+    }
+
+    mdlen = EVP_MD_size(md);
+    dst = obuf.buf;
+    while ((item = PyIter_Next(iter)) != NULL) {
+        if ((Py_ssize_t)(count + 1) * mdlen > obuf.len) {
+            Py_DECREF(item);
+            PyErr_SetString(PyExc_ValueError, "output buffer too small");
+            goto fail;
+        }
+        if (m2_digest_blob(ctx, md, item, dst, &blen) == -1) {
+            Py_DECREF(item);
+            goto fail;
+        }
+        Py_DECREF(item);
+        dst += blen;
+        count++;
+    }
+    if (PyErr_Occurred())
+        goto fail;
+
+    EVP_MD_CTX_destroy(ctx);
+    Py_DECREF(iter);
+    PyBuffer_Release(&obuf);
+    return count;
+
+fail:
+    EVP_MD_CTX_destroy(ctx);
+    Py_DECREF(iter);
+    PyBuffer_Release(&obuf);
+    return -1;
+}
+%}
+
+%inline %{
+/* Digest up to length bytes (everything up to EOF if length is negative)
+ * read from fd. The whole read/update loop runs with the GIL released. */
+PyObject *digest_fd(const EVP_MD *md, int fd, int chunk_size,
+                    long long length) {
+    EVP_MD_CTX *ctx;
+    unsigned char *buf;
+    unsigned char blob[EVP_MAX_MD_SIZE];
+    unsigned int blen;
+    int n, toread, ok, err = 0;
+    PyObject *ret;
+
+    if (chunk_size <= 0) {
+        PyErr_SetString(PyExc_ValueError, "chunk_size must be positive");
+        return NULL;
+    }
+    if (!(buf = PyMem_Malloc(chunk_size))) {
+        PyErr_SetString(PyExc_MemoryError, "digest_fd");
+        return NULL;
+    }
+    if (!(ctx = EVP_MD_CTX_create())) {
+        PyMem_Free(buf);
+        PyErr_SetString(PyExc_MemoryError, "digest_fd");
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    ok = EVP_DigestInit_ex(ctx, md, NULL);
+    while (ok && length != 0) {
+        toread = chunk_size;
+        if (length > 0 && length < toread)
+            toread = (int)length;
+        n = read(fd, buf, toread);
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            err = errno;
+            break;
+        }
+        if (n == 0)
+            break;
+        ok = EVP_DigestUpdate(ctx, buf, n);
+        if (length > 0)
+            length -= n;
+    }
+    if (ok && !err)
+        ok = EVP_DigestFinal_ex(ctx, blob, &blen);
+    Py_END_ALLOW_THREADS
+
+    EVP_MD_CTX_destroy(ctx);
+    PyMem_Free(buf);
+
+    if (err) {
+        errno = err;
+        return PyErr_SetFromErrno(PyExc_OSError);
+    }
+    if (!ok) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+
+#if PY_MAJOR_VERSION >= 3
+    ret = PyBytes_FromStringAndSize((char *)blob, blen);
+#else
+    ret = PyString_FromStringAndSize((char *)blob, blen);
+#endif
+
+    return ret;
+}
+%}
+
 %typemap(out) EVP_MD * {
     PyObject *self = NULL; /* bug in SWIG_NewPointerObj as of 3.0.5 */
 
@@ -686,13 +1497,159 @@ EVP_PKEY *pkey_read_pem_pubkey(BIO *f, PyObject *pyfunc) {
     return pk;
 }
 %}
+
+#if OPENSSL_VERSION_NUMBER >= 0x10101000L
+%constant int EVP_PKEY_ED25519 = EVP_PKEY_ED25519;
+%constant int EVP_PKEY_X25519 = EVP_PKEY_X25519;
+
+%inline %{
+/* Generate a key of a type that takes no parameters, like Ed25519. */
+EVP_PKEY *pkey_keygen(int type) {
+    EVP_PKEY_CTX *ctx;
+    EVP_PKEY *pk = NULL;
+    int ok;
+
+    if (!(ctx = EVP_PKEY_CTX_new_id(type, NULL))) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    ok = EVP_PKEY_keygen_init(ctx) > 0 && EVP_PKEY_keygen(ctx, &pk) > 0;
+    Py_END_ALLOW_THREADS
+
+    EVP_PKEY_CTX_free(ctx);
+    if (!ok) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+    return pk;
+}
+
+EVP_PKEY *pkey_new_raw_private_key(int type, PyObject *key) {
+    Py_buffer kbuf;
+    EVP_PKEY *pk;
+
+    if (m2_PyObject_GetBuffer(key, &kbuf, PyBUF_SIMPLE) == -1)
+        return NULL;
+    pk = EVP_PKEY_new_raw_private_key(type, NULL, kbuf.buf, kbuf.len);
+    m2_PyBuffer_Release(key, &kbuf);
+    if (pk == NULL)
+        m2_PyErr_Msg(_evp_err);
+    return pk;
+}
+
+EVP_PKEY *pkey_new_raw_public_key(int type, PyObject *key) {
+    Py_buffer kbuf;
+    EVP_PKEY *pk;
+
+    if (m2_PyObject_GetBuffer(key, &kbuf, PyBUF_SIMPLE) == -1)
+        return NULL;
+    pk = EVP_PKEY_new_raw_public_key(type, NULL, kbuf.buf, kbuf.len);
+    m2_PyBuffer_Release(key, &kbuf);
+    if (pk == NULL)
+        m2_PyErr_Msg(_evp_err);
+    return pk;
+}
+%}
+#endif
 %typemap(out) EVP_PKEY * ;
 
+%rename(pkey_base_id) EVP_PKEY_base_id;
+extern int EVP_PKEY_base_id(const EVP_PKEY *);
+
 %inline %{
 int pkey_assign_rsa(EVP_PKEY *pkey, RSA *rsa) {
     return EVP_PKEY_assign_RSA(pkey, rsa);
 }
 
+/* Derive the shared secret of key pair pkey and the public key peer
+ * (X25519, EC or DH) with the GIL released. */
+PyObject *pkey_derive(EVP_PKEY *pkey, EVP_PKEY *peer) {
+    EVP_PKEY_CTX *ctx;
+    unsigned char *secret = NULL;
+    size_t secretlen = 0;
+    PyObject *ret = NULL;
+    int ok;
+
+    if (!(ctx = EVP_PKEY_CTX_new(pkey, NULL))) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+
+    Py_BEGIN_ALLOW_THREADS
+    ok = EVP_PKEY_derive_init(ctx) > 0
+        && EVP_PKEY_derive_set_peer(ctx, peer) > 0
+        && EVP_PKEY_derive(ctx, NULL, &secretlen) > 0
+        && (secret = OPENSSL_malloc(secretlen)) != NULL
+        && EVP_PKEY_derive(ctx, secret, &secretlen) > 0;
+    Py_END_ALLOW_THREADS
+
+    EVP_PKEY_CTX_free(ctx);
+    if (ok) {
+#if PY_MAJOR_VERSION >= 3
+        ret = PyBytes_FromStringAndSize((char *)secret, secretlen);
+#else
+        ret = PyString_FromStringAndSize((char *)secret, secretlen);
+#endif
+    } else {
+        m2_PyErr_Msg(_evp_err);
+    }
+    if (secret) {
+        OPENSSL_cleanse(secret, secretlen);
+        OPENSSL_free(secret);
+    }
+    return ret;
+}
+
+#if OPENSSL_VERSION_NUMBER >= 0x10101000L
+PyObject *pkey_get_raw_public_key(EVP_PKEY *pkey) {
+    size_t len = 0;
+    PyObject *ret;
+
+    if (EVP_PKEY_get_raw_public_key(pkey, NULL, &len) != 1) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (!(ret = PyBytes_FromStringAndSize(NULL, len)))
+#else
+    if (!(ret = PyString_FromStringAndSize(NULL, len)))
+#endif
+        return NULL;
+    if (EVP_PKEY_get_raw_public_key(
+            pkey, (unsigned char *)PyBytes_AS_STRING(ret), &len) != 1) {
+        Py_DECREF(ret);
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+    return ret;
+}
+
+PyObject *pkey_get_raw_private_key(EVP_PKEY *pkey) {
+    size_t len = 0;
+    PyObject *ret;
+
+    if (EVP_PKEY_get_raw_private_key(pkey, NULL, &len) != 1) {
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (!(ret = PyBytes_FromStringAndSize(NULL, len)))
+#else
+    if (!(ret = PyString_FromStringAndSize(NULL, len)))
+#endif
+        return NULL;
+    if (EVP_PKEY_get_raw_private_key(
+            pkey, (unsigned char *)PyBytes_AS_STRING(ret), &len) != 1) {
+        Py_DECREF(ret);
+        m2_PyErr_Msg(_evp_err);
+        return NULL;
+    }
+    return ret;
+}
+#endif
+
 PyObject *pkey_as_der(EVP_PKEY *pkey) {
     unsigned char * pp = NULL;
     int len;
@@ -114,6 +114,7 @@ void blob_free(Blob *blob) {
 %ignore PyObject_GetBuffer;
 %ignore PyBuffer_Release;
 %ignore m2_PyObject_AsReadBufferInt;
+%ignore m2_PyObject_GetBuffer;
 %ignore m2_PyObject_GetBufferInt;
 %ignore m2_PyBuffer_Release;
 %ignore m2_PyString_AsStringAndSizeInt;
@@ -137,7 +138,10 @@ m2_PyObject_AsReadBufferInt(PyObject *obj, const void **buffer,
     return 0;
 }
 
-static int m2_PyObject_GetBufferInt(PyObject *obj, Py_buffer *view, int flags)
+/* Unlike m2_PyObject_AsReadBufferInt() the buffer stays pinned (e.g.
+ * a bytearray cannot be resized) until m2_PyBuffer_Release() is called,
+ * so it is safe to use it with the GIL released. */
+static int m2_PyObject_GetBuffer(PyObject *obj, Py_buffer *view, int flags)
 {
     int ret;
 
@@ -150,6 +154,14 @@ static int m2_PyObject_GetBufferInt(PyObject *obj, Py_buffer *view, int flags)
 	if (ret == 0)
 	    view->buf = (void *)buf;
     }
+    return ret;
+}
+
+static int m2_PyObject_GetBufferInt(PyObject *obj, Py_buffer *view, int flags)
+{
+    int ret;
+
+    ret = m2_PyObject_GetBuffer(obj, view, flags);
     if (ret)
 	return ret;
     if (view->len > INT_MAX) {
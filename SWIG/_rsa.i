@@ -222,20 +222,24 @@ PyObject *rsa_set_en_bin(RSA *rsa, PyObject *eval, PyObject* nval) {
 }
 
 PyObject *rsa_private_encrypt(RSA *rsa, PyObject *from, int padding) {
-    const void *fbuf;
+    Py_buffer fbuf;
     void *tbuf;
-    int flen, tlen;
+    int tlen;
     PyObject *ret;
 
-    if (m2_PyObject_AsReadBufferInt(from, &fbuf, &flen) == -1)
+    if (m2_PyObject_GetBufferInt(from, &fbuf, PyBUF_SIMPLE) == -1)
         return NULL;
 
     if (!(tbuf = PyMem_Malloc(RSA_size(rsa)))) {
+        m2_PyBuffer_Release(from, &fbuf);
         PyErr_SetString(PyExc_MemoryError, "rsa_private_encrypt");
         return NULL;
     }
-    tlen = RSA_private_encrypt(flen, (unsigned char *)fbuf,
+    Py_BEGIN_ALLOW_THREADS
+    tlen = RSA_private_encrypt((int)fbuf.len, (unsigned char *)fbuf.buf,
         (unsigned char *)tbuf, rsa, padding);
+    Py_END_ALLOW_THREADS
+    m2_PyBuffer_Release(from, &fbuf);
     if (tlen == -1) {
         m2_PyErr_Msg(_rsa_err);
         PyMem_Free(tbuf);
@@ -253,23 +257,27 @@ PyObject *rsa_private_encrypt(RSA *rsa, PyObject *from, int padding) {
 }
 
 PyObject *rsa_public_decrypt(RSA *rsa, PyObject *from, int padding) {
-    const void *fbuf;
+    Py_buffer fbuf;
     void *tbuf;
-    int flen, tlen;
+    int tlen;
     PyObject *ret;
 
-    if (m2_PyObject_AsReadBufferInt(from, &fbuf, &flen) == -1)
+    if (m2_PyObject_GetBufferInt(from, &fbuf, PyBUF_SIMPLE) == -1)
         return NULL;
 
     /* OpenSSL docs are confused here: it says we only need buffer
      * 'RSA_size()-11', but it is true only for RSA PKCS#1 type 1
      * padding. For other uses we need to use different sizes. */
     if (!(tbuf = PyMem_Malloc(RSA_size(rsa)))) {
+        m2_PyBuffer_Release(from, &fbuf);
         PyErr_SetString(PyExc_MemoryError, "rsa_public_decrypt");
         return NULL;
     }
-    tlen = RSA_public_decrypt(flen, (unsigned char *)fbuf,
+    Py_BEGIN_ALLOW_THREADS
+    tlen = RSA_public_decrypt((int)fbuf.len, (unsigned char *)fbuf.buf,
         (unsigned char *)tbuf, rsa, padding);
+    Py_END_ALLOW_THREADS
+    m2_PyBuffer_Release(from, &fbuf);
     if (tlen == -1) {
         m2_PyErr_Msg(_rsa_err);
         PyMem_Free(tbuf);
@@ -287,20 +295,24 @@ PyObject *rsa_public_decrypt(RSA *rsa, PyObject *from, int padding) {
 }
 
 PyObject *rsa_public_encrypt(RSA *rsa, PyObject *from, int padding) {
-    const void *fbuf;
+    Py_buffer fbuf;
     void *tbuf;
-    int flen, tlen;
+    int tlen;
     PyObject *ret;
 
-    if (m2_PyObject_AsReadBufferInt(from, &fbuf, &flen) == -1)
+    if (m2_PyObject_GetBufferInt(from, &fbuf, PyBUF_SIMPLE) == -1)
         return NULL;
 
     if (!(tbuf = PyMem_Malloc(RSA_size(rsa)))) {
+        m2_PyBuffer_Release(from, &fbuf);
         PyErr_SetString(PyExc_MemoryError, "rsa_public_encrypt");
         return NULL;
     }
-    tlen = RSA_public_encrypt(flen, (unsigned char *)fbuf,
+    Py_BEGIN_ALLOW_THREADS
+    tlen = RSA_public_encrypt((int)fbuf.len, (unsigned char *)fbuf.buf,
         (unsigned char *)tbuf, rsa, padding);
+    Py_END_ALLOW_THREADS
+    m2_PyBuffer_Release(from, &fbuf);
     if (tlen == -1) {
         m2_PyErr_Msg(_rsa_err);
         PyMem_Free(tbuf);
@@ -318,20 +330,24 @@ PyObject *rsa_public_encrypt(RSA *rsa, PyObject *from, int padding) {
 }
 
 PyObject *rsa_private_decrypt(RSA *rsa, PyObject *from, int padding) {
-    const void *fbuf;
+    Py_buffer fbuf;
     void *tbuf;
-    int flen, tlen;
+    int tlen;
     PyObject *ret;
 
-    if (m2_PyObject_AsReadBufferInt(from, &fbuf, &flen) == -1)
+    if (m2_PyObject_GetBufferInt(from, &fbuf, PyBUF_SIMPLE) == -1)
         return NULL;
 
     if (!(tbuf = PyMem_Malloc(RSA_size(rsa)))) {
+        m2_PyBuffer_Release(from, &fbuf);
         PyErr_SetString(PyExc_MemoryError, "rsa_private_decrypt");
         return NULL;
     }
-    tlen = RSA_private_decrypt(flen, (unsigned char *)fbuf,
+    Py_BEGIN_ALLOW_THREADS
+    tlen = RSA_private_decrypt((int)fbuf.len, (unsigned char *)fbuf.buf,
         (unsigned char *)tbuf, rsa, padding);
+    Py_END_ALLOW_THREADS
+    m2_PyBuffer_Release(from, &fbuf);
     if (tlen == -1) {
         m2_PyErr_Msg(_rsa_err);
         PyMem_Free(tbuf);
@@ -349,26 +365,30 @@ PyObject *rsa_private_decrypt(RSA *rsa, PyObject *from, int padding) {
 
 #if OPENSSL_VERSION_NUMBER >= 0x0090708fL
 PyObject *rsa_padding_add_pkcs1_pss(RSA *rsa, PyObject *digest, EVP_MD *hash, int salt_length) {
-    const void *dbuf;
+    Py_buffer dbuf;
     unsigned char *tbuf;
-    int dlen, result, tlen;
+    int result, tlen;
     PyObject *ret;
 
-    if (m2_PyObject_AsReadBufferInt(digest, &dbuf, &dlen) == -1)
+    if (m2_PyObject_GetBufferInt(digest, &dbuf, PyBUF_SIMPLE) == -1)
         return NULL;
 
     tlen = RSA_size(rsa);
 
     if (!(tbuf = OPENSSL_malloc(tlen))) {
+        m2_PyBuffer_Release(digest, &dbuf);
         PyErr_SetString(PyExc_MemoryError, "rsa_padding_add_pkcs1_pss");
         return NULL;
     }
+    Py_BEGIN_ALLOW_THREADS
     result = RSA_padding_add_PKCS1_PSS(
         rsa,
         tbuf,
-        (unsigned char *)dbuf,
+        (unsigned char *)dbuf.buf,
         hash,
         salt_length);
+    Py_END_ALLOW_THREADS
+    m2_PyBuffer_Release(digest, &dbuf);
 
     if (result == -1) {
         m2_PyErr_Msg(_rsa_err);
@@ -387,24 +407,29 @@ PyObject *rsa_padding_add_pkcs1_pss(RSA *rsa, PyObject *digest, EVP_MD *hash, in
 }
 
 int rsa_verify_pkcs1_pss(RSA *rsa, PyObject *digest, PyObject *signature, EVP_MD *hash, int salt_length) {
-    const void *dbuf;
-    const void *sbuf;
-    int dlen, slen, ret;
+    Py_buffer dbuf, sbuf;
+    int ret;
 
-    if (m2_PyObject_AsReadBufferInt(digest, &dbuf, &dlen) == -1) {
+    if (m2_PyObject_GetBufferInt(digest, &dbuf, PyBUF_SIMPLE) == -1) {
         return 0;
     }
 
-    if (m2_PyObject_AsReadBufferInt(signature, &sbuf, &slen) == -1) {
+    if (m2_PyObject_GetBufferInt(signature, &sbuf, PyBUF_SIMPLE) == -1) {
+        m2_PyBuffer_Release(digest, &dbuf);
         return 0;
     }
 
+    Py_BEGIN_ALLOW_THREADS
     ret = RSA_verify_PKCS1_PSS(
         rsa,
-        (unsigned char *)dbuf,
+        (unsigned char *)dbuf.buf,
         hash,
-        (unsigned char *)sbuf,
+        (unsigned char *)sbuf.buf,
         salt_length);
+    Py_END_ALLOW_THREADS
+
+    m2_PyBuffer_Release(signature, &sbuf);
+    m2_PyBuffer_Release(digest, &dbuf);
 
     return ret;
 }
@@ -427,9 +452,16 @@ PyObject *rsa_sign(RSA *rsa, PyObject *py_digest_string, int method_type) {
     }
 
     buf_len = RSA_size(rsa);
-    sign_buf = (unsigned char *)PyMem_Malloc(buf_len);
+    if (!(sign_buf = (unsigned char *)PyMem_Malloc(buf_len))) {
+        PyErr_SetString(PyExc_MemoryError, "rsa_sign");
+        return NULL;
+    }
+    /* digest_string points into an immutable bytes object, so it stays
+     * valid while the GIL is released. */
+    Py_BEGIN_ALLOW_THREADS
     ret = RSA_sign(method_type, (const unsigned char *)digest_string, digest_len,
                    sign_buf, &real_buf_len, rsa);
+    Py_END_ALLOW_THREADS
 
     if (!ret) {
         m2_PyErr_Msg(_rsa_err);
@@ -466,9 +498,11 @@ int rsa_verify(RSA *rsa, PyObject *py_verify_string, PyObject* py_sign_string, i
         return 0;
     }
 
+    Py_BEGIN_ALLOW_THREADS
     ret = RSA_verify(method_type, (unsigned char *) verify_string,
                      verify_len, (unsigned char *) sign_string,
                      sign_len, rsa);
+    Py_END_ALLOW_THREADS
     if (!ret) {
         m2_PyErr_Msg(_rsa_err);
         return 0;
@@ -476,13 +510,20 @@ int rsa_verify(RSA *rsa, PyObject *py_verify_string, PyObject* py_sign_string, i
     return ret;
 }
 
-PyObject *rsa_generate_key(int bits, unsigned long e, PyObject *pyfunc) {
+/* With callback None no progress is reported and the GIL is released
+ * while the primes are searched for. */
+PyObject *rsa_generate_key(int bits, unsigned long e, PyObject *callback) {
     RSA *rsa;
     PyObject *self = NULL; /* bug in SWIG_NewPointerObj as of 3.0.5 */
     BN_GENCB *gencb;
     BIGNUM *e_big;
     int ret;
 
+    if (callback != Py_None && !PyCallable_Check(callback)) {
+        PyErr_SetString(PyExc_TypeError, "expected PyCallable");
+        return NULL;
+    }
+
     if ((e_big=BN_new()) == NULL) {
         m2_PyErr_Msg(_rsa_err);
         return NULL;
@@ -507,13 +548,18 @@ PyObject *rsa_generate_key(int bits, unsigned long e, PyObject *pyfunc) {
         return NULL;
     }
 
-    BN_GENCB_set(gencb, bn_gencb_callback, (void *) pyfunc);
-
-    Py_INCREF(pyfunc);
-    ret = RSA_generate_key_ex(rsa, bits, e_big, gencb);
+    if (callback == Py_None) {
+        Py_BEGIN_ALLOW_THREADS
+        ret = RSA_generate_key_ex(rsa, bits, e_big, NULL);
+        Py_END_ALLOW_THREADS
+    } else {
+        BN_GENCB_set(gencb, bn_gencb_callback, (void *) callback);
+        Py_INCREF(callback);
+        ret = RSA_generate_key_ex(rsa, bits, e_big, gencb);
+        Py_DECREF(callback);
+    }
     BN_free(e_big);
     BN_GENCB_free(gencb);
-    Py_DECREF(pyfunc);
 
     if (ret)
         return SWIG_NewPointerObj((void *)rsa, SWIGTYPE_p_RSA, 0);
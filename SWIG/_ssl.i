@@ -25,8 +25,25 @@ typedef unsigned __int64 uint64_t;
 #include <openssl/x509.h>
 #ifndef _MSC_VER
 #include <poll.h>
+#include <sys/stat.h>
 #include <sys/time.h>
+#include <unistd.h>
+#else
+#include <io.h>
+#endif
+
+/* ssl_sendfile() reads the file in chunks of this many bytes. */
+#define M2_SENDFILE_CHUNK (4 * SSL3_RT_MAX_PLAIN_LENGTH)
+
+static Py_ssize_t m2_pread(int fd, void *buf, size_t len, long long offset) {
+#ifdef _MSC_VER
+    if (_lseeki64(fd, offset, SEEK_SET) == -1)
+        return -1;
+    return _read(fd, buf, (unsigned int)len);
+#else
+    return pread(fd, buf, len, (off_t)offset);
 #endif
+}
 %}
 
 #if OPENSSL_VERSION_NUMBER >= 0x10100005L
@@ -704,7 +721,6 @@ PyObject *ssl_read(SSL *ssl, int num, double timeout) {
     Py_END_ALLOW_THREADS
 
     if (r >= 0) {
-        buf = PyMem_Realloc(buf, r);
 #if PY_MAJOR_VERSION >= 3
         obj = PyBytes_FromStringAndSize(buf, r);
 #else
@@ -764,8 +780,6 @@ PyObject *ssl_read_nbio(SSL *ssl, int num) {
     switch (SSL_get_error(ssl, r)) {
         case SSL_ERROR_NONE:
         case SSL_ERROR_ZERO_RETURN:
-            buf = PyMem_Realloc(buf, r);
-
 #if PY_MAJOR_VERSION >= 3
             obj = PyBytes_FromStringAndSize(buf, r);
 #else
@@ -800,6 +814,70 @@ PyObject *ssl_read_nbio(SSL *ssl, int num) {
     return obj;
 }
 
+/* Read up to num bytes (the whole buffer if num is 0) directly into
+ * the writable buffer object. Returns the number of bytes read, or
+ * None if the read would block and timeout <= 0. */
+PyObject *ssl_read_into(SSL *ssl, PyObject *buffer, int num, double timeout) {
+    PyObject *obj = NULL;
+    Py_buffer view;
+    int r, ssl_err;
+    struct timeval tv;
+
+    if (!PyObject_CheckBuffer(buffer) ||
+        PyObject_GetBuffer(buffer, &view, PyBUF_WRITABLE) == -1) {
+        PyErr_SetString(PyExc_TypeError, "a writable buffer is required");
+        return NULL;
+    }
+    if (view.len > INT_MAX) {
+        PyErr_SetString(PyExc_ValueError, "object too large");
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    if (num < 0 || num > view.len) {
+        PyErr_SetString(PyExc_ValueError,
+                        "buffer too small for requested bytes");
+        goto out;
+    }
+    if (num == 0)
+        num = (int)view.len;
+    if (num == 0) {
+        obj = PyInt_FromLong(0L);
+        goto out;
+    }
+
+    if (timeout > 0)
+        gettimeofday(&tv, NULL);
+ again:
+    Py_BEGIN_ALLOW_THREADS
+    r = SSL_read(ssl, view.buf, num);
+    ssl_err = SSL_get_error(ssl, r);
+    Py_END_ALLOW_THREADS
+
+    if (r >= 0) {
+        obj = PyInt_FromLong((long)r);
+    } else {
+        switch (ssl_err) {
+            case SSL_ERROR_WANT_WRITE:
+            case SSL_ERROR_WANT_READ:
+            case SSL_ERROR_WANT_X509_LOOKUP:
+                if (timeout <= 0) {
+                    Py_INCREF(Py_None);
+                    obj = Py_None;
+                    break;
+                }
+                if (ssl_sleep_with_timeout(ssl, &tv, timeout, ssl_err) == 0)
+                    goto again;
+                break;
+            default:
+                ssl_handle_error(ssl_err, r);
+        }
+    }
+ out:
+    PyBuffer_Release(&view);
+    return obj;
+}
+
 int ssl_write(SSL *ssl, PyObject *blob, double timeout) {
     Py_buffer buf;
     int r, ssl_err, ret;
@@ -890,6 +968,426 @@ int ssl_write_nbio(SSL *ssl, PyObject *blob) {
     return ret;
 }
 
+/* Write all buffers in the sequence, packed into records of the
+ * maximum size: small buffers are gathered into a staging buffer, runs
+ * of whole records are written straight from the caller's memory.
+ * Returns the number of bytes written, which may be short if the write
+ * would block and timeout <= 0, or -1 if nothing could be written. */
+PyObject *ssl_write_many(SSL *ssl, PyObject *buffers, double timeout) {
+    PyObject *seq, *obj = NULL;
+    Py_buffer *views;
+    Py_ssize_t n, nviews = 0, i, off, written = 0;
+    char *stage = NULL;
+    int staged = 0, blocked = 0, direct, len, r, ssl_err;
+    long mode = SSL_get_mode(ssl);
+    const char *data;
+    struct timeval tv;
+
+    if (!(seq = PySequence_Fast(buffers, "buffers must be a sequence")))
+        return NULL;
+    n = PySequence_Fast_GET_SIZE(seq);
+    if (!(views = PyMem_Malloc((n ? n : 1) * sizeof(Py_buffer)))) {
+        PyErr_SetString(PyExc_MemoryError, "ssl_write_many");
+        goto out;
+    }
+    for (; nviews < n; nviews++) {
+        PyObject *item = PySequence_Fast_GET_ITEM(seq, nviews);
+
+        if (m2_PyObject_GetBuffer(item, &views[nviews], PyBUF_CONTIG_RO) == -1)
+            goto out;
+    }
+    if (!(stage = PyMem_Malloc(SSL3_RT_MAX_PLAIN_LENGTH))) {
+        PyErr_SetString(PyExc_MemoryError, "ssl_write_many");
+        goto out;
+    }
+
+    /* The staging buffer is new on each call, so a write retried after
+     * WANT_WRITE comes from a different address. The mode is only set
+     * for this call, so that other writes keep their retry rules. */
+    SSL_set_mode(ssl, SSL_MODE_ACCEPT_MOVING_WRITE_BUFFER);
+
+    if (timeout > 0)
+        gettimeofday(&tv, NULL);
+    i = 0;
+    off = 0;
+    for (;;) {
+        while (i < n && off == views[i].len) {
+            i++;
+            off = 0;
+        }
+        if (staged == 0 && i < n &&
+            views[i].len - off >= SSL3_RT_MAX_PLAIN_LENGTH) {
+            Py_ssize_t run = views[i].len - off;
+
+            if (run > INT_MAX)
+                run = INT_MAX;
+            data = (const char *)views[i].buf + off;
+            len = (int)(run - run % SSL3_RT_MAX_PLAIN_LENGTH);
+            direct = 1;
+        } else {
+            while (staged < SSL3_RT_MAX_PLAIN_LENGTH && i < n) {
+                Py_ssize_t chunk = views[i].len - off;
+
+                if (chunk > SSL3_RT_MAX_PLAIN_LENGTH - staged)
+                    chunk = SSL3_RT_MAX_PLAIN_LENGTH - staged;
+                memcpy(stage + staged, (const char *)views[i].buf + off, chunk);
+                staged += (int)chunk;
+                off += chunk;
+                if (off == views[i].len) {
+                    i++;
+                    off = 0;
+                }
+            }
+            if (staged == 0)
+                break;
+            data = stage;
+            len = staged;
+            direct = 0;
+        }
+
+ again:
+        Py_BEGIN_ALLOW_THREADS
+        r = SSL_write(ssl, data, len);
+        ssl_err = SSL_get_error(ssl, r);
+        Py_END_ALLOW_THREADS
+
+        if (r > 0) {
+            written += r;
+            if (direct)
+                off += r;
+            else {
+                staged -= r;
+                memmove(stage, stage + r, staged);
+            }
+            continue;
+        }
+        switch (ssl_err) {
+            case SSL_ERROR_WANT_WRITE:
+            case SSL_ERROR_WANT_READ:
+            case SSL_ERROR_WANT_X509_LOOKUP:
+                if (timeout > 0) {
+                    if (ssl_sleep_with_timeout(ssl, &tv, timeout, ssl_err) == 0)
+                        goto again;
+                    goto out;
+                }
+                blocked = 1;
+                break;
+            case SSL_ERROR_SSL:
+            case SSL_ERROR_SYSCALL:
+                ssl_handle_error(ssl_err, r);
+                goto out;
+        }
+        break;
+    }
+    obj = PyLong_FromSsize_t(blocked && written == 0 ? -1 : written);
+
+ out:
+    if (!(mode & SSL_MODE_ACCEPT_MOVING_WRITE_BUFFER))
+        SSL_clear_mode(ssl, SSL_MODE_ACCEPT_MOVING_WRITE_BUFFER);
+    PyMem_Free(stage);
+    while (nviews > 0) {
+        nviews--;
+        m2_PyBuffer_Release(PySequence_Fast_GET_ITEM(seq, nviews),
+                            &views[nviews]);
+    }
+    PyMem_Free(views);
+    Py_DECREF(seq);
+    return obj;
+}
+
+/* Send count bytes (up to the end of the file if count < 0) of the
+ * file fd starting at offset. The file is read and written in C with
+ * the GIL released; with kernel TLS offload the kernel does the work
+ * through SSL_sendfile(). Returns the number of bytes sent, which may
+ * be short if the write would block and timeout <= 0, or -1 if nothing
+ * could be sent. */
+PyObject *ssl_sendfile(SSL *ssl, int fd, long long offset, long long count,
+                       double timeout) {
+    char *buf = NULL;
+    long long sent = 0, want, w;
+    Py_ssize_t n;
+    int ktls = 0, blocked = 0, ssl_err;
+    long mode = SSL_get_mode(ssl);
+    PyObject *obj = NULL;
+    struct timeval tv;
+
+    if (offset < 0) {
+        PyErr_SetString(PyExc_ValueError, "negative offset");
+        return NULL;
+    }
+#if OPENSSL_VERSION_NUMBER >= 0x30000000L && !defined(OPENSSL_NO_KTLS)
+    ktls = BIO_get_ktls_send(SSL_get_wbio(ssl));
+    if (ktls && count < 0) {
+        struct stat st;
+
+        if (fstat(fd, &st) == -1) {
+            PyErr_SetFromErrno(PyExc_IOError);
+            return NULL;
+        }
+        count = st.st_size > offset ? st.st_size - offset : 0;
+    }
+#endif
+    if (!ktls && !(buf = PyMem_Malloc(M2_SENDFILE_CHUNK))) {
+        PyErr_SetString(PyExc_MemoryError, "ssl_sendfile");
+        return NULL;
+    }
+
+    /* A write retried after WANT_WRITE re-reads the same data; the mode
+     * is only set for this call. */
+    SSL_set_mode(ssl, SSL_MODE_ACCEPT_MOVING_WRITE_BUFFER);
+
+    if (timeout > 0)
+        gettimeofday(&tv, NULL);
+    while (count < 0 || sent < count) {
+        want = count < 0 ? M2_SENDFILE_CHUNK : count - sent;
+        if (!ktls && want > M2_SENDFILE_CHUNK)
+            want = M2_SENDFILE_CHUNK;
+ again:
+        n = 1;
+        w = 0;
+        ssl_err = SSL_ERROR_NONE;
+        Py_BEGIN_ALLOW_THREADS
+#if OPENSSL_VERSION_NUMBER >= 0x30000000L && !defined(OPENSSL_NO_KTLS)
+        if (ktls) {
+            w = SSL_sendfile(ssl, fd, (off_t)(offset + sent), (size_t)want, 0);
+            if (w <= 0)
+                ssl_err = SSL_get_error(ssl, (int)w);
+        } else
+#endif
+        {
+            n = m2_pread(fd, buf, (size_t)want, offset + sent);
+            if (n > 0) {
+                w = SSL_write(ssl, buf, (int)n);
+                if (w <= 0)
+                    ssl_err = SSL_get_error(ssl, (int)w);
+            }
+        }
+        Py_END_ALLOW_THREADS
+
+        if (n < 0) {
+            if (errno == EINTR)
+                goto again;
+            PyErr_SetFromErrno(PyExc_IOError);
+            goto out;
+        }
+        if (n == 0)
+            break;
+        if (w > 0) {
+            sent += w;
+            continue;
+        }
+        switch (ssl_err) {
+            case SSL_ERROR_WANT_WRITE:
+            case SSL_ERROR_WANT_READ:
+            case SSL_ERROR_WANT_X509_LOOKUP:
+                if (timeout > 0) {
+                    if (ssl_sleep_with_timeout(ssl, &tv, timeout, ssl_err) == 0)
+                        goto again;
+                    goto out;
+                }
+                blocked = 1;
+                break;
+            case SSL_ERROR_SSL:
+            case SSL_ERROR_SYSCALL:
+                ssl_handle_error(ssl_err, (int)w);
+                goto out;
+        }
+        break;
+    }
+    obj = PyLong_FromLongLong(blocked && sent == 0 ? -1 : sent);
+
+ out:
+    if (!(mode & SSL_MODE_ACCEPT_MOVING_WRITE_BUFFER))
+        SSL_clear_mode(ssl, SSL_MODE_ACCEPT_MOVING_WRITE_BUFFER);
+    PyMem_Free(buf);
+    return obj;
+}
+
+/* Give ssl a pair of memory BIOs: ciphertext from the peer is fed into
+ * the read BIO with ssl_mem_feed() and ciphertext for the peer is taken
+ * from the write BIO with ssl_mem_drain(). The BIOs are freed with ssl. */
+int ssl_set_mem_bios(SSL *ssl) {
+    BIO *rbio, *wbio = NULL;
+
+    if (!(rbio = BIO_new(BIO_s_mem())) || !(wbio = BIO_new(BIO_s_mem()))) {
+        if (rbio)
+            BIO_free(rbio);
+        m2_PyErr_Msg(_ssl_err);
+        return -1;
+    }
+    /* An empty BIO means "try again later", not end of file. */
+    BIO_set_mem_eof_return(rbio, -1);
+    BIO_set_mem_eof_return(wbio, -1);
+    SSL_set_bio(ssl, rbio, wbio);
+    return 1;
+}
+
+int ssl_mem_feed(SSL *ssl, PyObject *data) {
+    Py_buffer buf;
+    int r = 0;
+
+    if (m2_PyObject_GetBufferInt(data, &buf, PyBUF_CONTIG_RO) == -1)
+        return -1;
+    if (buf.len > 0 &&
+        (r = BIO_write(SSL_get_rbio(ssl), buf.buf, (int)buf.len)) != buf.len) {
+        m2_PyErr_Msg(_ssl_err);
+        r = -1;
+    }
+    m2_PyBuffer_Release(data, &buf);
+    return r;
+}
+
+/* Return up to num (all if num < 0) bytes of ciphertext waiting to be
+ * sent to the peer. */
+PyObject *ssl_mem_drain(SSL *ssl, int num) {
+    PyObject *obj;
+    BIO *wbio = SSL_get_wbio(ssl);
+    int pending = (int)BIO_ctrl_pending(wbio);
+
+    if (num >= 0 && num < pending)
+        pending = num;
+#if PY_MAJOR_VERSION >= 3
+    if (!(obj = PyBytes_FromStringAndSize(NULL, pending)))
+        return NULL;
+    if (pending > 0)
+        BIO_read(wbio, PyBytes_AS_STRING(obj), pending);
+#else
+    if (!(obj = PyString_FromStringAndSize(NULL, pending)))
+        return NULL;
+    if (pending > 0)
+        BIO_read(wbio, PyString_AS_STRING(obj), pending);
+#endif // PY_MAJOR_VERSION >= 3
+    return obj;
+}
+
+int ssl_mem_pending(SSL *ssl) {
+    return (int)BIO_ctrl_pending(SSL_get_wbio(ssl));
+}
+
+/* Advance the handshake. Returns 0 when it is complete, or
+ * ssl_error_want_read/ssl_error_want_write if it needs more data. */
+int ssl_mem_handshake(SSL *ssl) {
+    int r, ssl_err;
+
+    Py_BEGIN_ALLOW_THREADS
+    r = SSL_do_handshake(ssl);
+    ssl_err = SSL_get_error(ssl, r);
+    Py_END_ALLOW_THREADS
+
+    switch (ssl_err) {
+        case SSL_ERROR_NONE:
+            return 0;
+        case SSL_ERROR_WANT_READ:
+        case SSL_ERROR_WANT_WRITE:
+        case SSL_ERROR_WANT_X509_LOOKUP:
+            return ssl_err;
+        default:
+            ssl_handle_error(ssl_err, r);
+            return -1;
+    }
+}
+
+/* Decrypt up to num (all if num < 0) bytes of the plaintext available
+ * from the data fed so far, advancing the handshake first if needed.
+ * Returns None if no plaintext is available yet and b'' once the peer
+ * has sent close_notify. */
+PyObject *ssl_mem_read(SSL *ssl, int num) {
+    PyObject *obj;
+    char *buf;
+    int cap, len = 0, r, ssl_err, eof = 0;
+
+    cap = SSL3_RT_MAX_PLAIN_LENGTH;
+    if (num >= 0 && num < cap)
+        cap = num;
+#if PY_MAJOR_VERSION >= 3
+    if (!(obj = PyBytes_FromStringAndSize(NULL, cap)))
+        return NULL;
+#else
+    if (!(obj = PyString_FromStringAndSize(NULL, cap)))
+        return NULL;
+#endif // PY_MAJOR_VERSION >= 3
+
+    while (num < 0 || len < num) {
+        if (len == cap) {
+            int newcap = cap > INT_MAX / 2 ? INT_MAX : cap * 2;
+
+            if (num >= 0 && newcap > num)
+                newcap = num;
+            if (newcap == cap)
+                break;
+#if PY_MAJOR_VERSION >= 3
+            if (_PyBytes_Resize(&obj, newcap) == -1)
+#else
+            if (_PyString_Resize(&obj, newcap) == -1)
+#endif // PY_MAJOR_VERSION >= 3
+                return NULL;
+            cap = newcap;
+        }
+#if PY_MAJOR_VERSION >= 3
+        buf = PyBytes_AS_STRING(obj);
+#else
+        buf = PyString_AS_STRING(obj);
+#endif // PY_MAJOR_VERSION >= 3
+
+        Py_BEGIN_ALLOW_THREADS
+        r = SSL_read(ssl, buf + len, cap - len);
+        ssl_err = SSL_get_error(ssl, r);
+        Py_END_ALLOW_THREADS
+
+        if (r > 0) {
+            len += r;
+            continue;
+        }
+        switch (ssl_err) {
+            case SSL_ERROR_WANT_READ:
+            case SSL_ERROR_WANT_WRITE:
+            case SSL_ERROR_WANT_X509_LOOKUP:
+                break;
+            case SSL_ERROR_ZERO_RETURN:
+                eof = 1;
+                break;
+            default:
+                Py_DECREF(obj);
+                ssl_handle_error(ssl_err, r);
+                return NULL;
+        }
+        break;
+    }
+
+    if (len == 0 && !eof && num != 0) {
+        Py_DECREF(obj);
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+#if PY_MAJOR_VERSION >= 3
+    if (_PyBytes_Resize(&obj, len) == -1)
+#else
+    if (_PyString_Resize(&obj, len) == -1)
+#endif // PY_MAJOR_VERSION >= 3
+        return NULL;
+    return obj;
+}
+
+/* Feed data, decrypt whatever plaintext it completes and collect the
+ * ciphertext to send back, in one call. Returns a tuple
+ * (plaintext, ciphertext) with plaintext as for ssl_mem_read(). */
+PyObject *ssl_mem_process(SSL *ssl, PyObject *data) {
+    PyObject *plain, *out, *ret;
+
+    if (ssl_mem_feed(ssl, data) == -1)
+        return NULL;
+    if (!(plain = ssl_mem_read(ssl, -1)))
+        return NULL;
+    if (!(out = ssl_mem_drain(ssl, -1))) {
+        Py_DECREF(plain);
+        return NULL;
+    }
+    ret = PyTuple_Pack(2, plain, out);
+    Py_DECREF(plain);
+    Py_DECREF(out);
+    return ret;
+}
+
 int ssl_cipher_get_bits(SSL_CIPHER *c) {
     return SSL_CIPHER_get_bits(c, NULL);
 }
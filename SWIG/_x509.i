@@ -484,8 +484,9 @@ ASN1_TIME *x509_get_not_after(X509 *x) {
     return X509_get_notAfter(x);
 }
 
-int x509_sign(X509 *x, EVP_PKEY *pkey, EVP_MD *md) {
-    return X509_sign(x, pkey, md);
+/* sign_md may be NULL for key types like Ed25519. */
+int x509_sign(X509 *x, EVP_PKEY *pkey, const EVP_MD *sign_md) {
+    return X509_sign(x, pkey, sign_md);
 }
 
 /* x509_gmtime_adj() is a macro. */
@@ -4,6 +4,7 @@ from __future__ import absolute_import, print_function
 def suite():
     from M2Crypto import m2  # noqa
     import os
+    import sys
     import unittest
 
     def my_import(name):
@@ -32,7 +33,9 @@ def suite():
         'tests.test_dsa',
         'tests.test_engine',
         'tests.test_evp',
+        'tests.test_keypool',
         'tests.test_obj',
+        'tests.test_paramcache',
         'tests.test_rand',
         'tests.test_rc4',
         'tests.test_rsa',
@@ -44,6 +47,8 @@ def suite():
         modules_to_test.append('tests.test_ssl')
     elif os.name == 'nt':
         modules_to_test.append('tests.test_ssl_win')
+    if sys.version_info[:2] >= (3, 5):
+        modules_to_test.append('tests.test_ssl_asyncio')
     if m2.OPENSSL_VERSION_NUMBER >= 0x90800F and m2.OPENSSL_NO_EC == 0:
         modules_to_test.append('tests.test_ecdh')
         modules_to_test.append('tests.test_ecdsa')
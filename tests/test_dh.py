@@ -61,6 +61,20 @@ class DHTestCase(unittest.TestCase):
         with self.assertRaises(DH.DHError):
             setattr(a, 'priv', 1)
 
+    def test_components(self):
+        a = DH.load_params('tests/dhparams.pem')
+        p = a.p
+        self.assertIs(a.p, p)
+        self.assertEqual(a.get_int('g'), 2)
+        self.assertEqual(len(a.get_bytes('p')), len(a))
+        with self.assertRaises(DH.DHError):
+            a.pub
+        a.gen_key()
+        pub = a.pub
+        self.assertIs(a.pub, pub)
+        self.assertEqual(a.p, p)
+        self.assertTrue(0 < a.get_int('priv') < a.get_int('p'))
+
 
 def suite():
     return unittest.makeSuite(DHTestCase)
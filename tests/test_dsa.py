@@ -11,6 +11,7 @@ except ImportError:
     import unittest
 
 from M2Crypto import DSA, Rand
+from tests.threads import releases_gil, run_in_threads
 
 class DSATestCase(unittest.TestCase):
 
@@ -99,6 +100,19 @@ class DSATestCase(unittest.TestCase):
         r, s = dsa2.sign(self.data)
         assert dsa2.verify(self.data, r, s)
 
+    def test_components(self):
+        dsa = DSA.load_key(self.privkey)
+        q = dsa.q
+        self.assertIs(dsa.q, q)
+        self.assertEqual(len(dsa.get_bytes('q')), 20)
+        self.assertEqual(pow(dsa.get_int('g'), dsa.get_int('priv'),
+                             dsa.get_int('p')), dsa.get_int('pub'))
+        pub = dsa.pub
+        dsa.gen_key()
+        self.assertNotEqual(dsa.pub, pub)
+        with self.assertRaises(ValueError):
+            dsa.get_bytes('x')
+
     def test_pub_key_from_params(self):
         dsa = DSA.gen_params(1024, self.callback)
         dsa.gen_key()
@@ -112,6 +126,24 @@ class DSATestCase(unittest.TestCase):
         r,s = dsa.sign(self.data)
         assert dsa2.verify(self.data, r, s)
 
+    def test_threaded_sign_verify(self):
+        # Signing and verification run with the GIL released.
+        dsa = DSA.load_key(self.privkey)
+
+        def worker():
+            for _ in range(20):
+                data = bytearray(self.data)
+                blob = dsa.sign_asn1(data)
+                self.assertTrue(dsa.verify_asn1(data, blob))
+                r, s = dsa.sign(data)
+                self.assertTrue(dsa.verify(data, r, s))
+
+        self.assertEqual(run_in_threads(worker), [])
+        blob = dsa.sign_asn1(self.data)
+        self.assertTrue(releases_gil(lambda: dsa.sign_asn1(self.data)))
+        self.assertTrue(releases_gil(
+            lambda: dsa.verify_asn1(self.data, blob)))
+
 def suite():
     return unittest.makeSuite(DSATestCase)
 
@@ -6,12 +6,13 @@ Copyright (c) 2000 Ng Pheng Siong. All rights reserved.
 Portions copyright (c) 2005-2006 Vrije Universiteit Amsterdam. All
 rights reserved.
 """
+import hashlib
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
 
-from M2Crypto import EC, Rand
+from M2Crypto import EC, EVP, Rand, m2
 
 from tests.test_ec_curves import tested_curve
 
@@ -43,6 +44,53 @@ class ECDHTestCase(unittest.TestCase):
         bk = b.compute_dh_key(a_pub)
         self.assertEqual(ak, bk)
 
+    def test_compute_keys(self):
+        a = EC.load_key(self.privkey)
+        peers = []
+        for _ in range(5):
+            peer = EC.gen_params(tested_curve[0])
+            peer.gen_key()
+            peers.append(peer)
+        pubs = [peer.pub() for peer in peers]
+        raw = [a.compute_dh_key(pub) for pub in pubs]
+        self.assertEqual(a.compute_dh_keys(pubs), raw)
+        self.assertEqual(a.compute_dh_keys(iter(pubs), packed=True),
+                         b''.join(raw))
+        self.assertEqual(a.compute_dh_keys([]), [])
+
+        # ANSI X9.63 KDF: Hash(Z || counter || SharedInfo) blocks.
+        def x963(z, length, info=b''):
+            out = b''
+            counter = 1
+            while len(out) < length:
+                out += hashlib.sha256(
+                    z + bytes(bytearray([0, 0, 0, counter])) + info).digest()
+                counter += 1
+            return out[:length]
+        self.assertEqual(a.compute_dh_keys(pubs, kdf='sha256'),
+                         [x963(z, 32) for z in raw])
+        self.assertEqual(
+            a.compute_dh_keys(pubs[:2], kdf='sha256', length=40,
+                              shared_info=b'info'),
+            [x963(z, 40, b'info') for z in raw[:2]])
+        with self.assertRaises(EVP.EVPError):
+            a.compute_dh_keys(pubs, kdf='nosuchhash')
+        with self.assertRaises(TypeError):
+            m2.ecdh_compute_keys(a.ec, [b'junk'], None, 0, b'')
+
+    def test_compute_keys_generator(self):
+        a = EC.load_key(self.privkey)
+
+        def fresh_keys(n):
+            # Nothing but the generator refers to these keys.
+            for _ in range(n):
+                peer = EC.gen_params(tested_curve[0])
+                peer.gen_key()
+                yield peer
+        keys = a.compute_dh_keys(fresh_keys(20))
+        self.assertEqual(len(keys), 20)
+        self.assertEqual(len(set(keys)), 20)
+
 
 def suite():
     return unittest.makeSuite(ECDHTestCase)
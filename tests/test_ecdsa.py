@@ -16,6 +16,7 @@ except ImportError:
 from M2Crypto import EC, Rand
 
 from tests.test_ec_curves import tested_curve
+from tests.threads import releases_gil, run_in_threads
 
 log = logging.getLogger(__name__)
 
@@ -88,6 +89,24 @@ class ECDSATestCase(unittest.TestCase):
         r, s = ec.sign_dsa(self.data)
         assert ec2.verify_dsa(self.data, r, s)
 
+    def test_threaded_sign_verify(self):
+        # Signing and verification run with the GIL released.
+        ec = EC.load_key(self.privkey)
+
+        def worker():
+            for _ in range(20):
+                data = bytearray(self.data)
+                blob = ec.sign_dsa_asn1(data)
+                self.assertTrue(ec.verify_dsa_asn1(data, blob))
+                r, s = ec.sign_dsa(data)
+                self.assertTrue(ec.verify_dsa(data, r, s))
+
+        self.assertEqual(run_in_threads(worker), [])
+        blob = ec.sign_dsa_asn1(self.data)
+        self.assertTrue(releases_gil(lambda: ec.sign_dsa_asn1(self.data)))
+        self.assertTrue(releases_gil(
+            lambda: ec.verify_dsa_asn1(self.data, blob)))
+
 
 def suite():
     return unittest.makeSuite(ECDSATestCase)
@@ -12,6 +12,8 @@ import codecs
 import hashlib
 import io
 import logging
+import tempfile
+import time
 
 from M2Crypto import BIO, EVP, RSA, Rand, m2, six, util
 
@@ -22,6 +24,7 @@ except ImportError:
     import unittest
 
 from tests.fips import fips_mode
+from tests.threads import releases_gil, run_in_threads
 
 log = logging.getLogger('test_EVP')
 
@@ -80,19 +83,165 @@ class EVPTestCase(unittest.TestCase):
         self.assertEqual(util.octx_to_num(md.final()),
                          1415821221623963719413415453263690387336440359920)
 
-        # temporarily remove sha1 from m2
+        # temporarily remove sha1 from m2 and from the digest cache
         old_sha1 = m2.sha1
         del m2.sha1
+        old_md = EVP._digests.pop('sha1')
+        try:
+            # now run the same test again, relying on EVP.MessageDigest() to
+            # call get_digestbyname() under the hood
+            md = EVP.MessageDigest('sha1')
+            self.assertEqual(md.update(b'Hello'), 1)
+            self.assertEqual(util.octx_to_num(md.final()),
+                             1415821221623963719413415453263690387336440359920)
+        finally:
+            # put sha1 back in place
+            m2.sha1 = old_sha1
+            EVP._digests['sha1'] = old_md
+
+    def test_digest_cache(self):
+        self.assertEqual(EVP.MessageDigest('sha256').md,
+                         EVP.MessageDigest('sha256').md)
+        self.assertIn('sha256', EVP._digests)
+
+        # names only known to get_digestbyname() are cached too
+        EVP.MessageDigest('SHA256')
+        self.assertIn('SHA256', EVP._digests)
+
+        # but unknown names are not
+        for _ in range(2):
+            with self.assertRaises(EVP.EVPError):
+                EVP.MessageDigest('sha513')
+        self.assertNotIn('sha513', EVP._digests)
+        with self.assertRaises(ValueError):
+            EVP.Cipher('aes_128_xyz', b'k' * 16, b'i' * 16, 1)
+        self.assertNotIn('aes_128_xyz', EVP._ciphers)
+
+    def test_MessageDigest_large_buffers(self):  # noqa
+        data = bytearray(b'x' * (1 << 20))
+        md = EVP.MessageDigest('sha256')
+        md.update(data)
+        md.update(memoryview(data)[:4096])
+        self.assertEqual(md.final(),
+                         hashlib.sha256(bytes(data) + b'x' * 4096).digest())
+
+    def test_MessageDigest_final_into(self):  # noqa
+        md = EVP.MessageDigest('sha256')
+        md.update(b'Hello')
+        out = bytearray(40)
+        self.assertEqual(md.final_into(out), 32)
+        self.assertEqual(bytes(out[:32]), hashlib.sha256(b'Hello').digest())
+
+        md = EVP.MessageDigest('sha256')
+        with self.assertRaises(ValueError):
+            md.final_into(bytearray(31))
+
+    def test_digest_many(self):
+        data = [b'', b'one', bytearray(b'two'), b'x' * 5000]
+        expected = [hashlib.sha1(bytes(d)).digest() for d in data]
+        self.assertEqual(EVP.digest_many('sha1', data), expected)
+        self.assertEqual(EVP.digest_many('sha1', iter(data)), expected)
+        self.assertEqual(EVP.digest_many('sha1', []), [])
+
+        out = bytearray(20 * len(data))
+        self.assertEqual(EVP.digest_many('sha1', data, out), len(data))
+        self.assertEqual(bytes(out), b''.join(expected))
+        with self.assertRaises(ValueError):
+            EVP.digest_many('sha1', data, bytearray(20 * 3))
 
-        # now run the same test again, relying on EVP.MessageDigest() to call
-        # get_digestbyname() under the hood
+        with self.assertRaises(TypeError):
+            EVP.digest_many('sha1', [b'ok', 42])
+        with self.assertRaises(ValueError):
+            EVP.digest_many('sha513', data)
+
+    def test_MessageDigest_copy(self):  # noqa
+        md = EVP.MessageDigest('sha256')
+        md.update(b'prefix')
+        md2 = md.copy()
+        md.update(b'one')
+        md2.update(b'two')
+        self.assertEqual(md.final(), hashlib.sha256(b'prefixone').digest())
+        self.assertEqual(md2.final(), hashlib.sha256(b'prefixtwo').digest())
+
+    def test_digest_file(self):
+        data = b'file contents' * 100000
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            self.assertEqual(EVP.digest_file(f.name, 'sha256'),
+                             hashlib.sha256(data).digest())
+            self.assertEqual(EVP.digest_file(f.name, 'sha1', chunk_size=4096),
+                             hashlib.sha1(data).digest())
+            with open(f.name, 'rb') as g:
+                g.seek(13)
+                self.assertEqual(EVP.digest_file(g.fileno(), 'sha256'),
+                                 hashlib.sha256(data[13:]).digest())
+            with self.assertRaises(ValueError):
+                EVP.digest_file(f.name, 'sha1', chunk_size=0)
+        with self.assertRaises(OSError):
+            EVP.digest_file(f.name, 'sha1')
+
+    def test_tree_hash(self):
+        def sha1(data):
+            return hashlib.sha1(data).digest()
+
+        def leaf(digest):
+            return sha1(b'\x00' + digest)
+
+        def node(left, right):
+            return sha1(b'\x01' + left + right)
+
+        data = b''.join(six.int2byte(i) * 1000 for i in range(5))
+        digests, root = EVP.tree_hash(data, 'sha1', chunk_size=1000)
+        chunks = [sha1(data[i:i + 1000]) for i in range(0, 5000, 1000)]
+        self.assertEqual(digests, chunks)
+        leaves = [leaf(d) for d in chunks]
+        level1 = [node(leaves[0], leaves[1]), node(leaves[2], leaves[3]),
+                  leaves[4]]
+        level2 = [node(level1[0], level1[1]), level1[2]]
+        self.assertEqual(root, node(level2[0], level2[1]))
+
+        self.assertEqual(EVP.tree_hash(b'abc', 'sha1'),
+                         ([sha1(b'abc')], leaf(sha1(b'abc'))))
+        self.assertEqual(EVP.tree_hash(b'', 'sha1'),
+                         ([sha1(b'')], leaf(sha1(b''))))
+
+        # A single chunk made of two chunk digests is not the parent of
+        # those two chunks.
+        two = EVP.tree_hash(b'a' * 20 + b'b' * 20, 'sha1', chunk_size=20)
+        one = EVP.tree_hash(b''.join(two[0]), 'sha1', chunk_size=40)
+        self.assertNotEqual(one[1], two[1])
+
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(data)
+            f.flush()
+            self.assertEqual(EVP.tree_hash_file(f.name, 'sha1',
+                                                chunk_size=1000, threads=2),
+                             (digests, root))
+            self.assertEqual(EVP.tree_hash_file(f.name, 'sha1',
+                                                chunk_size=3000),
+                             EVP.tree_hash(data, 'sha1', chunk_size=3000))
+        with tempfile.NamedTemporaryFile() as f:
+            self.assertEqual(EVP.tree_hash_file(f.name, 'sha1'),
+                             ([sha1(b'')], leaf(sha1(b''))))
+
+    def test_MessageDigest_threads(self):  # noqa
+        data = b'threaded' * 65536
+        expected = hashlib.sha1(data).digest()
+        results = []
+
+        def worker():
+            md = EVP.MessageDigest('sha1')
+            md.update(data)
+            results.append(md.final())
+
+        self.assertEqual(run_in_threads(worker), [])
+        self.assertEqual(results, [expected] * 4)
+
+        # Only large buffers are hashed with the GIL released.
         md = EVP.MessageDigest('sha1')
-        self.assertEqual(md.update(b'Hello'), 1)
-        self.assertEqual(util.octx_to_num(md.final()),
-                         1415821221623963719413415453263690387336440359920)
-
-        # put sha1 back in place
-        m2.sha1 = old_sha1
+        self.assertTrue(releases_gil(lambda: md.update(data)))
+        self.assertFalse(releases_gil(lambda: md.update(b'small'), 0.2))
 
     def test_as_der_capture_key(self):
         """
@@ -256,6 +405,139 @@ class EVPTestCase(unittest.TestCase):
         pubkey.verify_update(b'test  message not')
         self.assertEqual(pubkey.verify_final(sig), 0)
 
+    def test_sign_verify(self):
+        from M2Crypto import X509
+        pkey = EVP.load_key('tests/signer_key.pem')
+        pkey.sign_init()
+        pkey.sign_update(b'test  message')
+        sig = pkey.sign_final()
+        self.assertEqual(pkey.sign(b'test  message'), sig)
+
+        pubkey = X509.load_cert('tests/signer.pem').get_pubkey()
+        self.assertEqual(pubkey.verify(b'test  message', sig), 1)
+        self.assertEqual(pubkey.verify(bytearray(b'test  message'), sig), 1)
+        self.assertEqual(pubkey.verify(b'test  message not', sig), 0)
+        self.assertEqual(pubkey.verify(b'test  message', sig[:-1]), 0)
+        self.assertEqual(pubkey.verify(b'test  message', sig, md='sha256'),
+                         0)
+
+        sig256 = pkey.sign(b'test  message', md='sha256')
+        self.assertEqual(pubkey.verify(b'test  message', sig256, 'sha256'), 1)
+        pubkey.reset_context('sha256')
+        self.assertEqual(pubkey.verify(b'test  message', sig256), 1)
+        pubkey.verify_init()
+        pubkey.verify_update(b'test  message')
+        self.assertEqual(pubkey.verify_final(sig256), 1)
+
+        wrong = X509.load_cert('tests/x509.pem').get_pubkey()
+        self.assertEqual(wrong.verify(b'test  message', sig), 0)
+
+    def test_verify_many(self):
+        from M2Crypto import X509
+        pkey = EVP.load_key('tests/signer_key.pem')
+        msgs = [str(i).encode() * (i + 1) for i in range(9)]
+        pairs = [(msg, pkey.sign(msg)) for msg in msgs]
+        pairs[3] = (pairs[3][0], pairs[3][1][:-1])
+        pairs[5] = (b'tampered', pairs[5][1])
+        expected = [1, 1, 1, 0, 1, 0, 1, 1, 1]
+
+        pubkey = X509.load_cert('tests/signer.pem').get_pubkey()
+        self.assertEqual(pubkey.verify_many(pairs), expected)
+        self.assertEqual(pubkey.verify_many(iter(pairs), threads=4), expected)
+        self.assertEqual(pubkey.verify_many(pairs, md='sha256'), [0] * 9)
+        self.assertEqual(pubkey.verify_many([]), [])
+        with self.assertRaises(TypeError):
+            pubkey.verify_many([(b'data',)])
+
+    @unittest.skipIf(m2.OPENSSL_VERSION_NUMBER < 0x10101000,
+                     'Ed25519 needs OpenSSL 1.1.1')
+    def test_ed25519(self):
+        # RFC 8032, section 7.1, test 1
+        priv = EVP.load_raw_private_key('ed25519', unhexlify(
+            b'9d61b19deffd5a60ba844af492ec2cc44449c5697b326919703bac031cae7f60'))
+        pub = EVP.load_raw_public_key('ed25519', unhexlify(
+            b'd75a980182b10ab7d54bfed3c964073a0ee172f3daa62325af021a68f707511a'))
+        sig = unhexlify(
+            b'e5564300c360ac729086e2cc806e828a84877f1eb8e5d974d873e06522490155'
+            b'5fb8821590a33bacc61e39701cf9b46bd25bf5f0595bbe24655141438e7a100b')
+        self.assertEqual(priv.get_raw_public_key(), pub.get_raw_public_key())
+        self.assertEqual(priv.sign(b''), sig)
+        self.assertEqual(pub.verify(b'', sig), 1)
+        self.assertEqual(pub.verify(b'x', sig), 0)
+        self.assertEqual(pub.verify_many([(b'', sig), (b'x', sig)]), [1, 0])
+
+        key = EVP.gen_key('ed25519')
+        self.assertEqual(len(key.get_raw_private_key()), 32)
+        sig = key.sign(b'message')
+        self.assertEqual(len(sig), 64)
+        pem = key.as_pem(cipher=None)
+        self.assertEqual(EVP.load_key_string(pem).sign(b'message'), sig)
+        with self.assertRaises(EVP.EVPError):
+            EVP.gen_key('nosuchkey')
+
+    @unittest.skipIf(m2.OPENSSL_VERSION_NUMBER < 0x10101000,
+                     'X25519 needs OpenSSL 1.1.1')
+    def test_x25519(self):
+        # RFC 7748, section 6.1
+        alice = EVP.load_raw_private_key('x25519', unhexlify(
+            b'77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a'))
+        bob = EVP.load_raw_public_key('x25519', unhexlify(
+            b'de9edb7d7b7dc1b4d35b61c2ece435373f8343c85b78674dadfc7e146f882b4f'))
+        self.assertEqual(
+            alice.derive(bob),
+            unhexlify(b'4a5d9d5ba4ce2de1728e3bf480350f25'
+                      b'e07e21c947d19e3376f09b3c1e161742'))
+
+        a, b = EVP.gen_key('x25519'), EVP.gen_key('x25519')
+        b_pub = EVP.load_raw_public_key('x25519', b.get_raw_public_key())
+        self.assertEqual(a.derive(b_pub), b.derive(a))
+        with self.assertRaises(EVP.EVPError):
+            a.derive(EVP.gen_key('ed25519'))
+
+    @unittest.skipIf(m2.OPENSSL_VERSION_NUMBER < 0x10101000,
+                     'Ed25519 needs OpenSSL 1.1.1')
+    def test_ed25519_certificate(self):
+        from M2Crypto import ASN1, SSL, X509
+        key = EVP.gen_key('ed25519')
+        cert = X509.X509()
+        cert.set_serial_number(1)
+        cert.set_version(2)
+        name = X509.X509_Name()
+        name.CN = 'localhost'
+        cert.set_subject(name)
+        cert.set_issuer(name)
+        cert.set_pubkey(key)
+        now = int(time.time())
+        not_before = ASN1.ASN1_UTCTIME()
+        not_before.set_time(now)
+        not_after = ASN1.ASN1_UTCTIME()
+        not_after.set_time(now + 60 * 60 * 24 * 365)
+        cert.set_not_before(not_before)
+        cert.set_not_after(not_after)
+        self.assertEqual(cert.sign(key, None), 64)
+        self.assertEqual(cert.verify(key), 1)
+
+        with tempfile.NamedTemporaryFile(suffix='.pem') as f:
+            f.write(cert.as_pem() + key.as_pem(cipher=None))
+            f.flush()
+            server_ctx = SSL.Context()
+            server_ctx.load_cert(f.name)
+            client_ctx = SSL.Context()
+            client_ctx.set_verify(
+                SSL.verify_peer | SSL.verify_fail_if_no_peer_cert, 9)
+            client_ctx.load_verify_locations(f.name)
+
+        server = SSL.MemoryConnection(server_ctx, server_side=True)
+        client = SSL.MemoryConnection(client_ctx, server_hostname='localhost')
+        while client.pending() or server.pending():
+            server.feed(client.data_to_send())
+            server.do_handshake()
+            client.feed(server.data_to_send())
+            client.do_handshake()
+        self.assertTrue(client.is_handshake_done())
+        self.assertTrue(client.verify_ok())
+        self.assertEqual(client.get_peer_cert().get_subject().CN, 'localhost')
+
     def test_load_bad(self):
         with self.assertRaises(BIO.BIOError):
             EVP.load_key('thisdoesnotexist-dfgh56789')
@@ -495,6 +777,204 @@ class CipherTestCase(unittest.TestCase):
             # a different type - XXX
             self.assertEqual(plaintext, plaintext_value)
 
+    def test_large_buffer(self):
+        key = b'k' * 16
+        iv = b'i' * 16
+        data = bytearray(b'p' * 100000)
+        cipher = EVP.Cipher(alg='aes_128_cbc', key=key, iv=iv, op=1)
+        ciphertext = cipher.update(data) + cipher.final()
+
+        cipher = EVP.Cipher(alg='aes_128_cbc', key=key, iv=iv, op=1)
+        chunks = [cipher.update(bytes(data[i:i + 1000]))
+                  for i in range(0, len(data), 1000)]
+        self.assertEqual(b''.join(chunks) + cipher.final(), ciphertext)
+
+        cipher = EVP.Cipher(alg='aes_128_cbc', key=key, iv=iv, op=0)
+        plaintext = cipher.update(memoryview(ciphertext)) + cipher.final()
+        self.assertEqual(plaintext, bytes(data))
+
+        cipher = EVP.Cipher(alg='aes_128_cbc', key=key, iv=iv, op=1)
+        self.assertTrue(releases_gil(lambda: cipher.update(data)))
+        self.assertFalse(releases_gil(lambda: cipher.update(b'p' * 16), 0.2))
+
+    def test_update_into(self):
+        key = b'k' * 16
+        iv = b'i' * 16
+        data = b'p' * 10000
+        cipher = EVP.Cipher(alg='aes_128_cbc', key=key, iv=iv, op=1)
+        ciphertext = cipher.update(data) + cipher.final()
+
+        cipher = EVP.Cipher(alg='aes_128_cbc', key=key, iv=iv, op=1)
+        out = bytearray(1000 + 16)
+        chunks = []
+        for i in range(0, len(data), 1000):
+            n = cipher.update_into(data[i:i + 1000], out)
+            chunks.append(bytes(out[:n]))
+        n = cipher.final_into(memoryview(out)[:16])
+        chunks.append(bytes(out[:n]))
+        self.assertEqual(b''.join(chunks), ciphertext)
+
+        # Decryption holds back the last block, and writes it out ahead
+        # of the next input.
+        cipher = EVP.Cipher(alg='aes_128_cbc', key=key, iv=iv, op=0)
+        buf = bytearray(1000 + 16 + 1)
+        out = memoryview(buf)[:1000 + 16]
+        chunks = []
+        for i in range(0, len(ciphertext), 1000):
+            n = cipher.update_into(ciphertext[i:i + 1000], out)
+            self.assertEqual(buf[-1], 0)
+            chunks.append(bytes(out[:n]))
+        n = cipher.final_into(out[:16])
+        chunks.append(bytes(out[:n]))
+        self.assertEqual(b''.join(chunks), data)
+        with self.assertRaises(ValueError):
+            cipher.update_into(ciphertext[:1000], out[:1000 + 15])
+
+        cipher = EVP.Cipher(alg='aes_128_cbc', key=key, iv=iv, op=1)
+        with self.assertRaises(ValueError):
+            cipher.update_into(data, bytearray(len(data) + 15))
+        with self.assertRaises(BufferError):
+            cipher.update_into(data, bytes(len(data) + 16))
+
+    def test_reinit(self):
+        key = b'k' * 16
+        key2 = b'K' * 16
+        data = b'p' * 40
+
+        def encrypt(key, iv, padding=1):
+            cipher = EVP.Cipher('aes_128_cbc', key, iv, 1, padding=padding)
+            return cipher.update(data) + cipher.final()
+
+        cipher = EVP.Cipher('aes_128_cbc', key, b'1' * 16, 1)
+        # leave a partial block behind, reinit must discard it
+        cipher.update(b'garbage')
+        for iv in [b'2' * 16, b'3' * 16]:
+            cipher.reinit(iv=iv)
+            self.assertEqual(cipher.update(data) + cipher.final(),
+                             encrypt(key, iv))
+        cipher.reinit(iv=b'4' * 16, key=key2)
+        self.assertEqual(cipher.update(data) + cipher.final(),
+                         encrypt(key2, b'4' * 16))
+
+        cipher = EVP.Cipher('aes_128_cbc', key, b'1' * 16, 1, padding=0)
+        cipher.reinit(iv=b'2' * 16)
+        self.assertEqual(cipher.update(data[:32]) + cipher.final(),
+                         encrypt(key, b'2' * 16)[:32])
+
+        with self.assertRaises(ValueError):
+            cipher.reinit(iv=b'short')
+        with self.assertRaises(ValueError):
+            cipher.reinit(iv=b'2' * 16, key=b'short')
+
+        cipher = EVP.Cipher('aes_128_cbc', key, b'1' * 16, 0)
+        cipher.reinit(iv=b'2' * 16)
+        self.assertEqual(cipher.update(encrypt(key, b'2' * 16)) +
+                         cipher.final(), data)
+
+    gcm_key = unhexlify('feffe9928665731c6d6a8f9467308308')
+    gcm_iv = unhexlify('cafebabefacedbaddecaf888')
+    gcm_aad = unhexlify('feedfacedeadbeeffeedfacedeadbeefabaddad2')
+    gcm_pt = unhexlify('d9313225f88406e5a55909c5aff5269a'
+                       '86a7a9531534f7da2e4c303d8a318a72'
+                       '1c3c0c95956809532fcf0e2449a6b525'
+                       'b16aedf5aa0de657ba637b39')
+    gcm_ct = unhexlify('42831ec2217774244b7221b784d0d49c'
+                       'e3aa212f2c02a4e035c17e2329aca12e'
+                       '21d514b25466931c7d8f6a5aac84aa05'
+                       '1ba30b396a0aac973d58e091')
+    gcm_tag = unhexlify('5bc94fbc3221a5db94fae95ae7121a47')
+
+    def test_gcm(self):
+        cipher = EVP.Cipher('aes_128_gcm', self.gcm_key, self.gcm_iv, 1)
+        cipher.update_aad(self.gcm_aad)
+        ct = cipher.update(self.gcm_pt) + cipher.final()
+        self.assertEqual(ct, self.gcm_ct)
+        self.assertEqual(cipher.get_tag(), self.gcm_tag)
+
+        cipher = EVP.Cipher('aes_128_gcm', self.gcm_key, self.gcm_iv, 0)
+        cipher.update_aad(self.gcm_aad)
+        pt = cipher.update(self.gcm_ct)
+        cipher.set_tag(self.gcm_tag)
+        self.assertEqual(pt + cipher.final(), self.gcm_pt)
+
+        cipher = EVP.Cipher('aes_128_gcm', self.gcm_key, self.gcm_iv, 0)
+        cipher.update(self.gcm_ct)
+        cipher.set_tag(self.gcm_tag)
+        with self.assertRaises(EVP.EVPError):
+            cipher.final()
+
+    def test_gcm_long_nonce(self):
+        nonce = b'n' * 60
+        cipher = EVP.Cipher('aes_128_gcm', self.gcm_key, nonce, 1)
+        ct = cipher.update(self.gcm_pt) + cipher.final()
+        tag = cipher.get_tag()
+        self.assertEqual(
+            EVP.aead_encrypt('aes_128_gcm', self.gcm_key, nonce, b'',
+                             self.gcm_pt), ct + tag)
+
+    def test_gcm_reinit(self):
+        cipher = EVP.Cipher('aes_128_gcm', self.gcm_key, b'n' * 16, 1)
+        cipher.update(b'first message')
+        cipher.final()
+        cipher.reinit(iv=self.gcm_iv)
+        cipher.update_aad(self.gcm_aad)
+        self.assertEqual(cipher.update(self.gcm_pt) + cipher.final(),
+                         self.gcm_ct)
+        self.assertEqual(cipher.get_tag(), self.gcm_tag)
+
+        # encryption must not reuse the nonce
+        with self.assertRaises(ValueError):
+            cipher.reinit()
+        with self.assertRaises(ValueError):
+            cipher.reinit(key=b'K' * 16)
+
+        # decryption may
+        cipher = EVP.Cipher('aes_128_gcm', self.gcm_key, self.gcm_iv, 0)
+        cipher.reinit()
+        cipher.update_aad(self.gcm_aad)
+        self.assertEqual(cipher.update(self.gcm_ct), self.gcm_pt)
+        cipher.set_tag(self.gcm_tag)
+        cipher.final()
+
+    def test_aead_encrypt(self):
+        ct = EVP.aead_encrypt('aes_128_gcm', self.gcm_key, self.gcm_iv,
+                              self.gcm_aad, self.gcm_pt)
+        self.assertEqual(ct, self.gcm_ct + self.gcm_tag)
+        self.assertEqual(
+            EVP.aead_decrypt('aes_128_gcm', self.gcm_key, self.gcm_iv,
+                             self.gcm_aad, bytearray(ct)), self.gcm_pt)
+        self.assertEqual(
+            EVP.aead_encrypt('aes_128_gcm', self.gcm_key, self.gcm_iv,
+                             self.gcm_aad, self.gcm_pt, 12),
+            self.gcm_ct + self.gcm_tag[:12])
+
+        with self.assertRaises(EVP.EVPError):
+            EVP.aead_decrypt('aes_128_gcm', self.gcm_key, self.gcm_iv,
+                             b'other aad', ct)
+        with self.assertRaises(EVP.EVPError):
+            EVP.aead_decrypt('aes_128_gcm', self.gcm_key, self.gcm_iv,
+                             self.gcm_aad, ct[:10])
+        with self.assertRaises(ValueError):
+            EVP.aead_encrypt('aes_128_gcm', b'short', self.gcm_iv,
+                             b'', self.gcm_pt)
+
+    @unittest.skipUnless(hasattr(m2, 'chacha20_poly1305'),
+                         'ChaCha20-Poly1305 not supported')
+    def test_chacha20_poly1305(self):
+        # RFC 7539, section 2.8.2
+        key = bytes(bytearray(range(0x80, 0xa0)))
+        nonce = unhexlify('070000004041424344454647')
+        aad = unhexlify('50515253c0c1c2c3c4c5c6c7')
+        pt = (b"Ladies and Gentlemen of the class of '99: If I could "
+              b"offer you only one tip for the future, sunscreen would "
+              b"be it.")
+        ct = EVP.aead_encrypt('chacha20_poly1305', key, nonce, aad, pt)
+        self.assertEqual(ct[:4], unhexlify('d31a8d34'))
+        self.assertEqual(ct[-16:],
+                         unhexlify('1ae10b594f09e26a7e902ecbd0600691'))
+        self.assertEqual(
+            EVP.aead_decrypt('chacha20_poly1305', key, nonce, aad, ct), pt)
+
     def test_raises(self):
         def _cipherFilter(cipher, inf, outf):  # noqa
             while 1:
@@ -545,6 +1025,32 @@ class PBKDF2TestCase(unittest.TestCase):
         ret = EVP.pbkdf2(password, salt, iter, keylen)
         self.assertEqual(ret, unhexlify(b'6a8970bf68c92caea84a8df285108586'))
 
+    def test_pbkdf2_hmac(self):
+        self.assertEqual(
+            EVP.pbkdf2_hmac('sha1', b'password', b'salt', 2, 20),
+            unhexlify(b'ea6c014dc72d6f8ccd1ed92ace1d41f0d8de8957'))
+        self.assertEqual(
+            EVP.pbkdf2_hmac('sha256', b'password', b'salt', 1, 32),
+            unhexlify(b'120fb6cffcf8b32c43e7225256c4f837'
+                      b'a86548c92ccc35480805987cb70be17b'))
+        self.assertEqual(
+            EVP.pbkdf2_hmac('sha256', bytearray(b'password'),
+                            memoryview(b'salt'), 2, 32),
+            unhexlify(b'ae4d0c95af6b46d32d0adff928f06dd0'
+                      b'2a303f8ef3c251dfd6e2d85a95474c43'))
+        with self.assertRaises(ValueError):
+            EVP.pbkdf2_hmac('sha256', b'password', b'salt', 0, 32)
+        with self.assertRaises(ValueError):
+            EVP.pbkdf2_hmac('sha513', b'password', b'salt', 1, 32)
+
+    def test_pbkdf2_hmac_many(self):
+        credentials = [(b'password', b'salt'), (b'secret', b'pepper'),
+                       (b'', b'salt')]
+        keys = EVP.pbkdf2_hmac_many('sha256', credentials, 100, 16,
+                                    threads=2)
+        self.assertEqual(keys, [EVP.pbkdf2_hmac('sha256', p, s, 100, 16)
+                                for p, s in credentials])
+
 
 class HMACTestCase(unittest.TestCase):
     data1 = [b'', b'More text test vectors to stuff up EBCDIC machines :-)',
@@ -619,6 +1125,32 @@ class HMACTestCase(unittest.TestCase):
                 return 0
         return 1
 
+    def test_copy(self):
+        h = EVP.HMAC(b'key', 'sha256')
+        h.update(b'prefix')
+        h2 = h.copy()
+        h.update(b'one')
+        h2.update(b'two')
+        self.assertEqual(h.final(), EVP.hmac(b'key', b'prefixone', 'sha256'))
+        self.assertEqual(h2.final(), EVP.hmac(b'key', b'prefixtwo', 'sha256'))
+
+    def test_final_into(self):
+        h = EVP.HMAC(b'key', 'sha1')
+        h.update(b'data')
+        out = bytearray(20)
+        self.assertEqual(h.final_into(out), 20)
+        self.assertEqual(bytes(out), EVP.hmac(b'key', b'data'))
+
+    def test_large_buffer(self):
+        data = b'hmac' * 100000
+        h = EVP.HMAC(b'key', 'sha256')
+        h.update(bytearray(data))
+        self.assertEqual(h.final(), EVP.hmac(b'key', data, 'sha256'))
+
+        h = EVP.HMAC(b'key', 'sha256')
+        self.assertTrue(releases_gil(lambda: h.update(data)))
+        self.assertFalse(releases_gil(lambda: h.update(b'hmac'), 0.2))
+
     def test_complicated(self):
         make_chain = self.make_chain_hmac
         verify_chain = self.verify_chain_hmac
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+from __future__ import absolute_import
+
+"""Unit tests for M2Crypto.KeyPool."""
+
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from M2Crypto import KeyPool, RSA, Rand, m2
+
+
+class KeyPoolTestCase(unittest.TestCase):
+
+    def wait_for(self, pool, n):
+        deadline = time.time() + 30
+        while len(pool) < n and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(pool), n)
+
+    def test_gen_key_without_callback(self):
+        rsa = RSA.gen_key(1024, 65537, callback=None)
+        self.assertEqual(len(rsa), 1024)
+        self.assertEqual(rsa.check_key(), 1)
+        with self.assertRaises(TypeError):
+            RSA.gen_key(1024, 65537, callback=1)
+
+    def test_rsa_pool(self):
+        with KeyPool.KeyPool.rsa(1024, spares=3, workers=2) as pool:
+            self.wait_for(pool, 3)
+            keys = [pool.get() for _ in range(5)]
+            for key in keys:
+                self.assertIsInstance(key, RSA.RSA)
+                self.assertEqual(len(key), 1024)
+            self.assertEqual(len(set(key.pub()[1] for key in keys)), 5)
+            self.wait_for(pool, 3)
+        self.assertEqual(len(pool), 0)
+        with self.assertRaises(ValueError):
+            pool.get()
+
+    @unittest.skipIf(m2.OPENSSL_NO_EC, 'EC is not available')
+    def test_ec_pool(self):
+        from M2Crypto import EC
+        with KeyPool.KeyPool.ec(EC.NID_X9_62_prime256v1, spares=2) as pool:
+            self.wait_for(pool, 2)
+            key = pool.get()
+            self.assertEqual(key.check_key(), 1)
+            self.assertEqual(len(key), 256)
+
+    def test_failing_factory(self):
+        def factory():
+            raise ValueError('no key')
+        pool = KeyPool.KeyPool(factory, spares=1)
+        with self.assertRaises(ValueError):
+            pool.get()
+        pool.close()
+
+    def test_factory_fails_once(self):
+        calls = []
+
+        def factory():
+            calls.append(None)
+            if len(calls) == 1:
+                raise ValueError('no key yet')
+            return len(calls)
+        with KeyPool.KeyPool(factory, spares=2) as pool:
+            self.wait_for(pool, 2)
+            self.assertEqual(sorted([pool.get(), pool.get()]), [2, 3])
+            self.wait_for(pool, 2)
+
+    def test_bad_args(self):
+        with self.assertRaises(ValueError):
+            KeyPool.KeyPool(lambda: None, spares=0)
+
+
+def suite():
+    return unittest.makeSuite(KeyPoolTestCase)
+
+
+if __name__ == '__main__':
+    Rand.load_file('randpool.dat', -1)
+    unittest.TextTestRunner().run(suite())
+    Rand.save_file('randpool.dat')
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+from __future__ import absolute_import
+
+"""Unit tests for M2Crypto.ParamCache."""
+
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from M2Crypto import DH, DSA, Err, ParamCache, Rand, SSL
+from tests.threads import run_in_threads
+
+
+class ParamCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = ParamCache.ParamCache(os.path.join(self.dir, 'params'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_load_cached(self):
+        shutil.copy('tests/dhparams.pem', self.cache.path('dh', 1024, 2))
+        shutil.copy('tests/dsa.param.pem', self.cache.path('dsa', 1024))
+        dh = self.cache.dh(1024)
+        self.assertEqual(dh.p, DH.load_params('tests/dhparams.pem').p)
+        dsa = self.cache.dsa(1024)
+        self.assertEqual(dsa.p, DSA.load_params('tests/dsa.param.pem').p)
+
+        # Newer OpenSSL may reject 1024-bit DH at its default security
+        # level; either way the object must behave like the file.
+        ctx = SSL.Context()
+        self.assertEqual(ctx.set_tmp_dh(dh),
+                         ctx.set_tmp_dh('tests/dhparams.pem'))
+        Err.get_error()
+
+    def test_generate(self):
+        path = self.cache.path('dsa', 1024)
+        with open(path, 'w') as f:
+            f.write('junk')
+        dsa = self.cache.dsa(1024)
+        self.assertEqual(len(dsa), 1024)
+        self.assertEqual(self.cache.dsa(1024).p, dsa.p)
+        self.assertEqual(DSA.load_params(path).p, dsa.p)
+        self.assertEqual(os.listdir(os.path.dirname(path)),
+                         ['dsa-1024-0.pem'])
+
+    def test_invalid_dsa_params(self):
+        good = DSA.load_params('tests/dsa.param.pem')
+        if good.check_params() == -1:
+            self.skipTest('OpenSSL cannot check DSA parameters')
+        bad = DSA.set_params(good.p, good.q, b'\0\0\0\x01\x02')
+        self.assertEqual(bad.check_params(), 0)
+        bad.save_params(self.cache.path('dsa', 1024))
+        self.assertIsNone(self.cache._load('dsa', 1024, 0))
+
+    def test_concurrent_get(self):
+        generated = []
+        generate = self.cache._generate
+
+        def counting_generate(*args):
+            generated.append(args)
+            return generate(*args)
+        self.cache._generate = counting_generate
+
+        results = []
+        self.assertEqual(run_in_threads(
+            lambda: results.append(self.cache.dh(512).p)), [])
+        self.assertEqual(len(generated), 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(results), 4)
+
+    def test_prefetch(self):
+        self.assertIsNone(self.cache.dh(512, wait=False))
+        self.cache.prefetch('dh', 512, 2).join()
+        dh = self.cache.dh(512, wait=False)
+        self.assertEqual(dh.check_params(), 0)
+        self.assertEqual(len(dh), 64)
+
+    def test_bad_kind(self):
+        with self.assertRaises(ValueError):
+            self.cache.get('rsa', 1024)
+
+
+def suite():
+    return unittest.makeSuite(ParamCacheTestCase)
+
+
+if __name__ == '__main__':
+    Rand.load_file('randpool.dat', -1)
+    unittest.TextTestRunner().run(suite())
+    Rand.save_file('randpool.dat')
@@ -5,6 +5,7 @@ from __future__ import absolute_import
 
 Copyright (c) 2000 Ng Pheng Siong. All rights reserved."""
 
+import binascii
 import hashlib
 import logging
 import os
@@ -16,6 +17,7 @@ except ImportError:
 from M2Crypto import BIO, RSA, Rand, X509, m2, six
 
 from tests.fips import fips_mode
+from tests.threads import releases_gil, run_in_threads
 
 log = logging.getLogger('test_RSA')
 
@@ -92,6 +94,18 @@ class RSATestCase(unittest.TestCase):
                          b'\000\000\000\003\001\000\001')  # aka 65537 aka 0xf4
         self.assertEqual(rsa.check_key(), 1)
 
+    def test_pub_components(self):
+        rsa = RSA.load_key(self.privkey)
+        self.assertIs(rsa.n, rsa.n)
+        self.assertEqual(rsa.pub(), (rsa.e, rsa.n))
+        self.assertEqual(rsa.get_int('e'), 65537)
+        self.assertEqual(rsa.get_bytes('e'), b'\001\000\001')
+        n = rsa.get_bytes('n')
+        self.assertEqual(len(n), len(rsa) // 8)
+        self.assertEqual(rsa.get_int('n'), int(binascii.hexlify(n), 16))
+        with self.assertRaises(ValueError):
+            rsa.get_int('d')
+
     def test_keygen_bad_cb(self):
         rsa = RSA.gen_key(1024, 65537, self.gen2_callback)
         self.assertEqual(len(rsa), 1024)
@@ -346,6 +360,26 @@ class RSATestCase(unittest.TestCase):
         with self.assertRaises(RSA.RSAError):
             rsa.verify(digest, other_signature)
 
+    def test_threaded_private_ops(self):
+        # The private key operations run with the GIL released; they must
+        # still give the right answer when several threads share a key.
+        priv = RSA.load_key(self.privkey)
+        ctxt = priv.public_encrypt(self.data, RSA.pkcs1_oaep_padding)
+        sig = priv.sign(self.data)
+
+        def worker():
+            for _ in range(10):
+                ptxt = priv.private_decrypt(bytearray(ctxt),
+                                            RSA.pkcs1_oaep_padding)
+                self.assertEqual(ptxt, self.data)
+                self.assertEqual(priv.sign(self.data), sig)
+                self.assertEqual(priv.verify(self.data, sig), 1)
+
+        self.assertEqual(run_in_threads(worker), [])
+        self.assertTrue(releases_gil(lambda: priv.sign(self.data)))
+        self.assertTrue(releases_gil(
+            lambda: priv.private_decrypt(ctxt, RSA.pkcs1_oaep_padding)))
+
 
 def suite():
     return unittest.makeSuite(RSATestCase)
@@ -287,6 +287,90 @@ class MiscSSLClientTestCase(BaseSSLClientTestCase):
             self.stop_server(pid)
         self.assertIn('s_server -quiet -www', data)
 
+    def test_server_simple_recv_into(self):
+        pid = self.start_server(self.args)
+        try:
+            ctx = SSL.Context()
+            s = SSL.Connection(ctx)
+            s.connect(self.srv_addr)
+            s.send(b'GET / HTTP/1.0\n\n')
+            buf = bytearray(4096)
+            with self.assertRaises(ValueError):
+                s.recv_into(buf, 8192)
+            with self.assertRaises(TypeError):
+                s.recv_into(b'read-only')
+            data = b''
+            while 1:
+                try:
+                    n = s.recv_into(memoryview(buf)[16:], 512)
+                    if not n:
+                        break
+                except SSL.SSLError:
+                    break
+                self.assertLessEqual(n, 512)
+                data += bytes(buf[16:16 + n])
+            s.close()
+        finally:
+            self.stop_server(pid)
+        self.assertIn(b's_server -quiet -www', data)
+
+    def test_server_simple_write_many(self):
+        pid = self.start_server(self.args)
+        try:
+            ctx = SSL.Context()
+            s = SSL.Connection(ctx)
+            s.connect(self.srv_addr)
+            request = [b'GET / ', bytearray(b'HTTP/1.0'), b'',
+                       memoryview(b'\n\n')]
+            mode = m2.ssl_get_mode(s.ssl)
+            self.assertEqual(s.write_many(request), 16)
+            # The moving write buffer mode does not outlive the call.
+            self.assertEqual(m2.ssl_get_mode(s.ssl), mode)
+            with self.assertRaises(TypeError):
+                s.write_many([u'text'])
+            data = b''
+            while 1:
+                try:
+                    r = s.recv(4096)
+                    if not r:
+                        break
+                except SSL.SSLError:
+                    break
+                data += r
+            s.close()
+        finally:
+            self.stop_server(pid)
+        self.assertIn(b's_server -quiet -www', data)
+
+    def test_server_simple_sendfile(self):
+        pid = self.start_server(self.args)
+        try:
+            ctx = SSL.Context()
+            s = SSL.Connection(ctx)
+            s.connect(self.srv_addr)
+            with tempfile.TemporaryFile() as f:
+                f.write(b'xxxGET / HTTP/1.0\n\nyyy')
+                f.flush()
+                with self.assertRaises(ValueError):
+                    s.sendfile(f, 3, 0)
+                mode = m2.ssl_get_mode(s.ssl)
+                self.assertEqual(s.sendfile(f, 3, 16), 16)
+                self.assertEqual(m2.ssl_get_mode(s.ssl), mode)
+                self.assertEqual(f.tell(), 19)
+            data = b''
+            while 1:
+                try:
+                    r = s.recv(4096)
+                    if not r:
+                        break
+                except SSL.SSLError:
+                    break
+                data += r
+            s.close()
+        finally:
+            self.stop_server(pid)
+        self.assertIn(b's_server -quiet -www', data)
+
     def test_server_simple_secure_context(self):
         pid = self.start_server(self.args)
         try:
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+from __future__ import absolute_import
+
+"""Unit tests for M2Crypto.SSL.asyncio."""
+
+import asyncio
+import os
+from unittest import mock
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from M2Crypto import SSL, X509
+from M2Crypto.SSL import asyncio as m2asyncio
+from tests.test_ssl import srv_host
+from tests.test_ssl_offline import make_cert_file
+
+
+class AsyncioTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.certfile = make_cert_file()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.unlink(cls.certfile)
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server_ctx = SSL.Context()
+        self.server_ctx.load_cert(self.certfile)
+        self.client_ctx = SSL.Context()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_with_server(self, handler, client):
+        async def main():
+            server = await m2asyncio.start_server(
+                handler, '127.0.0.1', 0, ctx=self.server_ctx,
+                loop=self.loop)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return await asyncio.wait_for(client(port), 30)
+            finally:
+                server.close()
+                await server.wait_closed()
+        return self.loop.run_until_complete(main())
+
+    def connect(self, port, **kwargs):
+        kwargs.setdefault('ctx', self.client_ctx)
+        kwargs.setdefault('server_hostname', srv_host)
+        return m2asyncio.open_connection('127.0.0.1', port, loop=self.loop,
+                                         **kwargs)
+
+    def test_echo_write_eof(self):
+        async def handler(reader, writer):
+            data = await reader.read()
+            writer.write(data.upper())
+            await writer.drain()
+            writer.close()
+
+        async def client(port):
+            reader, writer = await self.connect(port)
+            cert = writer.get_extra_info('peercert')
+            self.assertIsInstance(cert, X509.X509)
+            self.assertEqual(cert.get_subject().CN, srv_host)
+            self.assertIsInstance(writer.get_extra_info('ssl_object'),
+                                  SSL.MemoryConnection)
+            self.assertTrue(writer.can_write_eof())
+            writer.write(b'hello ')
+            writer.writelines([b'async', b'io'])
+            writer.write_eof()
+            data = await reader.read()
+            writer.close()
+            return data
+
+        self.assertEqual(self.run_with_server(handler, client),
+                         b'HELLO ASYNCIO')
+
+    def test_backpressure(self):
+        data = os.urandom(1 << 22)
+
+        async def handler(reader, writer):
+            received = 0
+            while True:
+                chunk = await reader.read(1 << 16)
+                if not chunk:
+                    break
+                received += len(chunk)
+                # Read slowly so that the client has to wait in drain().
+                await asyncio.sleep(0)
+            writer.write(str(received).encode())
+            writer.close()
+
+        async def client(port):
+            reader, writer = await self.connect(port)
+            writer.transport.set_write_buffer_limits(high=1 << 16)
+            for i in range(0, len(data), 1 << 18):
+                writer.write(data[i:i + (1 << 18)])
+                await writer.drain()
+            writer.write_eof()
+            response = await reader.read()
+            writer.close()
+            return response
+
+        self.assertEqual(self.run_with_server(handler, client),
+                         str(len(data)).encode())
+
+    def test_handshake_failure(self):
+        self.client_ctx.set_verify(
+            SSL.verify_peer | SSL.verify_fail_if_no_peer_cert, 9)
+
+        async def handler(reader, writer):
+            writer.close()
+
+        async def client(port):
+            with self.assertRaises(SSL.SSLError):
+                await self.connect(port)
+
+        self.run_with_server(handler, client)
+
+    def test_post_connection_check(self):
+        async def handler(reader, writer):
+            writer.close()
+
+        async def client(port):
+            with self.assertRaises(SSL.Checker.SSLVerificationError):
+                await self.connect(port, server_hostname='example.com')
+
+        self.run_with_server(handler, client)
+
+
+class FakeConnection(object):
+    """Stand-in for SSL.MemoryConnection that holds up the first write,
+    as OpenSSL does while a renegotiation is under way."""
+
+    def __init__(self):
+        self.writes = []
+        self.blocked = True
+        self.shutdowns = 0
+
+    def write(self, data):
+        self.writes.append(data)
+        return -1 if self.blocked else len(data)
+
+    def shutdown(self):
+        self.shutdowns += 1
+        return 0
+
+    def data_to_send(self):
+        return b''
+
+
+class TLSProtocolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = mock.Mock(spec=asyncio.Protocol)
+        self.proto = m2asyncio.TLSProtocol(SSL.Context(), self.app)
+        self.proto.conn = FakeConnection()
+        self.proto.transport = mock.Mock(spec=asyncio.Transport)
+        self.proto._connected = True
+
+    def test_held_up_write(self):
+        proto, conn = self.proto, self.proto.conn
+        first = bytearray(b'first')
+        proto.write(first)
+        first[:] = b'xxxxx'
+        proto.write(b'second')
+        proto.app_transport.write_eof()
+        proto.close()
+        # Nothing may overtake the held up write.
+        self.assertEqual(conn.writes, [b'first'])
+        self.assertEqual(conn.shutdowns, 0)
+        self.assertFalse(proto.transport.close.called)
+
+        conn.blocked = False
+        proto._write_pending()
+        self.assertEqual(conn.writes, [b'first', b'first', b'second'])
+        self.assertIs(conn.writes[0], conn.writes[1])
+        self.assertEqual(conn.shutdowns, 1)
+        self.assertTrue(proto.transport.close.called)
+
+    def test_fatal_error_reaches_app(self):
+        error = SSL.SSLError('bad record mac')
+        self.proto._fatal_error(error)
+        self.proto.connection_lost(None)
+        self.app.connection_lost.assert_called_once_with(error)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(AsyncioTestCase))
+    suite.addTest(unittest.makeSuite(TLSProtocolTestCase))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.TextTestRunner().run(suite())
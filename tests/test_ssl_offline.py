@@ -8,15 +8,50 @@ Copyright (C) 2009-2010 Heikki Toivonen. All Rights Reserved.
 """
 
 import doctest
+import os
+import tempfile
+import time
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
 
-from M2Crypto import Rand, SSL, X509
+from M2Crypto import ASN1, EVP, RSA, Rand, SSL, X509, m2
 from tests.test_ssl import srv_host
 
 
+def make_cert_file():
+    """
+    Write a self-signed certificate for srv_host and its key to a
+    temporary file and return the file name.
+
+    The certificates shipped in tests/ are signed with SHA-1, which
+    recent OpenSSL versions refuse to use.
+    """
+    key = EVP.PKey()
+    key.assign_rsa(RSA.gen_key(2048, 65537, callback=None))
+    cert = X509.X509()
+    cert.set_serial_number(1)
+    cert.set_version(2)
+    name = X509.X509_Name()
+    name.CN = srv_host
+    cert.set_subject(name)
+    cert.set_issuer(name)
+    cert.set_pubkey(key)
+    now = int(time.time())
+    not_before = ASN1.ASN1_UTCTIME()
+    not_before.set_time(now)
+    not_after = ASN1.ASN1_UTCTIME()
+    not_after.set_time(now + 60 * 60 * 24 * 365)
+    cert.set_not_before(not_before)
+    cert.set_not_after(not_after)
+    cert.sign(key, 'sha256')
+    fd, certfile = tempfile.mkstemp(suffix='.pem')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(cert.as_pem() + key.as_pem(cipher=None))
+    return certfile
+
+
 class CheckerTestCase(unittest.TestCase):
     def test_checker(self):
 
@@ -61,10 +96,91 @@ class ContextTestCase(unittest.TestCase):
         self.assertIsInstance(store, X509.X509_Store)
 
 
+class MemoryConnectionTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.certfile = make_cert_file()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.unlink(cls.certfile)
+
+    def setUp(self):
+        self.server_ctx = SSL.Context()
+        self.server_ctx.load_cert(self.certfile)
+        self.client_ctx = SSL.Context()
+
+    def _pump(self, a, b):
+        # Move ciphertext both ways until neither side has more to send.
+        while a.pending() or b.pending():
+            b.feed(a.data_to_send())
+            b.do_handshake()
+            a.feed(b.data_to_send())
+            a.do_handshake()
+
+    def test_handshake_and_data(self):
+        server = SSL.MemoryConnection(self.server_ctx, server_side=True)
+        client = SSL.MemoryConnection(self.client_ctx,
+                                      server_hostname=srv_host)
+        self.assertTrue(client.pending())
+        self.assertEqual(server.do_handshake(), m2.ssl_error_want_read)
+        self.assertIsNone(server.read())
+        self._pump(client, server)
+        self.assertTrue(client.is_handshake_done())
+        self.assertTrue(server.is_handshake_done())
+        self.assertEqual(client.get_peer_cert().get_subject().CN, srv_host)
+        self.assertIsNone(server.get_peer_cert())
+        self.assertEqual(client.get_version(), server.get_version())
+
+        data = os.urandom(100000)
+        self.assertEqual(client.write(data[:10]), 10)
+        self.assertEqual(client.write(data[10:]), len(data) - 10)
+        plain, out = server.process(client.data_to_send())
+        self.assertEqual(plain, data)
+        self.assertEqual(out, b'')
+        self.assertIsNone(server.read())
+
+        server.write(b'response')
+        client.feed(server.data_to_send())
+        self.assertEqual(client.read(3), b'res')
+        self.assertEqual(client.read(), b'ponse')
+
+        self.assertEqual(client.shutdown(), 0)
+        plain, out = server.process(client.data_to_send())
+        self.assertEqual(plain, b'')
+        self.assertTrue(server.get_shutdown() & SSL.SSL_RECEIVED_SHUTDOWN)
+        self.assertEqual(server.shutdown(), 1)
+        client.feed(out + server.data_to_send())
+        self.assertEqual(client.shutdown(), 1)
+
+    def test_handshake_failure(self):
+        self.client_ctx.set_verify(
+            SSL.verify_peer | SSL.verify_fail_if_no_peer_cert, 9)
+        server = SSL.MemoryConnection(self.server_ctx, server_side=True)
+        client = SSL.MemoryConnection(self.client_ctx)
+        with self.assertRaises(SSL.SSLError):
+            self._pump(client, server)
+        self.assertFalse(client.is_handshake_done())
+        # The alert for the server is still waiting to be sent.
+        self.assertTrue(client.data_to_send())
+
+    def test_verified_handshake(self):
+        self.client_ctx.set_verify(
+            SSL.verify_peer | SSL.verify_fail_if_no_peer_cert, 9)
+        self.client_ctx.load_verify_locations(self.certfile)
+        server = SSL.MemoryConnection(self.server_ctx, server_side=True)
+        client = SSL.MemoryConnection(self.client_ctx,
+                                      server_hostname=srv_host)
+        self._pump(client, server)
+        self.assertTrue(client.is_handshake_done())
+        self.assertTrue(client.verify_ok())
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(CheckerTestCase))
     suite.addTest(unittest.makeSuite(ContextTestCase))
+    suite.addTest(unittest.makeSuite(MemoryConnectionTestCase))
     return suite
 
 
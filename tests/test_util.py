@@ -49,6 +49,12 @@ class UtilTestCase(unittest.TestCase):
         with self.assertRaises(TypeError):
             util.py3str(None)
 
+    def test_mpi_to_int(self):
+        self.assertEqual(util.mpi_to_int(b'\0\0\0\0'), 0)
+        self.assertEqual(util.mpi_to_int(b'\0\0\0\x02\0\x80'), 128)
+        self.assertEqual(util.mpi_to_int(b'\0\0\0\x01\x81'), -1)
+        self.assertEqual(util.mpi_to_int(b'\0\0\0\x03\x01\0\x01'), 65537)
+
 
 def suite():
     suite = unittest.TestSuite()
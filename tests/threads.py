@@ -0,0 +1,69 @@
+"""Helpers for tests of operations that run with the GIL released."""
+
+import sys
+import threading
+import time
+
+
+def run_in_threads(func, count=4):
+    """
+    Run func in count threads at once.
+
+    :return: List of the exceptions raised by func, empty if none.
+    """
+    errors = []
+
+    def worker():
+        try:
+            func()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def releases_gil(func, timeout=2.0):
+    """
+    Tell whether another thread gets to run while func() runs.
+
+    A helper thread counts while this thread calls func again and again,
+    for up to timeout seconds. The switch interval is raised meanwhile,
+    so that the interpreter never takes the GIL away from this thread:
+    the count can only move during a call if func itself releases the
+    GIL.
+    """
+    count = [0]
+    stop = []
+
+    def counter():
+        while not stop:
+            count[0] += 1
+            time.sleep(0)
+
+    if hasattr(sys, 'setswitchinterval'):
+        interval = sys.getswitchinterval()
+        set_interval = sys.setswitchinterval
+        set_interval(1000)
+    else:
+        interval = sys.getcheckinterval()
+        set_interval = sys.setcheckinterval
+        set_interval(sys.maxint)
+    t = threading.Thread(target=counter)
+    try:
+        t.start()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            before = count[0]
+            func()
+            if count[0] != before:
+                return True
+        return False
+    finally:
+        stop.append(True)
+        t.join()
+        set_interval(interval)